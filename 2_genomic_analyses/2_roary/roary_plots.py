@@ -79,16 +79,15 @@ if __name__ == "__main__":
     # Max distance to create better plots
     mdist = max([t.distance(t.root, x) for x in t.get_terminals()])
 
-    # Load roary
-    roary = pd.read_csv(options.spreadsheet, low_memory=False)
-    # Set index (group name)
-    roary.set_index('Gene', inplace=True)
-    # Drop the other info columns
-    roary.drop(list(roary.columns[:options.skipped_columns-1]), axis=1, inplace=True)
-
-    # Transform it in a presence/absence matrix (1/0)
-    roary.replace('.{2,100}', 1, regex=True, inplace=True)
-    roary.replace(np.nan, 0, regex=True, inplace=True)
+    # Load roary in chunks, keeping only the strain columns (index = group name)
+    # and transforming them in a presence/absence matrix (1/0) as they are read
+    strains = list(pd.read_csv(options.spreadsheet, nrows=0).columns[options.skipped_columns:])
+    chunks = []
+    for chunk in pd.read_csv(options.spreadsheet, usecols=['Gene'] + strains,
+                             dtype=str, chunksize=5000):
+        chunk.set_index('Gene', inplace=True)
+        chunks.append(chunk[strains].notna().astype(np.int8))
+    roary = pd.concat(chunks)
 
     # Sort the matrix by the sum of strains presence
     idx = roary.sum(axis=1).sort_values(ascending=False).index
@@ -2,18 +2,17 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Extract all core genes (present in all strains)
+Description: Extract all core genes (present in all strains, or in a minimum fraction of strains with --min-presence)
 Input: roary_results/gene_presence_absence.csv, prokka_results/
 Output: /core_genes_fasta/<gene_name>.fasta, missing_genes_log.csv
 Date: 2026-03-20
-Last modified: 2026-08-18
+Last modified: 2026-10-17
 """
 
 import os
+import sys
+import argparse
 import pandas as pd
-from Bio import SeqIO
-
-print("===== Extracting core gene sequences =====")
 
 # Find the directory containing this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,6 +20,13 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.extraction import extract_core_genes
+from cgcd.incremental import discard_manifest, extract_incremental
+from cgcd.memory import peak_rss_mb
+from cgcd.roary import min_isolates, read_core_genes
+
 # Paths
 csv_path = os.path.join(
     PROJECT_DIR,
@@ -29,14 +35,14 @@ csv_path = os.path.join(
     "roary_results",
     "gene_presence_absence.csv"
     )
-    
+
 prokka_base_dir = os.path.join(
     PROJECT_DIR,
     "2_genomic_analyses",
     "1_prokka",
     "prokka_results"
     )
-    
+
 output_dir = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
@@ -48,83 +54,80 @@ output_dir = os.path.join(
 missing_log_path = os.path.join(
     output_dir,
     "missing_genes_log.csv"
-)    
-
-# Make sure output directory exists
-os.makedirs(output_dir, exist_ok=True)
-
-# Load roary matrix
-df = pd.read_csv(csv_path, low_memory=False)
-
-# Get strain names from column headers (strain columns start from column 15)
-strain_columns = df.columns[14:]  
-number_of_strains = len(strain_columns)
-print(f"Number of isolates detected: {number_of_strains}")
-
-# Filter core genes (present in all strains)
-core_genes = df[df["No. isolates"].astype(float) == number_of_strains]
-
-print(f" Found {len(core_genes)} strict core genes (present in all {len(strain_columns)} strains).")
-
-# Initialize missing data logger 
-missing_data = []
-
-# Extract core genes sequences
-for idx, row in core_genes.iterrows():
-    gene_name = row["Gene"] if pd.notna(row["Gene"]) else f"group_{idx+1}"
-    output_fasta = os.path.join(output_dir, f"{gene_name}.fasta")
-    sequences_written = 0
-    
-    # Create FASTA file for this core gene
-    with open(output_fasta, "w") as out_fasta:
-        for strain in strain_columns:
-            gene_ids_str = row[strain]
-            
-            # Check whether Roary contains a gene ID
-            if pd.isna(gene_ids_str):
-                missing_data.append((gene_name, strain, "Missing gene ID in Roary"))
-                continue
-
-            # Split IDs by semicolon or spaces
-            gene_ids = [g.strip() for g in str(gene_ids_str).replace(";", " ").split() if g.strip()]
-            
-            # Path to Prokka .ffn file
-            strain_ffn = os.path.join(prokka_base_dir, strain, f"{strain}.ffn")
-            
-            # Check .ffn file
-            if not os.path.isfile(strain_ffn):
-                missing_data.append((gene_name, strain, "Missing .ffn file"))
-                continue
-
-            # Read Prokka nucleotide sequences
-            records = list(SeqIO.parse(strain_ffn, "fasta"))
-            matched = False
-            
-            # Find the corresponding gene sequence
-            for gene_id in gene_ids:
-                for record in records:
-                    if gene_id in record.id:  # Match ONLY by ID
-                        record.id = strain
-                        record.description = ""
-                        SeqIO.write(record, out_fasta, "fasta")
-                        print(f"{gene_name}  {strain} (selected {record.id})")
-                        sequences_written += 1
-                        matched = True
-                        break
-                if matched:
-                    break
-            
-            # Gene ID was not found in Prokka .ffn
-            if not matched:
-                missing_data.append((gene_name, strain, "Gene ID not found in .ffn"))
-
-    # Remove empty FASTA files
-    if sequences_written == 0:
-        os.remove(output_fasta)
-
-# Save missing gene log 
-missing_df = pd.DataFrame(missing_data, columns=["Gene", "Strain", "Reason"])
-missing_df.to_csv(missing_log_path, index=False)
-
-print(f"\n Extraction complete. FASTA files saved in: {output_dir}")
-print(f"Missing gene log saved to: {missing_log_path}")
+)
+
+
+def main():
+    # Command-line options
+    parser = argparse.ArgumentParser(description="Extract core gene sequences from the Prokka annotations")
+    parser.add_argument("--strain-major", action="store_true",
+                        help="Read each strain .ffn once and write all core-gene FASTA files in a single pass")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes reading the strain .ffn files (implies --strain-major) [Default: 1]")
+    parser.add_argument("--prefix-fallback", action="store_true",
+                        help="Also match .ffn record IDs carrying a prefix (e.g. gnl|CENTRE|<locus_tag>) when no exact ID exists")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only extract genes and strains not covered by the extraction manifest of a previous --incremental run "
+                             "(e.g. newly added genomes); genes that are no longer core are listed in invalidated_genes.txt")
+    parser.add_argument("--min-presence", type=float, default=1.0,
+                        help="Minimum fraction of strains a gene must be present in (e.g. 0.95 for soft-core genes) [Default: 1.0]")
+    args = parser.parse_args()
+
+    print("===== Extracting core gene sequences =====")
+
+    # Make sure output directory exists
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Stream the roary matrix, keeping only the core genes (present in all strains, or in the
+    # --min-presence fraction of them for soft-core genes)
+    # Strain names come from the column headers (strain columns start from column 15)
+    core_genes, strain_columns = read_core_genes(csv_path, min_presence=args.min_presence)
+    number_of_strains = len(strain_columns)
+    print(f"Number of isolates detected: {number_of_strains}")
+
+    if args.min_presence < 1:
+        required = min_isolates(number_of_strains, args.min_presence)
+        print(f" Found {len(core_genes)} soft core genes (present in at least {required} of {number_of_strains} strains).")
+    else:
+        print(f" Found {len(core_genes)} strict core genes (present in all {len(strain_columns)} strains).")
+    print(f" Peak memory after loading the roary matrix: {peak_rss_mb():.0f} MB")
+
+    # Extract core genes sequences (each strain's .ffn is read once)
+    if args.incremental:
+        # Only extract the (gene, strain) pairs not yet recorded in the extraction manifest
+        missing_data, match_counts = extract_incremental(
+            core_genes,
+            strain_columns,
+            prokka_base_dir,
+            output_dir,
+            workers=args.workers,
+            prefix_fallback=args.prefix_fallback
+        )
+    else:
+        missing_data, match_counts = extract_core_genes(
+            core_genes,
+            strain_columns,
+            prokka_base_dir,
+            output_dir,
+            strain_major=args.strain_major,
+            workers=args.workers,
+            prefix_fallback=args.prefix_fallback
+        )
+        discard_manifest(output_dir)
+
+    # Report how the Roary locus tags were resolved in the .ffn files
+    print(f"Locus tags matched exactly: {match_counts['exact']}, "
+          f"by prefix fallback: {match_counts['fallback']}, "
+          f"not found: {match_counts['not found']}")
+
+    # Save missing gene log
+    missing_df = pd.DataFrame(missing_data, columns=["Gene", "Strain", "Reason"])
+    missing_df.to_csv(missing_log_path, index=False)
+
+    print(f"\n Extraction complete. FASTA files saved in: {output_dir}")
+    print(f"Missing gene log saved to: {missing_log_path}")
+    print(f"Peak memory: {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,27 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Run ABGD on each aligned core-gene (one gene at a time)
+Description: Run ABGD on each aligned core-gene (several genes at a time with --jobs; genes already finished with
+the same alignment and parameters are skipped, see abgd_manifest.jsonl). With --engine python, ABGD runs in-process
+(cgcd/abgd.py, a NumPy port of the binary) and only the .res.cvs and partition files are written.
+ABGD is given the JC69 distance matrix of each gene (core_genes_distances/<gene>.phy, computed once and shared
+with 4_1_asap.py) instead of the alignment (genes with ambiguity codes or a near-saturated pair keep their alignment,
+see cgcd/distances.py); --input fasta passes the alignments as before.
+With --minimal, ABGD runs without -a and writes into a scratch folder (tmpfs by default); only the files read by
+3_2_abgd_best_partitions.py (.part.<step>.txt and .partinit.<step>.txt, from which it rebuilds the .res.cvs) are kept,
+in ABGD_results/abgd_results.jsonl.
 Input: core_genes_aligned/
-Output: ABGD_results/<gene_name>/ (ABGD results per gene), failed_genes.txt (log file listing failures)
+Output: ABGD_results/<gene_name>/ (ABGD results per gene), abgd_failed_genes.txt (log file listing failures),
+abgd_jobs.csv (exit status, wall time and peak memory of every gene), abgd_manifest.jsonl (resumable job states)
 Date: 2026-03-20
-Last modified: 2026-08-16
+Last modified: 2026-10-17
 """
 
 import os
+import sys
+import time
+import shutil
+import argparse
 import subprocess
 
 # Find the directory containing this script
@@ -18,6 +31,15 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.abgd import run_genes
+from cgcd.distances import DistanceCache, distance_input
+from cgcd.incremental import file_sha1
+from cgcd.jobs import print_job_summary, run_commands, save_job_records
+from cgcd.manifest import JobManifest, reset_output_dir
+from cgcd.store import ABGD_PATTERNS, ABGD_STORE_NAME, ResultStore, scratch_dir
+
 # Path to the ABGD executable
 abgd_exec = os.path.join(
     PROJECT_DIR,
@@ -34,6 +56,14 @@ input_dir = os.path.join(
     "core_genes_aligned"
 )
 
+# Directory of the per-gene distance matrices shared by ABGD and ASAP
+distance_dir = os.path.join(
+    PROJECT_DIR,
+    "3_species_delimitation_methods",
+    "4_CGCD_approach",
+    "core_genes_distances"
+)
+
 # Directory where the ABGD results will be stored
 output_dir = os.path.join(
     PROJECT_DIR,
@@ -50,73 +80,192 @@ abgd_exec_relative = os.path.relpath(
     SCRIPT_DIR
 ) 
 
-# Ensure output root exists
-os.makedirs(output_dir, exist_ok=True)
-
 failed_genes_file = os.path.join(output_dir, "abgd_failed_genes.txt")
+jobs_file = os.path.join(output_dir, "abgd_jobs.csv")
+manifest_file = os.path.join(output_dir, "abgd_manifest.jsonl")
+
+# ABGD options recorded in the manifest (a gene is rerun when they change)
+abgd_params = "abgd -a"
+minimal_abgd_params = "abgd"  # --minimal: partition files only, the .res.cvs is rebuilt from them
+python_abgd_params = "cgcd.abgd -d jc69"  # in-process engine, JC69 like the binary's default
+matrix_params = " (jc69 matrix)"  # appended when ABGD reads the shared distance matrix
+minimal_params = " (minimal)"  # appended with --minimal
+
+
+def gene_input(fname, use_matrix, cache):
+    """Input file of a gene: its shared JC69 distance matrix, or its alignment (also when it is not shared)."""
+    gene_path = os.path.join(input_dir, fname)
+    if not use_matrix:
+        return gene_path
+    input_path = distance_input(gene_path, distance_dir, "jc69", cache)
+    if input_path == gene_path:
+        print(f"JC69 matrix not shared for {fname} (ambiguity codes, saturated pair or no common site): "
+              "ABGD reads the alignment")
+    return input_path
+
+
+def abgd_command(fname, gene_path, run_dir, all_files=True):
+    """
+    Build the ABGD command of one gene (alignment or distance matrix), and create its output folder in run_dir.
+    Without all_files (-a), ABGD writes the partition files and graphics but no .res.cvs, trees or .spart.
+    """
+    # Extract the gene name     
+    gene_name = os.path.splitext(fname)[0]
+
+    # Create a unique (empty) folder for each gene output
+    gene_output_dir = os.path.join(run_dir, gene_name)
+    reset_output_dir(gene_output_dir)
+
+    # ABGD is an older executable and may have problems withh long absolute paths.
+    # Therefore, I convert the automatically detected paths to relative paths before passing them to ABGD.
+    gene_path_relative = os.path.relpath(
+        gene_path,
+        SCRIPT_DIR
+    ) 
+
+    gene_output_relative = os.path.relpath(
+        gene_output_dir,
+        SCRIPT_DIR
+    ) 
+    # Build the ABGD command
+    cmd = [
+        abgd_exec_relative,
+        "-o", gene_output_relative,     # Output to this gene-specific folder
+        gene_path_relative              # Input gene alignment or distance matrix
+    ]
+    if all_files:
+        cmd.insert(1, "-a")             # Output all files
+    return gene_name, cmd, SCRIPT_DIR
+
 
-print("===== Running ABGD on core genes =====")
-print("Please make sure that the appropriate environment is activated.")
+def main():
+    # Command-line options
+    parser = argparse.ArgumentParser(description="Run ABGD on every aligned core gene")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of ABGD runs at a time [Default: 1]")
+    parser.add_argument("--engine", choices=["binary", "python"], default="binary",
+                        help="Run the ABGD executable, or the in-process NumPy port (no graphics, "
+                             "no per-gene process) [Default: binary]")
+    parser.add_argument("--input", choices=["matrix", "fasta"], default="matrix",
+                        help="Give ABGD the shared distance matrix of each gene, or its alignment [Default: matrix]")
+    parser.add_argument("--distance-cache-mb", type=float, default=4096,
+                        help="Maximum size of the distance matrix cache, least recently used matrices are evicted "
+                             "[Default: 4096]")
+    parser.add_argument("--minimal", action="store_true",
+                        help="Only keep the files read by the next step, in one store file for the run")
+    parser.add_argument("--scratch", default=None,
+                        help="Folder in which ABGD writes with --minimal [Default: /dev/shm when it exists]")
+    args = parser.parse_args()
+    if args.engine == "python":
+        params = python_abgd_params
+    else:
+        params = minimal_abgd_params if args.minimal else abgd_params
+    use_matrix = args.input == "matrix"
+    if use_matrix:
+        params += matrix_params
+    if args.minimal:
+        params += minimal_params
 
-# Make ABGD executable 
-subprocess.run(["chmod", "+x", abgd_exec])
+    # Ensure output roots exist
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(distance_dir, exist_ok=True)
+    cache = None
+    if use_matrix:
+        cache = DistanceCache(os.path.join(distance_dir, "cache"), max_bytes=int(args.distance_cache_mb * 1024 ** 2))
 
-# Open the failed genes log file in write mode
-with open(failed_genes_file, 'w') as failed_genes_log:
-    failed_genes_log.write("Failed genes:\n")  # Write a header to the log file
+    # With --minimal, ABGD writes into a scratch folder and the consumed files are kept in the run store
+    run_dir = scratch_dir(args.scratch, prefix="abgd_") if args.minimal else output_dir
+    store = ResultStore(os.path.join(output_dir, ABGD_STORE_NAME)) if args.minimal else None
 
-    # Loop over each file in the input directory
-    for fname in os.listdir(input_dir):
-        # Skip files that don't end with .fasta (we only want the FASTA files)
+    print("===== Running ABGD on core genes =====")
+    print("Please make sure that the appropriate environment is activated.")
+
+    # Make ABGD executable 
+    subprocess.run(["chmod", "+x", abgd_exec])
+
+    # Job states of earlier (possibly interrupted) runs
+    manifest = JobManifest(manifest_file)
+
+    # One ABGD command per FASTA file (we only want the FASTA files), except genes already finished
+    # with the same alignment and parameters
+    commands = []
+    inputs = {}
+    skipped = 0
+    for fname in sorted(os.listdir(input_dir)):
         if not fname.endswith(".fasta"):
             continue
-
-        # Get the full path of the current gene alignment file
-        gene_path = os.path.join(input_dir, fname)
-        
-        # Extract the gene name     
         gene_name = os.path.splitext(fname)[0]
+        input_hash = file_sha1(os.path.join(input_dir, fname))
+        if manifest.is_done(gene_name, input_hash, params):
+            skipped += 1
+            continue
+        gene_path = gene_input(fname, use_matrix, cache)
+        if args.minimal and os.path.isdir(os.path.join(output_dir, gene_name)):
+            shutil.rmtree(os.path.join(output_dir, gene_name))  # a result folder would shadow the store
+        commands.append(abgd_command(fname, gene_path, run_dir, all_files=not args.minimal))
+        inputs[gene_name] = gene_path
+        manifest.start(gene_name, input_hash, params)
+    print(f"Running ABGD ({args.engine}) on {len(commands)} genes, {args.jobs} at a time ({skipped} genes already done)")
+
+    if args.engine == "python":
+        # Same genes and output folders, partitioned in worker processes instead of ABGD executables
+        results = run_genes(
+            [(gene_name, inputs[gene_name], os.path.join(run_dir, gene_name)) for gene_name, _, _ in commands],
+            distance="jc69",
+            jobs=args.jobs
+        )
+    else:
+        results = run_commands(commands, jobs=args.jobs)
+
+    records = []
+    start = time.time()
+
+    # Open the failed genes log file in write mode
+    with open(failed_genes_file, 'w') as failed_genes_log:
+        failed_genes_log.write("Failed genes:\n")  # Write a header to the log file
+
+        # Results arrive as the ABGD runs finish
+        for gene_name, result, wall_time, peak_mb in results:
+
+            # Check the ABGD output to see if it completed successfully
+            if result.returncode != 0 or "ERROR" in result.stderr:
+                # If ABGD fails (non-zero exit code or ERROR in stderr), log the failure
+                print(f"ABGD failed for {gene_name}. Adding to failed list.")
+                print(result.stderr)
+
+                failed_genes_log.write(f"{gene_name}\n")  # Log the failed gene name
+                status = "failed"
+            else:
+                print(f"ABGD completed successfully for {gene_name} ({wall_time:.1f} s).")
+                status = "ok"
+            records.append((gene_name, status, result.returncode, round(wall_time, 3), round(peak_mb, 1)))
+            if args.minimal:
+                # Keep the consumed files of a finished gene, and the whole folder of a failed one for inspection
+                if status == "ok":
+                    store.collect(gene_name, os.path.join(run_dir, gene_name), ABGD_PATTERNS)
+                else:
+                    shutil.move(os.path.join(run_dir, gene_name), os.path.join(output_dir, gene_name))
+            manifest.finish(gene_name, status == "ok", wall_time, peak_mb, f"returncode={result.returncode}")
+
+    if args.minimal:
+        shutil.rmtree(run_dir)
+        print("Partition files kept in:", store.path)
+
+    # Keep the distance cache within its size limit
+    if cache is not None:
+        removed = cache.evict()
+        if removed:
+            print(f"{removed} least recently used distance matrices evicted from the cache")
+
+    # Save the per-gene exit status and wall time, then summarise the run
+    table = save_job_records(records, jobs_file)
+    print_job_summary(table, time.time() - start)
+
+    # After all genes are processed, print a final message
+    print("All genes processed with ABGD. Failed genes are logged in:", failed_genes_file)
+    print("Exit status, wall time and peak memory of every gene saved to:", jobs_file)
+    print("Job states (used to resume interrupted runs) saved to:", manifest_file)
+
 
-        # Create a unique folder for each gene output
-        gene_output_dir = os.path.join(output_dir, gene_name)
-        os.makedirs(gene_output_dir, exist_ok=True)
-        
-        # ABGD is an older executable and may have problems withh long absolute paths.
-        # Therefore, I convert the automatically detected paths to relative paths before passing them to ABGD.
-        gene_path_relative = os.path.relpath(
-            gene_path,
-            SCRIPT_DIR
-        ) 
-                
-        gene_output_relative = os.path.relpath(
-            gene_output_dir,
-            SCRIPT_DIR
-        ) 
-        # Build the ABGD command
-        cmd = [
-            abgd_exec_relative,
-            "-a",                           # Output all files
-            "-o", gene_output_relative,     # Output to this gene-specific folder
-            gene_path_relative              # Input gene alignment
-        ]
-        
-        # Print a message indicating which gene ABGD is currently processing
-        print(f"Running ABGD on: {gene_name}")
-        
-        # Run the ABGD command and wait for it to complete   
-        print("Command being executed:")
-        print(" ".join(cmd)) 
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=SCRIPT_DIR)
-           
-        # Check the ABGD output to see if it completed successfully
-        if result.returncode != 0 or "ERROR" in result.stderr:
-            # If ABGD fails (non-zero exit code or ERROR in stderr), log the failure
-            print(f"ABGD failed for {gene_name}. Adding to failed list.")
-            print(result.stderr)
-
-            failed_genes_log.write(f"{gene_name}\n")  # Log the failed gene name
-        else:
-            print(f"ABGD completed successfully for {gene_name}.")
-
-# After all genes are processed, print a final message
-print("All genes processed with ABGD. Failed genes are logged in:", failed_genes_file)
+if __name__ == "__main__":
+    main()
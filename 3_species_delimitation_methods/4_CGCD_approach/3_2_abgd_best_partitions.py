@@ -2,14 +2,19 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Extract the best ABGD partition for each gene and convert it into a pairwise partition matrix (1 = same group, 0 = different group).
-Input: ABGD_results/ (one folder per gene containing *.res.cvs and *.part.*.txt files)
-Output: ABGD_partition_matrices/ (<gene>.csv partition matrices)
+Description: Extract the best ABGD partition for each gene and store it as a label vector (one label per strain, strains
+with the same label are in the same group); the pairwise partition matrix of a gene is derived on demand.
+Input: ABGD_results/ (one folder per gene containing *.res.cvs and *.part.*.txt files, or abgd_results.jsonl written
+by 3_1_abgd.py --minimal, without .res.cvs but with the *.partinit.*.txt files)
+Output: ABGD_partitions.npz (label vectors of all genes over one strain index, haplotypes expanded to strains when
+core_genes_aligned/haplotype_map.csv exists)
 Date: 2026-03-20
-Last modified: 2026-08-16
+Last modified: 2026-10-17
 """
 
+import io
 import os
+import sys
 import pandas as pd
 from collections import defaultdict
 
@@ -19,7 +24,15 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
-# Define directories for ABGD results and where the partition matrices will be saved
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.abgd import res_cvs_from_parts
+from cgcd.haplotypes import (HAPLOTYPE_MAP_NAME, expand_groups, gene_members, load_haplotype_map,
+                             single_haplotype_partitions)
+from cgcd.partitions import write_partitions
+from cgcd.store import ABGD_PATTERNS, ABGD_STORE_NAME, gene_results
+
+# Directory of the ABGD results and file where the partitions will be saved
 abgd_dir = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
@@ -27,81 +40,86 @@ abgd_dir = os.path.join(
     "ABGD_results"
 )
 
-output_dir = os.path.join(
+partitions_path = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
-    "ABGD_partition_matrices"
+    "ABGD_partitions.npz"
 )
 
-# Make sure output directory exists
-os.makedirs(output_dir, exist_ok=True)
+# Haplotype -> strain map (only present when the alignments were deduplicated)
+haplotype_map_path = os.path.join(
+    PROJECT_DIR,
+    "3_species_delimitation_methods",
+    "4_CGCD_approach",
+    "core_genes_aligned",
+    HAPLOTYPE_MAP_NAME
+)
 
-print("===== Generating partition matrices =====")
+haplotype_map = load_haplotype_map(haplotype_map_path)
 
-# Loop through each gene folder in the ABGD results directory
-for gene_folder in os.listdir(abgd_dir):
+print("===== Extracting ABGD partitions =====")
 
-    gene_path = os.path.join(abgd_dir, gene_folder)
-    if not os.path.isdir(gene_path):
-        continue
+# {gene: {strain: group}} of the best partition of every gene
+assignments = {}
+
+# Loop through each gene of the ABGD results directory (gene folders, or the run store of --minimal runs)
+for gene_folder, files in gene_results(abgd_dir, ABGD_STORE_NAME, ABGD_PATTERNS):
 
-    # Look for .res.cvs file
-    res_file = [f for f in os.listdir(gene_path) if f.endswith(".res.cvs")]
+    # Look for .res.cvs file (ABGD run without -a by 3_1_abgd.py --minimal: rebuilt from the partition files)
+    res_file = [f for f in files if f.endswith(".res.cvs")]
+    res_text = files[res_file[0]] if res_file else res_cvs_from_parts(files, gene_folder)
     
     # If no .res.cvs file is found, skip the current folder and print a message
-    if not res_file:
+    if res_text is None:
         print(f" No .res.cvs file for {gene_folder}")
         continue
 
     # Read the .res.cvs file 
-    res_df = pd.read_csv(os.path.join(gene_path, res_file[0]), sep="\t")
+    res_df = pd.read_csv(io.StringIO(res_text), sep="\t")
     if "nbSubsetRecursive" not in res_df.columns:
-        print(f" No 'nbSubsetRecursive' column in {res_file[0]}")
+        print(f" No 'nbSubsetRecursive' column in the .res.cvs of {gene_folder}")
         continue
 
     # Most frequent recursive value
     freq_counts = res_df["nbSubsetRecursive"].value_counts()
     top_recursive = freq_counts.index[0]
 
-    # Get last partition index with that value
+    # Get last partition index with that value. The part.# files are numbered by prior (from 1), not by row:
+    # the row of a first prior that already gives a single group is written twice
+    res_df["step"] = pd.factorize(res_df["prior"])[0] + 1
     matches = res_df[res_df["nbSubsetRecursive"] == top_recursive]
-    partition_index = matches.index[-1] + 1  # part.# starts from 1
+    partition_index = matches["step"].iloc[-1]
     
     # Construct the partition file path based on the partition index
-    part_file = os.path.join(gene_path, f"{gene_folder}.part.{partition_index}.txt")
+    part_file = f"{gene_folder}.part.{partition_index}.txt"
     
     # If the partition file is not found, skip to the next gene
-    if not os.path.isfile(part_file):
-        print(f" Partition file not found: {part_file}")
+    if part_file not in files:
+        print(f" Partition file not found: {os.path.join(abgd_dir, gene_folder, part_file)}")
         continue
 
     # Parse group file to get groupings
     groups = defaultdict(list)
-    with open(part_file) as f:
-        for line in f:
-            if "Group[" in line:
-                parts = line.strip().split("id: ")
-                if len(parts) > 1:
-                    strains = parts[1].split()
-                    group_id = line.split("Group[")[1].split("]")[0].strip()
-                    groups[group_id].extend(strains)
-
-    # Get all strains
-    all_strains = sorted({strain for group in groups.values() for strain in group})
-
-    # Build partition matrix
-    matrix = pd.DataFrame(0, index=all_strains, columns=all_strains, dtype=int)
-    for group in groups.values():
-        for i in group:
-            for j in group:
-                matrix.loc[i, j] = 1
-
-    # Save the matrix to a CSV file in the output directory
-    matrix.to_csv(os.path.join(output_dir, f"{gene_folder}.csv"))
-    
-    # Print a message indicating the matrix has been saved for the current gene
-    print(f" Saved matrix for {gene_folder}")
-
-# Print a message indicating the matrix has been saved for the current gene
-print(" All ABGD partition matrices generated.")
+    for line in files[part_file].splitlines():
+        if "Group[" in line:
+            parts = line.strip().split("id: ")
+            if len(parts) > 1:
+                strains = parts[1].split()
+                group_id = line.split("Group[")[1].split("]")[0].strip()
+                groups[group_id].extend(strains)
+
+    # Expand haplotypes back to the strains carrying them
+    groups = expand_groups(groups, gene_members(haplotype_map, gene_folder))
+
+    # Group of every strain, strains in sorted order
+    group_of = {strain: group_id for group_id, group in groups.items() for strain in group}
+    assignments[gene_folder] = {strain: group_of[strain] for strain in sorted(group_of)}
+    print(f" Extracted partition for {gene_folder}")
+
+# Genes whose strains all share one sequence were not delimited: one group
+assignments.update(single_haplotype_partitions(haplotype_map))
+
+# Save the label vectors of all genes in one file
+write_partitions(partitions_path, assignments)
+print(f" ABGD partitions of {len(assignments)} genes saved to:\n{partitions_path}")
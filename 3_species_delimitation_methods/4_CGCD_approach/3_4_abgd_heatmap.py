@@ -2,16 +2,17 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Generate the conspecificity matrix by summing ABGD per-gene partition matrices.
-Input: ABGD_partition_matrices/ 
-Output: ABGD_conspecificity_matrix.csv (pairwise counts of how many genes place two strains in the same group)
+Description: Plot a clustered heatmap (clustermap) of the ABGD conspecificity matrix.
+Input: ABGD_conspecificity_matrix.npy
+Output: ABGD_heatmap.pdf
 Date: 2026-03-20
-Last modified: 2026-08-17
+Last modified: 2026-10-17
 """
 
+import seaborn as sns
+import matplotlib.pyplot as plt
 import os
-import pandas as pd
-import numpy as np
+import sys
 
 # Find the directory containing this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,12 +20,17 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
-# Directory where partition matrices are stored
-partition_dir = os.path.join(
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.conspecificity import read_conspecificity
+
+# Input and output paths
+matrix_path = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
-    "ABGD_partition_matrices"
+    "ABGD_conspecificity_matrix",
+    "ABGD_conspecificity_matrix.npy"
 )
 
 # Directory where the file will be saved
@@ -32,39 +38,45 @@ output_dir = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
-    "ABGD_conspecificity_matrix")
+    "ABGD_plots"
+)
 
 # Create the directory if it doesn't exist
 os.makedirs(output_dir, exist_ok=True)
 
 # File path inside the directory
-output_path = os.path.join(output_dir, "ABGD_conspecificity_matrix.csv")
-
-print("===== Generating conspecificity matrix =====")
+output_path = os.path.join(output_dir, "ABGD_heatmap.pdf")
 
+# Load matrix
+df = read_conspecificity(matrix_path).to_frame()
 
-# Get all partition matrix files
-files = [f for f in os.listdir(partition_dir) if f.endswith(".csv")]
+# Set up figure size
+#plt.figure(figsize=(20, 20))
 
-# Check if partition matrices are available
-if not files:
-    print(" ERROR: No partition matrices found.")
-    exit()
+# Generate heatmap with clustering
+g = sns.clustermap(df, 
+               cmap="coolwarm",  # Better contrast
+               linewidths=0.2,   # Add gridlines
+               linecolor="black",# Grid color
+               cbar_kws={"shrink": 0.5},  # Smaller colorbar
+               xticklabels=True,  # Show x labels
+               yticklabels=True,  # Show y labels
+               figsize=(20, 20),  # Size
+               annot=False,       # Set to True if you want numbers in cells
+               fmt=".0f",         # No decimals for annotations
+               dendrogram_ratio=(0.1, 0.1) # Reduce dendrogram size
+              )
+        
 
-# Use the first file to get all strains
-first_matrix = pd.read_csv(os.path.join(partition_dir, files[0]), index_col=0)
-strains = list(first_matrix.index)
-matrix = pd.DataFrame(0, index=strains, columns=strains, dtype=int)
 
-# Accumulate all matrices
-for f in files:
-    path = os.path.join(partition_dir, f)
-    df = pd.read_csv(path, index_col=0)
-    if list(df.index) != strains:
-        print(f" WARNING: Strain mismatch in {f}. Skipping.")
-        continue
-    matrix += df
+cbar_pos = g.cax.get_position()
+g.cax.set_position([
+    cbar_pos.x0,         
+    cbar_pos.y0 + 0.1,        
+    cbar_pos.width * 0.5,  
+    cbar_pos.height *0.5     
+])
 
-# Save the final matrix
-matrix.to_csv(output_path)
-print(f" Conspecificity matrix saved to:\n{output_path}")
+print("Saving heatmap to:", output_path)
+g.savefig(output_path, format='pdf')
+plt.close()
@@ -1,17 +1,17 @@
 #!/usr/bin/env python3
 """
 Author: Khaoula El Mchachti
-Description: Scan conspecificity thresholds to determine how the number of species groups changes based on the number of shared core genes supporting the grouping. The threshold corresponds to the minimum number of core genes that must assign two strains to the same group. For each threshold, a graph is built where strains are connected if their conspecificity score (number of genes supporting their grouping) is ≥ threshold. The number of connected components represents the number of inferred species groups.
+Description: Scan conspecificity thresholds to determine how the number of species groups changes based on the number of shared core genes supporting the grouping. The threshold corresponds to the minimum number of core genes that must assign two strains to the same group. For each threshold, strains are connected if their conspecificity score (number of genes supporting their grouping) is ≥ threshold. The number of connected components represents the number of inferred species groups.
 Remark: The CGCD approach is fundamentally threshold-free, as species boundaries can be inferred by examining how the number of groups changes across the entire range of thresholds. However, for visualization purposes, it is often useful to focus on the region where a high proportion of genes agree on the grouping (e.g., >50% of core genes). Users may first inspect the full threshold scan and then choose the most appropriate range for plotting and interpretation.
-Input: ABGD_conspecificity_matrix.csv
+Input: ABGD_conspecificity_matrix.npy
 Output: ABGD_threshold_scan/
 Date: 2026-03-20
-Last modified: 2026-08-17
+Last modified: 2026-10-17
 """
 
 import pandas as pd
-import networkx as nx
 import os
+import sys
 
 # Find the directory containing this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,19 +19,24 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.conspecificity import read_conspecificity
+from cgcd.scan import threshold_scan
+
 # Load matrix
 matrix_path = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
     "ABGD_conspecificity_matrix",
-    "ABGD_conspecificity_matrix.csv"
+    "ABGD_conspecificity_matrix.npy"
 )
 
-df = pd.read_csv(matrix_path, index_col=0)
+matrix = read_conspecificity(matrix_path)
 
 # Use all strains automatically
-strains = df.index.tolist()
+strains = matrix.strains
 
 # Output folder
 output_dir = os.path.join(
@@ -44,28 +49,19 @@ output_dir = os.path.join(
 os.makedirs(output_dir, exist_ok=True)
 
 # >= 50% of core genes
-max_value = int(df.values.max())
+max_value = int(matrix.packed.max())
 min_threshold = int(max_value * 0.5)
 
 # 100% of core genes
-#max_value = int(df.values.max())
-#min_threshold = int(df.values.min())
+#max_value = int(matrix.packed.max())
+#min_threshold = int(matrix.packed.min())
 
 summary = []
 
 print("Scanning thresholds from", min_threshold, "to", max_value)
 
-for threshold in range(min_threshold, max_value + 1):
-
-    G = nx.Graph()
-    G.add_nodes_from(strains)
-
-    for i, s1 in enumerate(strains):
-        for j, s2 in enumerate(strains):
-            if i < j and df.loc[s1, s2] >= threshold:
-                G.add_edge(s1, s2)
-
-    num_groups = nx.number_connected_components(G)
+# One pass over the strain pairs sorted by conspecificity, from the highest threshold to the lowest
+for threshold, num_groups, _ in threshold_scan(matrix, range(min_threshold, max_value + 1)):
     summary.append((threshold, num_groups))
 
 # Save summary
@@ -2,15 +2,16 @@
 """
 Author: Khaoula El Mchachti
 Description: Extract strain groups for each threshold within a detected plateau of the conspecificity threshold scan.
-Input: conspecificity_matrix.csv
+Input: ABGD_conspecificity_matrix.npy
 Output: ABGD_groups_plateau/groups_t{threshold}.csv
 Date: 2026-03-20
-Last modified: 2026-08-17
+Last modified: 2026-10-17
 """
 
 import pandas as pd
 import networkx as nx
 import os
+import sys
 
 # Find the directory containing this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,17 +19,21 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.conspecificity import read_conspecificity
+
 #Input: ABGD conspecificity matrix
 matrix_file = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
     "ABGD_conspecificity_matrix",
-    "ABGD_conspecificity_matrix.csv"
+    "ABGD_conspecificity_matrix.npy"
 )
 
 # Load conspecificity matrix
-df = pd.read_csv(matrix_file, index_col=0)
+df = read_conspecificity(matrix_file).to_frame()
 
 # All strains
 strains = df.index.tolist()
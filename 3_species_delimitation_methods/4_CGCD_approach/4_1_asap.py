@@ -2,14 +2,27 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Run ASAP on each aligned core-gene (one gene at a time)
+Description: Run ASAP on each aligned core-gene (one gene at a time; genes already finished with the same alignment
+and parameters are skipped, see asap_manifest.jsonl). ASAP is given the JC69 distance matrix of each gene
+(core_genes_distances/<gene>.phy, computed once and shared with 3_1_abgd.py) and the alignment length, instead of
+the alignment (genes with ambiguity codes or a near-saturated pair keep their alignment, see cgcd/distances.py);
+--input fasta passes the alignments as before. With --minimal, ASAP writes into a scratch folder
+(tmpfs by default) and only the files read by 4_2_asap_best_partitions.py (.res.cvs, .Partition_<rank>.csv, .spart)
+are kept, in ASAP_results/asap_results.jsonl. ASAP keeps -a there: without it, it only writes the .spart, which lacks
+the p-values ranking partitions of equal ASAP score. The timeout of every gene is derived from its predicted runtime
+(number of sequences and alignment length, model refitted on the genes already finished, see cgcd/timeouts.py), and
+a gene that times out is retried once with a longer timeout.
 Input: core_genes_aligned/
-Output: ASAP_results/<gene_name>/ (ASAP results per gene), failed_genes.txt (log file listing failures)
+Output: ASAP_results/<gene_name>/ (ASAP results per gene), failed_genes.txt (log file listing failures),
+asap_manifest.jsonl (resumable job states: input hash, parameters, runtime, peak memory and outcome of every gene)
 Date: 2026-03-20
-Last modified: 2026-08-17
+Last modified: 2026-10-17
 """
 
 import os
+import sys
+import shutil
+import argparse
 import subprocess
 
 # Find the directory containing this script
@@ -18,6 +31,16 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.distances import DistanceCache, distance_input
+from cgcd.incremental import file_sha1
+from cgcd.jobs import run_command
+from cgcd.manifest import JobManifest, reset_output_dir
+from cgcd.scheduler import alignment_shape
+from cgcd.store import ASAP_PATTERNS, ASAP_STORE_NAME, ResultStore, scratch_dir
+from cgcd.timeouts import DEFAULT_MIN_TIMEOUT, RuntimeModel, TimeoutPolicy
+
 # Path to the ABGD executable
 asap_exec = os.path.join(
     PROJECT_DIR,
@@ -34,6 +57,14 @@ input_dir = os.path.join(
     "core_genes_aligned"
 )
 
+# Directory of the per-gene distance matrices shared by ABGD and ASAP
+distance_dir = os.path.join(
+    PROJECT_DIR,
+    "3_species_delimitation_methods",
+    "4_CGCD_approach",
+    "core_genes_distances"
+)
+
 # Directory where the ABGD results will be stored
 output_dir = os.path.join(
     PROJECT_DIR,
@@ -43,56 +74,150 @@ output_dir = os.path.join(
 )
 
 failed_log = os.path.join(output_dir, "asap_failed_genes.txt")
-
-# Ensure output directory exists
-os.makedirs(output_dir, exist_ok=True)
-
-# Initialize failed log
-with open(failed_log, "w") as flog:
-    flog.write("Failed Genes:\n")
-
-# Loop through aligned files
-for fname in os.listdir(input_dir):
-    if not fname.endswith(".fasta"):
-        continue
-
-    gene_name = fname.replace(".fasta", "")
-    in_path = os.path.join(input_dir, fname)
-    out_dir = os.path.join(output_dir, gene_name)
-    spart_file = os.path.join(out_dir, f"{fname}.spart")  # Matches ASAP naming
-
-    # Skip already completed genes
-    if os.path.exists(spart_file):
-        print(f"Skipping {gene_name} (already processed)")
-        continue
-
-    os.makedirs(out_dir, exist_ok=True)
-    print(f"\nRunning ASAP for {gene_name}...")
-
-    try:
-        result = subprocess.run(
-            [asap_exec, "-a", "-o", out_dir, in_path],
-            capture_output=True,
-            text=True,
-            timeout=90,  #  Optional timeout safeguard
-            cwd=out_dir 
-        )
-
-        if result.returncode != 0 or "ASAP     failed" in result.stderr or "invalid pointer" in result.stderr:
-            print(f" ASAP failed for {gene_name}")
+manifest_file = os.path.join(output_dir, "asap_manifest.jsonl")
+
+# ASAP options recorded in the manifest (a gene is rerun when they change)
+asap_params = "asap -a"
+matrix_params = " (jc69 matrix)"  # appended when ASAP reads the shared distance matrix
+minimal_params = " (minimal)"  # appended with --minimal
+
+
+def asap_command(in_path, out_dir, use_matrix, cache):
+    """
+    ASAP command of one gene. With the shared JC69 distance matrix, the alignment length is given with -l, so
+    ASAP evaluates its probabilities with the same sequence length as when it reads the alignment.
+    """
+    if use_matrix:
+        matrix_path = distance_input(in_path, distance_dir, "jc69", cache)
+        if matrix_path != in_path:
+            _, length = alignment_shape(in_path)
+            return [asap_exec, "-a", "-l", str(length), "-o", out_dir, matrix_path]
+        print(f" JC69 matrix not shared for {os.path.basename(in_path)} (ambiguity codes, saturated pair or no common "
+              "site): ASAP reads the alignment")
+    return [asap_exec, "-a", "-o", out_dir, in_path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ASAP on every aligned core gene")
+    parser.add_argument("--input", choices=["matrix", "fasta"], default="matrix",
+                        help="Give ASAP the shared distance matrix of each gene, or its alignment [Default: matrix]")
+    parser.add_argument("--distance-cache-mb", type=float, default=4096,
+                        help="Maximum size of the distance matrix cache, least recently used matrices are evicted "
+                             "[Default: 4096]")
+    parser.add_argument("--minimal", action="store_true",
+                        help="Only keep the files read by the next step, in one store file for the run")
+    parser.add_argument("--scratch", default=None,
+                        help="Folder in which ASAP writes with --minimal [Default: /dev/shm when it exists]")
+    parser.add_argument("--min-timeout", type=float, default=DEFAULT_MIN_TIMEOUT,
+                        help=f"Shortest timeout of a gene, in seconds [Default: {DEFAULT_MIN_TIMEOUT}]")
+    parser.add_argument("--max-timeout", type=float, default=None,
+                        help="Longest first-attempt timeout of a gene, in seconds [Default: no limit]")
+    args = parser.parse_args()
+    use_matrix = args.input == "matrix"
+    params = asap_params + matrix_params if use_matrix else asap_params
+    if args.minimal:
+        params += minimal_params
+
+    # Ensure output directories exist
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(distance_dir, exist_ok=True)
+    cache = None
+    if use_matrix:
+        cache = DistanceCache(os.path.join(distance_dir, "cache"), max_bytes=int(args.distance_cache_mb * 1024 ** 2))
+
+    # With --minimal, ASAP writes into a scratch folder and the consumed files are kept in the run store
+    run_dir = scratch_dir(args.scratch, prefix="asap_") if args.minimal else output_dir
+    store = ResultStore(os.path.join(output_dir, ASAP_STORE_NAME)) if args.minimal else None
+
+    # Job states of earlier (possibly interrupted) runs
+    manifest = JobManifest(manifest_file)
+
+    # Initialize failed log
+    with open(failed_log, "w") as flog:
+        flog.write("Failed Genes:\n")
+
+    # Size of every alignment, and runtime model fitted on the genes finished by earlier runs
+    fnames = [fname for fname in os.listdir(input_dir) if fname.endswith(".fasta")]
+    shapes = {fname.replace(".fasta", ""): alignment_shape(os.path.join(input_dir, fname)) for fname in fnames}
+    policy = TimeoutPolicy(RuntimeModel.from_manifest(manifest, shapes, params),
+                           min_timeout=args.min_timeout, max_timeout=args.max_timeout)
+
+    # Loop through aligned files
+    for fname in fnames:
+        gene_name = fname.replace(".fasta", "")
+        in_path = os.path.join(input_dir, fname)
+        out_dir = os.path.join(run_dir, gene_name)
+
+        # Skip genes that already finished successfully with the same alignment and parameters
+        # (an existing .spart is not enough: it may be the partial output of an interrupted run)
+        input_hash = file_sha1(in_path)
+        if manifest.is_done(gene_name, input_hash, params):
+            print(f"Skipping {gene_name} (already processed)")
+            continue
+
+        # Start from an empty folder and record the gene as running
+        if args.minimal and os.path.isdir(os.path.join(output_dir, gene_name)):
+            shutil.rmtree(os.path.join(output_dir, gene_name))  # a result folder would shadow the store
+        reset_output_dir(out_dir)
+        manifest.start(gene_name, input_hash, params)
+        print(f"\nRunning ASAP for {gene_name}...")
+
+        try:
+            # First attempt with the predicted timeout, one retry with an escalated one
+            n_sequences, length = shapes[gene_name]
+            command = asap_command(in_path, out_dir, use_matrix, cache)
+            result = None
+            for retry in (False, True):
+                timeout = policy.timeout(n_sequences, length, retry)
+                try:
+                    _, result, wall_time, peak_mb = run_command(gene_name, command, cwd=out_dir, timeout=timeout)
+                    break
+                except subprocess.TimeoutExpired:
+                    if not retry:
+                        print(f" Timeout after {timeout:.0f} s on {gene_name}, retrying with "
+                              f"{policy.timeout(n_sequences, length, True):.0f} s")
+                        reset_output_dir(out_dir)
+
+            if result is None:
+                print(f" Timeout: ASAP took too long on {gene_name} ({timeout:.0f} s). Skipping.")
+                with open(failed_log, "a") as flog:
+                    flog.write(f"{gene_name} (timeout)\n")
+                manifest.finish(gene_name, False, timeout, 0, "timeout")
+
+            elif result.returncode != 0 or "ASAP     failed" in result.stderr or "invalid pointer" in result.stderr:
+                print(f" ASAP failed for {gene_name}")
+                with open(failed_log, "a") as flog:
+                    flog.write(f"{gene_name}\n")
+                manifest.finish(gene_name, False, wall_time, peak_mb, f"returncode={result.returncode}")
+            else:
+                print(f" ASAP completed for {gene_name}")
+                if args.minimal:
+                    store.collect(gene_name, out_dir, ASAP_PATTERNS)
+                manifest.finish(gene_name, True, wall_time, peak_mb, f"returncode={result.returncode}")
+                policy.observe(n_sequences, length, wall_time)
+
+        except Exception as e:
+            print(f" Exception for {gene_name}: {e}")
             with open(failed_log, "a") as flog:
-                flog.write(f"{gene_name}\n")
-        else:
-            print(f" ASAP completed for {gene_name}")
+                flog.write(f"{gene_name} (exception)\n")
+            manifest.finish(gene_name, False, 0, 0, f"exception: {e}")
+
+    if args.minimal:
+        # Folders of failed genes are kept for inspection
+        for gene_name in os.listdir(run_dir):
+            shutil.move(os.path.join(run_dir, gene_name), os.path.join(output_dir, gene_name))
+        shutil.rmtree(run_dir)
+        print("Partition files kept in:", store.path)
+
+    # Keep the distance cache within its size limit
+    if cache is not None:
+        removed = cache.evict()
+        if removed:
+            print(f"{removed} least recently used distance matrices evicted from the cache")
 
-    except subprocess.TimeoutExpired:
-        print(f" Timeout: ASAP took too long on {gene_name}. Skipping.")
-        with open(failed_log, "a") as flog:
-            flog.write(f"{gene_name} (timeout)\n")
+    print("All genes processed with ASAP. Failed genes are logged in:", failed_log)
+    print("Job states (used to resume interrupted runs) saved to:", manifest_file)
 
-    except Exception as e:
-        print(f" Exception for {gene_name}: {e}")
-        with open(failed_log, "a") as flog:
-            flog.write(f"{gene_name} (exception)\n")
 
-print("All genes processed with ASAP. Failed genes are logged in:", failed_log)
+if __name__ == "__main__":
+    main()
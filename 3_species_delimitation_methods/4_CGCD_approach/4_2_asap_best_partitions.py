@@ -2,14 +2,18 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Extract the best ASAP partition for each gene and convert it into a pairwise partition matrix (1 = same group, 0 = different group).
-Input: ASAP_results/ (<gene>.csv files), strains.txt
-Output: ASAP_partition_matrices/ (<gene>.csv partition matrices)
+Description: Extract the best ASAP partition for each gene and store it as a label vector (one label per strain, strains
+with the same label are in the same group); the pairwise partition matrix of a gene is derived on demand.
+Input: ASAP_results/ (<gene>.fasta.* or <gene>.phy.* result files, per gene folder or in asap_results.jsonl written
+by 4_1_asap.py --minimal), strains.txt
+Output: ASAP_partitions.npz (label vectors of all genes over the strains of strains.txt, haplotypes expanded to strains
+when core_genes_aligned/haplotype_map.csv exists)
 Date: 2026-03-20
-Last modified: 2026-08-17
+Last modified: 2026-10-17
 """
 
 import os
+import sys
 import csv
 
 # Find the directory containing this script
@@ -18,7 +22,14 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
-# Define directories for ABGD results and where the partition matrices will be saved
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.haplotypes import (HAPLOTYPE_MAP_NAME, expand_assignment, gene_members, load_haplotype_map,
+                             single_haplotype_partitions)
+from cgcd.partitions import write_partitions
+from cgcd.store import ASAP_PATTERNS, ASAP_STORE_NAME, gene_results
+
+# Directory of the ASAP results and file where the partitions will be saved
 asap_dir = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
@@ -26,11 +37,11 @@ asap_dir = os.path.join(
     "ASAP_results"
 )
 
-output_dir = os.path.join(
+partitions_path = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
-    "ASAP_partition_matrices"
+    "ASAP_partitions.npz"
 )
 
 strains_file = os.path.join(
@@ -39,76 +50,66 @@ strains_file = os.path.join(
     "strains.txt"
 )
 
-# Make sure output directory exists
-os.makedirs(output_dir, exist_ok=True)
+# Haplotype -> strain map (only present when the alignments were deduplicated)
+haplotype_map_path = os.path.join(
+    PROJECT_DIR,
+    "3_species_delimitation_methods",
+    "4_CGCD_approach",
+    "core_genes_aligned",
+    HAPLOTYPE_MAP_NAME
+)
 
-print("===== Generating ASAP partition matrices =====")
+print("===== Extracting ASAP partitions =====")
 
 # Load strain names from strains.txt
 with open(os.path.expanduser(strains_file)) as f:
     strains = [s.strip() for s in f.read().split(",") if s.strip()]
 
-# Create a matrix where 1 = same group, 0 = different
-def build_partition_matrix(strains, group_dict):
-    matrix = []
-    for strain1 in strains:
-        row = []
-        for strain2 in strains:
-            same_group = int(group_dict.get(strain1) == group_dict.get(strain2))
-            row.append(same_group)
-        matrix.append(row)
-    return matrix
-
-# Save the matrix to CSV with strain labels
-def save_partition_matrix(strains, matrix, output_path):
-    with open(output_path, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([""] + strains)
-        for strain, row in zip(strains, matrix):
-            writer.writerow([strain] + row)
-
-# Get full list of gene directories
-gene_dirs = [d for d in os.listdir(asap_dir) if os.path.isdir(os.path.join(asap_dir, d))]
-
-# Process each gene
-total = len(gene_dirs)
-for gene in gene_dirs:
-    res_file = os.path.join(asap_dir, gene, f"{gene}.fasta.res.cvs")
-    if not os.path.exists(res_file):
+haplotype_map = load_haplotype_map(haplotype_map_path)
+
+# {gene: {strain: group}} of the best partition of every gene
+assignments = {}
+
+# Process each gene (gene folders, or the run store of --minimal runs)
+for gene, files in gene_results(asap_dir, ASAP_STORE_NAME, ASAP_PATTERNS):
+    # ASAP names its outputs after its input: the alignment, or the shared distance matrix (4_1_asap.py)
+    prefixes = [prefix for prefix in (f"{gene}.fasta", f"{gene}.phy") if f"{prefix}.res.cvs" in files]
+    if not prefixes:
         continue
 
     try:
-        with open(res_file) as f:
-            lines = f.readlines()
+        lines = files[f"{prefixes[0]}.res.cvs"].splitlines()
         if len(lines) < 2:
             continue
 
         best_line = lines[1].strip().split()
         partition_number = best_line[0]
 
-        partition_file = os.path.join(asap_dir, gene, f"{gene}.fasta.Partition_{partition_number}.csv")
-        if not os.path.exists(partition_file):
+        partition_file = f"{prefixes[0]}.Partition_{partition_number}.csv"
+        if partition_file not in files:
             continue
 
         group_dict = {}
-        with open(partition_file) as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) < 2:
-                    continue
-                strain, group = row[0].strip(), row[1].strip()
-                group_dict[strain] = group
-
-        matrix = build_partition_matrix(strains, group_dict)
-        output_path = os.path.join(output_dir, f"{gene}.csv")
-        save_partition_matrix(strains, matrix, output_path)
-        print(f"Matrix saved for {gene}")
+        for row in csv.reader(files[partition_file].splitlines()):
+            if len(row) < 2:
+                continue
+            strain, group = row[0].strip(), row[1].strip()
+            group_dict[strain] = group
 
-    except Exception as e:
-        print(f"Error processing {gene}: {e}")
+        # Expand haplotypes back to the strains carrying them
+        group_dict = expand_assignment(group_dict, gene_members(haplotype_map, gene))
+
+        # Only the strains present in this gene (soft-core genes may lack some strains)
+        assignments[gene] = {s: group_dict[s] for s in strains if s in group_dict}
+        print(f"Partition extracted for {gene}")
 
-print("\n Partition matrices saved in:", output_dir)
     except Exception as e:
         print(f"Error processing {gene}: {e}")
 
-print("\n Partition matrices saved in:", output_dir)
+# Genes whose strains all share one sequence were not delimited: one group
+for gene, group_dict in single_haplotype_partitions(haplotype_map).items():
+    assignments[gene] = {s: group_dict[s] for s in strains if s in group_dict}
+
+# Save the label vectors of all genes in one file, over the strains of strains.txt
+write_partitions(partitions_path, assignments, strains=strains)
+print(f"\n ASAP partitions of {len(assignments)} genes saved in:", partitions_path)
@@ -2,16 +2,18 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Generate the conspecificity matrix by summing ASAP per-gene partition matrices.
-Input: ASAP_partition_matrices/ 
-Output: ASAP_conspecificity_matrix.csv (pairwise counts of how many genes place two strains in the same group)
+Description: Generate the conspecificity matrix by summing the ASAP per-gene partition matrices, derived from the label vectors.
+Input: ASAP_partitions.npz, strains.txt
+Output: ASAP_conspecificity_matrix.npy + .strains.txt (packed store read by the next steps) and ASAP_conspecificity_matrix.csv (pairwise counts of how many genes place two strains in the same group, normalized on the genes shared by the pair),
+ASAP_shared_genes_matrix.csv (number of genes in which both strains are present),
+ASAP_conspecificity_counts.npz (pair counts and the partition counted for every gene, updated incrementally on the next run)
 Date: 2026-03-20
-Last modified: 2026-08-17
+Last modified: 2026-10-17
 """
 
 import os
+import sys
 import csv
-import numpy as np
 
 # Find the directory containing this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,12 +21,18 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.conspecificity import (ConspecificityCounts, export_csv, normalize_by_shared_genes, read_conspecificity,
+                                  write_conspecificity)
+from cgcd.partitions import read_partitions
+
 # Define paths
-partition_dir = os.path.join(
+partitions_path = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
-    "ASAP_partition_matrices"
+    "ASAP_partitions.npz"
 )
 
 strains_file = os.path.join(
@@ -45,32 +53,34 @@ os.makedirs(output_dir, exist_ok=True)
 with open(strains_file, "r") as f:
     strains = [s.strip() for s in f.read().strip().split(",") if s.strip()]
 
-# Initialize an empty matrix to accumulate conspecificity values
-conspecificity_matrix = np.zeros((len(strains), len(strains)))
+# Step 1: Label vectors of the best partition of every successful gene
+genes, partition_strains, labels = read_partitions(partitions_path)
 
-# Step 1: Process each partition matrix from successful genes
-partition_files = [f for f in os.listdir(partition_dir) if f.endswith(".csv")]
+# Pair counts of all genes (genes placing both strains in the same group, genes in which both are present),
+# updated from the previous run with the genes added, rerun or removed since
+counts_path = os.path.join(output_dir, "ASAP_conspecificity_counts.npz")
+counts = ConspecificityCounts.load(counts_path)
+added, replaced, removed = counts.update(genes, partition_strains, labels)
+counts.save(counts_path)
+print(f"Genes added: {len(added)}, updated: {len(replaced)}, removed: {len(removed)}")
 
-for partition_file in partition_files:
-    matrix_path = os.path.join(partition_dir, partition_file)
-    
-    # Read the partition matrix
-    with open(matrix_path, "r") as f:
-        reader = csv.reader(f)
-        matrix = [row[1:] for row in reader][1:]  # Exclude first row and column (strain names)
-    
-    # Convert to numpy array of integers
-    matrix = np.array(matrix, dtype=int)
-    
-    # Add the matrix to the conspecificity matrix
-    conspecificity_matrix += matrix
+# Counts at the positions of the strains of strains.txt
+conspecificity_matrix, shared_genes = counts.matrices(strains)
+
+# Normalize each pair on the number of genes it shares (unchanged for strict core genes)
+conspecificity_matrix = normalize_by_shared_genes(conspecificity_matrix, shared_genes, len(genes))
 
-# Step 2: Save the combined conspecificity matrix to a CSV file
+# Step 2: Save the combined conspecificity matrix (packed store and its CSV export) and the number of genes per pair
+store_path = os.path.join(output_dir, "ASAP_conspecificity_matrix.npy")
 output_path = os.path.join(output_dir, "ASAP_conspecificity_matrix.csv")
-with open(output_path, "w", newline="") as f:
+shared_path = os.path.join(output_dir, "ASAP_shared_genes_matrix.csv")
+write_conspecificity(store_path, conspecificity_matrix, strains)
+export_csv(read_conspecificity(store_path), output_path)
+with open(shared_path, "w", newline="") as f:
     writer = csv.writer(f)
     writer.writerow([""] + strains)  # First row with strain names
-    for strain, row in zip(strains, conspecificity_matrix):
+    for strain, row in zip(strains, shared_genes):
         writer.writerow([strain] + row.tolist())  # First column with strain names
 
-print(f"Conspecificity matrix saved to: {output_path}")
+print(f"Conspecificity matrix saved to: {store_path}, {output_path}")
+print(f"Genes shared by each strain pair saved to: {shared_path}")
@@ -2,16 +2,16 @@
 """
 Author: Khaoula El Mchachti
 Description: Plot a clustered heatmap (clustermap) of the ASAP conspecificity matrix.
-Input: ASAP_conspecificity_matrix.csv
+Input: ASAP_conspecificity_matrix.npy
 Output: ASAP_heatmap.pdf
 Date: 2026-03-20
-Last modified: 2026-08-17
+Last modified: 2026-10-17
 """
 
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import os
+import sys
 
 # Find the directory containing this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,13 +19,17 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Project root directory
 PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../.."))
 
+# Shared CGCD helpers
+sys.path.insert(0, os.path.join(PROJECT_DIR, "3_species_delimitation_methods"))
+from cgcd.conspecificity import read_conspecificity
+
 # Input and output paths
 matrix_path = os.path.join(
     PROJECT_DIR,
     "3_species_delimitation_methods",
     "4_CGCD_approach",
     "ASAP_conspecificity_matrix",
-    "ASAP_conspecificity_matrix.csv"
+    "ASAP_conspecificity_matrix.npy"
 )
 
 # Directory where the file will be saved
@@ -43,7 +47,7 @@ os.makedirs(output_dir, exist_ok=True)
 output_path = os.path.join(output_dir, "ASAP_heatmap.pdf")
 
 # Load matrix
-df = pd.read_csv(matrix_path, index_col=0)
+df = read_conspecificity(matrix_path).to_frame()
 
 # Set up figure size
 #plt.figure(figsize=(20, 20))
@@ -1084,9 +1084,9 @@ if (asap_param.onlyspart==0)
 
 	char *fname2;
 	FILE *svgout2;
-	fname2 = (char *) malloc( (size_t) sizeof(char) * (strlen (dirfiles) + strlen (simple_name) +10) );
-	sprintf(fname, "%s%s.curve.svg", dirfiles, simple_name);// for main graphic results
-	svgout2 = fopen(fname, "w");
+	fname2 = (char *) malloc( (size_t) sizeof(char) * (strlen (dirfiles) + strlen (simple_name) +11) );
+	sprintf(fname2, "%s%s.curve.svg", dirfiles, simple_name);// for main graphic results
+	svgout2 = fopen(fname2, "w");
 
 	fprintf(svgout2, "<svg xmlns=\"http://www.w3.org/2000/svg\"  ");
 	fprintf(svgout2, "width=\"%d\" height=\"%ld\" >\n", widthKlado + MARGECLADO + 20, HAUTEURCOURBE + MARGECLADO + ( mat.n * SIZEOFTEXT));
@@ -1116,9 +1116,9 @@ if (asap_param.onlyspart==0)
 
 	char *fname2;
 	FILE *svgout2;
-	fname2 = (char *) malloc( (size_t) sizeof(char) * (strlen (dirfiles) + strlen (simple_name) +10) );
-	sprintf(fname, "%s%s.clado.svg", dirfiles, simple_name);// for main graphic results
-	svgout2 = fopen(fname, "w");
+	fname2 = (char *) malloc( (size_t) sizeof(char) * (strlen (dirfiles) + strlen (simple_name) +11) );
+	sprintf(fname2, "%s%s.clado.svg", dirfiles, simple_name);// for main graphic results
+	svgout2 = fopen(fname2, "w");
 
 	fprintf(svgout2, "<svg xmlns=\"http://www.w3.org/2000/svg\" onload=\"init(evt)\" ");
 	fprintf(svgout2, "width=\"%d\" height=\"%ld\" >\n", widthKlado + MARGECLADO + 20, HAUTEURCOURBE + MARGECLADO + ( mat.n * SIZEOFTEXT));
@@ -0,0 +1,465 @@
+/*ASAP:Agglomerate specimens by automatic process*/
+/*
+	Copyright (C) 2015-2016 G Achaz/ S Brouillet
+
+	This progam is free software; you can redistribute it and/or
+	modify it under the terms of the GNU Lesser General Public License
+	as published by the Free Software Foundation; either version 2.1
+	of the License, or (at your option) any later version.
+
+	This program is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU Lesser General Public License for more details.
+
+	You should have received a copy of the GNU Lesser General Public License
+	along with this program; if not, write to the Free Software
+	Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+ 	for more information, please contact guillaume achaz <guillaume.achaz@mnhnfr>/<sophie.brouillet@mnhn.fr>
+
+*/
+/******
+        file     : asap_batch
+        function : Agglomerate specimens by automatic process
+                   batch version: many alignments in one process, one compact
+                   tab-separated result per alignment, no graphics
+
+        created  : Oct 2026
+
+*****/
+#define _GNU_SOURCE
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <string.h>
+#include <ctype.h>
+#include <time.h>
+#include <float.h>
+#include "asap.h"
+#include "asap_core.h"
+#include "oldfns.h"
+#include "gdtosvg.h"
+#include <unistd.h>
+
+#include <errno.h>
+
+#include <sys/types.h>
+#include <sys/stat.h>
+
+#define NBCHARMALLOC 256
+
+void usage(char *arg)
+{
+	fprintf(stderr, "/*\n\tAgglomerate Specimens by Automatic Processing -- batch mode\n*/\n");
+	fprintf(stderr, "syntax is '%s [-h] [options] list_file'\n", arg);
+	fprintf(stderr, "\tlist_file has one input per line: a fasta file or a distance matrix in phylip format,\n");
+	fprintf(stderr, "\toptionally followed by a tab and the result file to write (- reads the list from stdin)\n");
+	fprintf(stderr, "\tfor each input, a result file <outdir>/<input name>.asap.tsv is written with the ranked\n");
+	fprintf(stderr, "\tpartitions and the subset of every sequence; no graphic, spart or partition file is written\n");
+
+	fprintf(stderr,"Options are:\n\
+	\t-h    : this help\n\
+	\t-r #  : nbr of replicates for statistical tests (default is 10^3)\n\
+	\t-b #  : nbr of low-pvalues to be reported (0.001 default)\n\
+	\t-d #  : distance (0: Kimura-2P, 1: Jukes-Cantor --default--, 2: Tamura-Nei 3:simple distance)\n\
+	\t-o #  : directory where results files are written (default is where the script is run)\n\
+	\t-l #	: original length of seqs if a distance matrix was provided (default value 600)\n\
+	\t-t #  : transition/transversion (for Kimura) default:2\n\
+	\t-n #  : nbr of best scores to be kept (default 10))\n\
+	\t-x #  : seed value, reset before every input so that each result matches a single asap -x # run\n");
+
+	exit(1);
+}
+
+
+/*my own fgets which reallocs sizeof line if needed; returns NULL at the end of the file*/
+char *my_get_line(char *ligne,FILE *f_in,int *nbcharmax)
+{
+int c;
+int nbc=0;
+
+	while (1)
+		{
+		 c=fgetc(f_in);
+		 if (c==EOF && nbc==0)
+		 	return(NULL);
+		 if (c=='\n' || c=='\r' || c==EOF){
+ 			ligne[nbc]='\0';
+ 			break;
+ 			}
+ 		ligne[nbc++]=c;
+ 		if (nbc== *nbcharmax)
+ 			{
+ 			*nbcharmax= *(nbcharmax)+NBCHARMALLOC;
+ 			ligne=realloc(ligne, sizeof(char)*(*nbcharmax));
+ 			}
+ 		}
+
+return(ligne);
+}
+
+
+/*
+	Run the whole asap pipeline on one input and write its ranked partitions to result_name
+	returns 0 on success, 1 when the input cannot be used
+*/
+int asap_one_file(char *file_data,char *result_name,short int imethode,float ts_tv,int nbBestAsap,Parameter asap_param)
+{
+	DistMat mat;               /* The matrix distance */
+	DistPair *ListDistance;    /* distance for all sequence pairs */
+	Composante comp;           /* The whole graph that describes the species */
+	Results *scores;
+	Tabcompo *strucompo;       /* each elemnt store how many groups and how many sequences in each group */
+	Node *zenodes;             /* Nodes of the hierarchical clusterting tree */
+	Spart *myspar;
+	int i,k,
+	    nbresults = 0,
+	    firstpart,
+	    color_ori=5,
+	    last_node,
+	    widthKlado,
+	    *no_node;       // report for each sequence, its current node
+	float maxDist,
+	      min;
+	double best_score, echx, echy;
+	char *tmp_name;
+	FILE *f_in,
+	     *f_res;
+	int c;
+
+	f_in = fopen(file_data, "r");
+	if (f_in == NULL)
+		{
+		fprintf(stderr,"cannot open %s, skipped\n",file_data);
+		return(1);
+		}
+
+	/*
+		Read or build the distance matrix
+	*/
+	c = fgetc(f_in);
+	rewind(f_in);
+	if ( c == '>')
+		mat = compute_dis(f_in, imethode, ts_tv, &(asap_param.lenSeq),asap_param);
+	else
+		mat = read_distmat(f_in, ts_tv, NULL, NULL);
+	fclose(f_in);
+
+	if (mat.n < 2)
+		{
+		fprintf(stderr,"%s has less than 2 sequences, skipped\n",file_data);
+		free_distmat(mat);
+		return(1);
+		}
+	fprintf(stderr, "  %ld input sequences\n", mat.n);
+
+	if (mat.n<MAXSPECIESGRAPH)
+	widthKlado=WIDTHCLADO/3;
+	else
+	widthKlado=WIDTHCLADO;
+
+	/*
+		Get memory for needed struct
+	*/
+	asap_param.nbpairs = (mat.n * (mat.n - 1)) / 2;
+
+	ListDistance = (DistPair *) malloc( (size_t) sizeof(DistPair) *  asap_param.nbpairs);
+	if (!ListDistance)fprintf(stderr, "asap_one_file: cannot allocate  ListDistance bye\n"), exit(2);
+
+	no_node = (int *)malloc( (size_t) sizeof(int) * mat.n);
+	if (!no_node)fprintf(stderr, "asap_one_file: MEMORY ERROR error can allocate nonode bye\n"), exit(2);
+
+	zenodes = (Node *) malloc( (size_t) sizeof(Node) * ((mat.n*2)-1));
+	if (!zenodes)fprintf(stderr, "asap_one_file: MEMORY ERROR error can allocate  zenodes bye\n"), exit(2);
+
+	strucompo = (Tabcompo *) malloc( (size_t) sizeof(Tabcompo) * mat.n);
+	if (!strucompo)fprintf(stderr, "asap_one_file: cannot allocate  strucompo bye\n"), exit(2);
+
+	scores = (Results *) malloc(  (size_t) sizeof(Results) * mat.n);
+	if (!scores)fprintf(stderr, "asap_one_file: cannot allocate  scores bye\n"), exit(2);
+	for (i=0;i<mat.n;i++)
+			scores[i].listNodes=malloc(sizeof(int)*mat.n);
+
+	myspar=malloc(sizeof(Spart)*mat.n);
+	if (!myspar)fprintf(stderr, "asap_one_file: cannot allocate  myspar bye\n"), exit(2);
+
+	initcomp(&comp, mat.n, stderr, "");
+	inittabcompo(strucompo, mat.n, stderr, "");
+	initNodes(stderr, zenodes, mat, "");
+
+	/*
+		Set the first n nodes to their id --the leaves--
+	*/
+	for (i = 0; i < mat.n; i++)
+		no_node[i] = i;
+
+	/*
+		from the distance matrix, build a sorted list of pairwise_distance, min and max
+	*/
+	mattolist(ListDistance , &mat , &maxDist, &min);
+
+	last_node = mat.n - 1;
+
+	/*
+		Run ASAP core
+	*/
+	nbresults = do_agglutine( mat, &comp, ListDistance, scores, strucompo,  &best_score, &firstpart,  zenodes, no_node, &last_node,asap_param);
+
+	/*
+		Rank the partitions exactly as asap does
+	*/
+	qsort(scores,nbresults,sizeof (Results ),compareProba);
+	for (i = 0; i < nbresults+1; i++)
+		scores[i].rank_proba=i+1;
+
+	qsort(scores,nbresults,sizeof (Results ),compareParameter);
+	for (i = 0; i < nbresults+1; i++)
+		scores[i].rank_pente=i+1;
+
+	for (i = 0; i < nbresults+1; i++)
+		scores[i].score=(scores[i].rank_pente*(1.0-asap_param.pond_score))+(scores[i].rank_proba*asap_param.pond_score);
+	qsort(scores,nbresults,sizeof (Results ),compareRang);
+	for (i = 0; i < nbresults+1; i++)
+		scores[i].rank_general=i+1;
+
+	int nb_B=(nbresults<nbBestAsap)?nbresults:nbBestAsap;
+
+	/*
+		Subset of every sequence in the nb_B best partitions (kept in memory, no partition file)
+	*/
+	qsort(scores,nbresults,sizeof (Results ),compareSpecies);
+	clearalltab(strucompo, &comp, mat.n);
+
+	echy = mat.n * SIZEOFTEXT;
+	echx = widthKlado / (float)maxDist;
+	print_clado(zenodes, last_node, NULL, echx, echy, (widthKlado - 100) / zenodes[last_node].round, 0,0);
+	color_clado(zenodes, last_node,&color_ori);
+
+	// myspar[i] is the i-th input sequence, so the labels below come out in input order
+	for (i=0;i<mat.n;i++)
+		{
+			myspar[i].name=mat.names[i];
+			myspar[i].specie=malloc(sizeof(int)* (nb_B+1));
+		}
+	qsort(scores,nbresults,sizeof (Results ),compareRang);
+	ecrit_fichier_texte( "",nb_B-1,nbresults, zenodes,scores,asap_param.fres,asap_param.seuil_pvalue,myspar,mat.n,last_node,"",1);
+
+	/*
+		Write the result: sequence names, then one line per ranked partition with its labels;
+		written under a temporary name first, so that a result file is always complete
+	*/
+	tmp_name=malloc(sizeof(char)*(strlen(result_name)+5));
+	sprintf(tmp_name,"%s.tmp",result_name);
+	f_res=fopen(tmp_name,"w");
+	if (f_res==NULL)fprintf(stderr, "cannot open the result output file %s, bye\n", tmp_name), exit(1);
+
+	fprintf(f_res,"#names");
+	for (i=0;i<mat.n;i++)
+		fprintf(f_res,"\t%s",mat.names[i]);
+	fprintf(f_res,"\n");
+	fprintf(f_res,"#rank\tasap_score\tp_value\tn_subsets\tthreshold_distance\tlabels\n");
+	for (k=0;k<nb_B;k++)
+		{
+		fprintf(f_res,"%d\t%f\t%e\t%d\t%f",
+			scores[k].rank_general,
+			scores[k].score,
+			scores[k].proba,
+			scores[k].nbspecRec,
+			scores[k].d_jump);
+		for (i=0;i<mat.n;i++)
+			fprintf(f_res,"\t%d",myspar[i].specie[k]);
+		fprintf(f_res,"\n");
+		}
+	fclose(f_res);
+	if (rename(tmp_name,result_name)!=0)fprintf(stderr, "cannot rename %s, bye\n", tmp_name), exit(1);
+	free(tmp_name);
+
+	/*
+		Give back the memory of this input before the next one
+	*/
+	for (i=0;i<mat.n;i++)
+		{
+		free(myspar[i].specie);
+		free(scores[i].listNodes);
+		}
+	for (i=0;i<nbresults;i++)
+		{
+		free(scores[i].proba_part);
+		free(scores[i].eff_groups);
+		}
+	for (i=0;i<(mat.n*2)-1;i++)
+		free(zenodes[i].desc);
+	for (i=0;i<mat.n;i++)
+		{
+		free(strucompo[i].effcompo);
+		free(strucompo[i].nodecompo);
+		}
+	free(myspar);
+	free(scores);
+	free(strucompo);
+	free(zenodes);
+	free(no_node);
+	free(ListDistance);
+	resetcomp(&comp, mat.n);
+	freecomp(&comp, mat.n);
+	free_distmat(mat);
+
+	return(0);
+}
+
+
+int main(int argc, char**argv)
+{
+	Parameter asap_param;  		/*stuff for asap*/
+	FILE *f_list;
+	char *dirfiles=NULL,
+	     *ligne,
+	     *result_name,
+	     *simple_name,
+	     *tab;
+	int c;
+	short int imethode = 1;//imethode1 for Jukes
+	float ts_tv = 2.0;     /* default value for the trans/transv rates for Kimura 2-p */
+	int nbBestAsap=10,
+	    seed_asap=-1,
+	    nbcharmax=NBCHARMALLOC,
+	    nb_files=0,
+	    nb_failed=0;
+	time_t t1;
+	struct stat st = {0};
+
+	extern char *optarg;           /* for options parisng */
+	extern  int optind;
+
+	/*
+		init, same defaults as asap
+	*/
+	t1 = time(NULL);
+	asap_param.pond_pente=0.1;
+	asap_param.pond_score=0.5;
+	asap_param.replicates=1000;
+	asap_param.seuil_pvalue=0.001;
+	asap_param.lenSeq=600;
+	asap_param.onlyspart=1;
+	asap_param.fres=stdout;
+	asap_param.web=0;
+	asap_param.ledir="";
+
+	/*
+		parse options
+	*/
+	while ( (c = getopt(argc, argv, "o:l:n:d:hr:b:t:x:")) != -1 ) {
+
+		switch (c) {
+			case 'd':
+				imethode = atoi(optarg);              /* nbr choosing dist method */
+				break;
+
+			case 'o':								/*dir where results files are written*/
+				dirfiles = malloc((strlen(optarg) + 2) * sizeof(char));
+				strcpy(dirfiles, optarg);
+				if (dirfiles[strlen(dirfiles)-1]!='/')
+					strcat(dirfiles,"/");
+				if (stat(dirfiles, &st) == -1) {
+					mkdir(dirfiles, 0700);
+				}
+				break;
+
+			case 'l':
+				asap_param.lenSeq=atoi(optarg);
+				break;
+
+			case 't':
+				ts_tv = atof(optarg);		/* trans/trav rate */
+				break;
+
+			case 'n':
+				nbBestAsap = atoi(optarg);		/* nb scores */
+				break;
+
+			case 'r':
+				asap_param.replicates = atoi(optarg);			/* for statistical testing */
+				break;
+
+			case 'b':
+				asap_param.seuil_pvalue = atof(optarg);			/* limit for results to be reported */
+				break;
+
+			case 'x':
+				seed_asap=atoi(optarg); /* give a seed */
+				break;
+
+			case 'h':
+			default:
+				usage(argv[0]);
+		}
+	}
+
+	if (argc - optind != 1)usage(argv[0]);
+
+	if (dirfiles == NULL)
+	{
+		dirfiles = (char *) malloc( (size_t) sizeof(char) * 3);
+		if(!dirfiles)fprintf(stderr, "main: cannot allocate dirfiles bye\n"), exit(2);
+		strcpy(dirfiles,"./");
+	}
+
+	if (strcmp(argv[optind],"-")==0)
+		f_list=stdin;
+	else
+		f_list=fopen(argv[optind],"r");
+	if (f_list == NULL)fprintf(stderr,"cannot open the list file, bye\n"), exit(1);
+
+	if (seed_asap== -1)
+		srand( time(NULL) );
+
+	ligne=(char *)malloc(sizeof(char)*nbcharmax);
+
+	/*
+		One input per line: run it and write its result before reading the next line
+	*/
+	while ((ligne=my_get_line(ligne,f_list,&nbcharmax))!=NULL)
+	{
+		if (ligne[0]=='\0' || ligne[0]=='#')
+			continue;
+
+		tab=strchr(ligne,'\t');
+		if (tab!=NULL)
+		{
+			*tab='\0';
+			result_name=malloc(sizeof(char)*(strlen(tab+1)+1));
+			strcpy(result_name,tab+1);
+		}
+		else
+		{
+			simple_name=(strrchr(ligne,'/')!=NULL)?strrchr(ligne,'/')+1:ligne;
+			result_name=malloc(sizeof(char)*(strlen(dirfiles)+strlen(simple_name)+10));
+			sprintf(result_name,"%s%s.asap.tsv",dirfiles,simple_name);
+		}
+
+		nb_files++;
+		fprintf(stderr,"> asap_batch [%d] %s\n",nb_files,ligne);
+		fflush(stderr);
+
+		// every input gets the state of a fresh asap run, so results do not depend on the batch
+		if (seed_asap!= -1)
+			srand(seed_asap);
+
+		if (asap_one_file(ligne,result_name,imethode,ts_tv,nbBestAsap,asap_param)!=0)
+			nb_failed++;
+		else
+			fprintf(stderr,"  result is: %s\n",result_name);
+		fflush(stderr);
+		free(result_name);
+	}
+
+	if (f_list!=stdin)
+		fclose(f_list);
+	free(ligne);
+	free(dirfiles);
+
+	fprintf(stderr,"> asap_batch processed %d inputs (%d skipped) in %ld s\n",nb_files,nb_failed,(long)(time(NULL)-t1));
+
+	return 0;
+}
@@ -0,0 +1,6 @@
+"""
+Author: Khaoula El Mchachti
+Description: Helpers shared by the CGCD pipeline scripts (4_CGCD_approach/ and 4_large_scale_genome_dataset/CGCD_approach/).
+The numbered scripts add 3_species_delimitation_methods/ to sys.path and import the modules of this package.
+Date: 2026-10-17
+"""
@@ -0,0 +1,521 @@
+"""
+Author: Khaoula El Mchachti
+Description: In-process ABGD. A NumPy port of the ABGD binary of this repository (ABGD/abgdCore.c and its main
+program): the pairwise JC69 / K80 / simple distances, the barcode gap detection (find_abgd / FindFirstPeak) and the
+recursive partitioning, run on an alignment array without writing or parsing any file. Partitions are returned as
+label arrays (one group number per sequence, groups numbered in the order ABGD prints them), and can be written as
+the .res.cvs and .part.<step>.txt files read by the best-partition scripts.
+Date: 2026-10-17
+"""
+
+import os
+import math
+import time
+import subprocess
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from Bio import SeqIO
+
+from cgcd.distances import read_phylip
+from cgcd.scheduler import process_memory_mb
+
+# Default ABGD parameters (abgd -h)
+MIN_PRIOR = 0.001
+MAX_PRIOR = 0.1
+N_STEPS = 10
+MIN_SLOPE = 1.5
+TS_TV = 2.0
+
+DISTANCES = ("jc69", "k80", "simple")
+
+
+def _compare_dna(s1, s2):
+    """compare_DNA of abgdCore.c: 1 when the two (upper case) IUPAC codes can be the same nucleotide."""
+    if s1 in "ACGT" and s2 in "ACGT":
+        return int(s1 == s2)
+    if s1 in "-+" or s2 in "-+":
+        return 0 if {s1, s2} == {"-", "+"} else 1
+    if s1 == "N" or s2 == "N":
+        return 1
+    overlaps = {"A": "MRWVHD", "C": "MSYVHB", "G": "RSKVDB", "T": "WYKHDB"}
+    for base, codes in overlaps.items():
+        if s1 == base:
+            return int(s2 in codes)
+        if s2 == base:
+            return int(s1 in codes)
+    return int({s1, s2} not in ({"M", "K"}, {"R", "Y"}, {"W", "S"}))
+
+
+def _is_transition(s1, s2):
+    """IsTransition of abgdCore.c."""
+    return int(s2 in {"T": "CSMV", "C": "TWKD", "A": "GSKB", "G": "AWMH"}.get(s1, ""))
+
+
+# Byte lookup tables: mismatch (compare_DNA == 0) and transition between two upper case characters
+_MISMATCH = np.zeros((256, 256), dtype=bool)
+_TRANSITION = np.zeros((256, 256), dtype=bool)
+for _a in range(256):
+    for _b in range(256):
+        _MISMATCH[_a, _b] = _compare_dna(chr(_a), chr(_b)) == 0
+        _TRANSITION[_a, _b] = _is_transition(chr(_a), chr(_b)) == 1
+_GAP = np.zeros(256, dtype=bool)
+_GAP[ord("-")] = True
+_GAP_OR_N = _GAP.copy()
+_GAP_OR_N[ord("N")] = True
+
+
+def read_alignment(fasta_path):
+    """Names and upper case alignment array (n sequences x length, uint8) of an aligned FASTA file."""
+    names, sequences = [], []
+    for record in SeqIO.parse(fasta_path, "fasta"):
+        names.append(record.id)
+        sequences.append(str(record.seq).upper().encode())
+    length = max((len(seq) for seq in sequences), default=0)
+    alignment = np.full((len(sequences), length), ord("-"), dtype=np.uint8)
+    for i, seq in enumerate(sequences):
+        alignment[i, :len(seq)] = np.frombuffer(seq, dtype=np.uint8)
+    return names, alignment
+
+
+def _pair_counts(alignment, table):
+    """
+    n x n matrix counting, for every pair of sequences (i, j), the sites where table[s_i, s_j] holds.
+    Computed with one matrix product per character of the alignment: one-hot(a) x one-hot(partners of a).
+    """
+    n = len(alignment)
+    symbols = np.unique(alignment)
+    one_hot = {a: (alignment == a).astype(np.float32) for a in symbols}
+    counts = np.zeros((n, n), dtype=np.float64)
+    for a in symbols:
+        partners = [one_hot[b] for b in symbols if table[a, b]]
+        if partners:
+            counts += one_hot[a] @ sum(partners).T
+    return np.rint(counts).astype(np.int64)
+
+
+def _symmetric(upper):
+    matrix = np.triu(upper, 1)
+    return matrix + matrix.T
+
+
+def _check_common_sites(alignment, gap_pairs):
+    """ABGD refuses pairs of sequences without a site where both have a nucleotide."""
+    no_common = np.triu(gap_pairs == alignment.shape[1], 1)
+    if no_common.any():
+        i, j = np.argwhere(no_common)[0]
+        raise ValueError(f"Sequences {i} and {j} have no common site, distance can't be computed")
+
+
+def _log(x):
+    """C log(): -inf at 0 and nan below, where math.log raises."""
+    if x > 0:
+        return math.log(x)
+    return -math.inf if x == 0 else math.nan
+
+
+def _k80_log_likelihood(nsites, n_tsv, n_tsi, t, r):
+    p = 0.25 - 0.5 * math.exp(-t * (2 * r + 1) / (r + 1)) + 0.25 * math.exp(-2 * t / (r + 1))
+    q = 0.5 - 0.5 * math.exp(-2 * t / (r + 1))
+    return nsites * _log(0.25) + (nsites - n_tsv - n_tsi) * _log(1.00 - p - q) + n_tsi * _log(p) + n_tsv * _log(q)
+
+
+def _k80_ml_distance(nsites, n_tsv, n_tsi, r):
+    """find_ML_t_given_R: hill climbing of the K80 likelihood from the empirical K80 distance."""
+    q, p = n_tsv / nsites, n_tsi / nsites
+    t = -0.25 * _log((1 - 2 * q) * (1 - 2 * p - q) * (1 - 2 * p - q))
+    eps = 1e-3
+    while eps >= 1e-7:
+        while _k80_log_likelihood(nsites, n_tsv, n_tsi, t + eps, r) > _k80_log_likelihood(nsites, n_tsv, n_tsi, t, r):
+            t += eps
+        while _k80_log_likelihood(nsites, n_tsv, n_tsi, t - eps, r) > _k80_log_likelihood(nsites, n_tsv, n_tsi, t, r):
+            t -= eps
+        eps *= 0.1
+    return t + 0.0  # -0 -> 0
+
+
+def distance_matrix(alignment, distance="jc69", ts_tv=TS_TV):
+    """
+    Pairwise distance matrix (n x n, float64) of an upper case alignment array, computed as the ABGD binary does
+    (-d 0 = k80, -d 1 = jc69, -d 3 = simple).
+    """
+    if distance not in DISTANCES:
+        raise ValueError(f"Unknown ABGD distance {distance!r}, expected one of {DISTANCES}")
+    n, length = alignment.shape
+    if length == 0:
+        raise ValueError("Empty alignment")
+    gap = _GAP[alignment]
+    gap_pairs = _pair_counts(gap.view(np.uint8), np.array([[False, True], [True, True]]))
+    _check_common_sites(alignment, gap_pairs)
+    mismatches = _pair_counts(alignment, _MISMATCH)
+    dist = np.zeros((n, n))
+
+    if distance == "jc69":
+        # Mismatches over the sites without gap or N in both sequences, capped at 0.74
+        gap_or_n = _GAP_OR_N[alignment].view(np.uint8)
+        sites = length - _pair_counts(gap_or_n, np.array([[False, True], [True, True]]))
+        # Few distinct (mismatches, sites) pairs: evaluate them with the C log of the binary
+        for (v, l), index in _group_pairs(mismatches, sites):
+            p = v / l if l != 0 else float(v)
+            p = min(p, 0.74)
+            dist[index] = (-3.0 / 4.0) * math.log(1.0 - ((4.0 / 3.0) * p)) + 0.0
+
+    elif distance == "k80":
+        transitions = _pair_counts(alignment, _MISMATCH & _TRANSITION)
+        for (v, tsi, l), index in _group_pairs(mismatches, transitions, length - gap_pairs):
+            dist[index] = _k80_ml_distance(l, v - tsi, tsi, ts_tv)
+
+    else:
+        # (mismatches + 1) / (sites without gap or N in either sequence + 1)
+        gap_or_n = _GAP_OR_N[alignment].view(np.uint8)
+        sites = length - _pair_counts(gap_or_n, np.array([[False, True], [True, True]]))
+        dist = (mismatches + 1) / (sites + 1.0)
+
+    return _symmetric(dist)
+
+
+def _group_pairs(*counts):
+    """Group the pairs (i < j) by their tuple of counts; yields (counts, index of the pairs)."""
+    rows, cols = np.triu_indices(len(counts[0]), 1)
+    keys = np.stack([c[rows, cols] for c in counts], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+    for k, key in enumerate(unique):
+        members = order[bounds[k]:bounds[k + 1]]
+        yield tuple(int(x) for x in key), (rows[members], cols[members])
+
+
+def priors(n_steps=N_STEPS, min_prior=MIN_PRIOR, max_prior=MAX_PRIOR):
+    """Prior intraspecific divergences tested by ABGD, log-spaced from min_prior to max_prior."""
+    values = [min_prior]
+    increment = math.log10(max_prior / min_prior) / float(np.float32(n_steps - 1.0))
+    start = math.log10(min_prior)
+    values += [math.pow(10, start + i * increment) for i in range(1, n_steps - 1)]
+    if n_steps > 1:
+        values.append(max_prior)
+    else:
+        values = [max_prior]
+    return values
+
+
+def min_window_size(n_values):
+    """min_ws of abgdCore.c."""
+    if n_values > 10000:
+        return 1000
+    return max(n_values // 10, 1)
+
+
+def _next_stop(stops, i, end):
+    """First index >= i in the sorted stops, or end."""
+    k = bisect_left(stops, i)
+    return stops[k] if k < len(stops) else end
+
+
+def _explore_right(slope, i, end, reach):
+    """
+    Walk right from i while within reach of the highest slope seen so far (strictly higher values move the top).
+    Returns the new (i, top).
+    """
+    if i >= end:
+        return i, i
+    if math.isnan(slope[i]):
+        return min(end, i + reach + 1), i
+    size = 2 * (reach + 1)
+    while True:
+        stop = min(end, i + size)
+        window = slope[i:stop]
+        previous_max = np.fmax.accumulate(window)
+        record = np.empty(len(window), dtype=bool)
+        record[0] = True
+        record[1:] = window[1:] > previous_max[:-1]
+        tops = np.flatnonzero(record)
+        top_at = tops[np.searchsorted(tops, np.arange(len(window)), side="right") - 1]
+        too_far = np.flatnonzero(np.arange(1, len(window)) - top_at[:-1] > reach)
+        if too_far.size:
+            j = too_far[0] + 1
+            return i + j, i + int(top_at[j - 1])
+        if stop == end:
+            return end, i + int(top_at[-1])
+        size *= 2
+
+
+def _peak_origin(values, top, window):
+    """
+    Step 2 of FindFirstPeak: for wt from window - 1 down to 2, ct moves right when the window [ct, ct + wt - 1]
+    gains more by sliding one value right. Every step either moves the left end ct right or the right end
+    ct + wt - 1 left, so each run of the same move is found with one vectorized comparison. Returns ct.
+    """
+    n = len(values)
+    c, r = top, top + window - 2  # left and right ends of the window
+    size = 16
+    while r > c:
+        if r < n - 2 and values[r] - values[c] < values[r + 1] - values[c + 1]:
+            # The left end moves right as long as the comparison holds at this right end
+            cs = np.arange(c, min(r, c + size))
+            moves = (values[r] - values[cs]) < (values[r + 1] - values[cs + 1])
+            k = int(np.argmin(moves)) if not moves.all() else len(cs)
+            c = c + k
+            if k < len(cs):
+                r -= 1  # this step moved the right end instead
+                size = 16
+            else:
+                size *= 2
+        else:
+            # The right end moves left until the comparison holds
+            rs = np.arange(r, max(c, r - size), -1)
+            moves = (rs < n - 2) & ((values[rs] - values[c]) < (values[rs + 1] - values[c + 1]))
+            if moves.any():
+                r = int(rs[np.argmax(moves)])
+                size = 16
+            else:
+                r = int(rs[-1]) - 1
+                size *= 2
+    return c
+
+
+def _first_peak(values, window, pi, prior, min_slope):
+    """FindFirstPeak of abgdCore.c. Returns (distance, rank, theta) with -1 when no peak is found."""
+    n = len(values)
+    end = n - window
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (values[window - 1:] - values[:n - window + 1]) / float(window - 1)
+
+    # Theta: mean distance up to the prior
+    below_prior = int(np.searchsorted(values, prior, side="right"))
+    theta = pi[max(1, min(n, below_prior)) - 1]
+
+    # Largest slope inside [0, prior]
+    i = max(1, min(end, below_prior - window))
+    slope_max = float(slope[0])
+    if i > 1:
+        local_max = slope[1:i].max()
+        if local_max > slope_max:
+            slope_max = float(local_max)
+
+    # Positions where going uphill / downhill stops
+    up_stops = np.flatnonzero(~(slope[1:] >= slope[:-1])).tolist()
+    down_stops = np.flatnonzero(~(slope[1:] <= slope[:-1])).tolist()
+
+    while i < end:
+        # Local maximum, then explore window/10 on its right
+        i = _next_stop(up_stops, i, end)
+        i, top = _explore_right(slope, i, end, window // 10)
+
+        # Threshold distance: from the window size down to 2, keeping track of the origin of the peak
+        ct = _peak_origin(values, top, window)
+        mean_dist = (float(values[ct]) + float(values[ct + 1])) / 2.0
+
+        top_slope = float(slope[top])
+        if mean_dist > 2.581 * 2 * theta and top_slope > min_slope * slope_max:
+            return mean_dist, ct + 0.5, pi[ct]
+
+        if top_slope > slope_max and pi[ct] <= theta:
+            slope_max = top_slope
+        i = ct + 1
+        i = _next_stop(down_stops, i, end) if i < end else i
+
+    return -1, -1, theta
+
+
+def find_abgd(values, window_min, window_max, prior, min_slope=MIN_SLOPE):
+    """
+    find_abgd of abgdCore.c on the sorted pairwise distances: the first barcode gap found at three consecutive
+    window sizes. Returns (distance threshold, rank); the rank is len(values) + 0.5 when there is no gap.
+    """
+    n = len(values)
+    step = window_min // 10 if window_min > 10 else 1
+
+    # Running mean of the sorted distances, accumulated as in the C code
+    pi = [0.0] * n
+    a = values.tolist()
+    pi[0] = a[0]
+    for i in range(1, n):
+        pi[i] = (a[i] + pi[i - 1] * i) / (i + 1.0)
+
+    dist, rank = -1, -1
+    stable, stable_dist = 0, -1
+    window = window_min
+    while window <= window_max and stable < 3:
+        dist, rank, _ = _first_peak(values, window, pi, prior, min_slope)
+        if dist != -1 and abs(dist - stable_dist) < 0.1 * stable_dist:
+            stable += 1
+        else:
+            stable, stable_dist = 1, dist
+        window += step
+
+    if dist == -1:
+        return a[n - 1], n + 0.5
+    return dist, rank
+
+
+def _components(dist, members, threshold):
+    """Connected components of the members linked by distances < threshold, numbered by their first member."""
+    linked = dist[np.ix_(members, members)] < threshold
+    labels = np.full(len(members), -1)
+    n_groups = 0
+    for start in range(len(members)):
+        if labels[start] >= 0:
+            continue
+        labels[start] = n_groups
+        frontier = np.zeros(len(members), dtype=bool)
+        frontier[start] = True
+        while frontier.any():
+            frontier = linked[frontier].any(axis=0) & (labels < 0)
+            labels[frontier] = n_groups
+        n_groups += 1
+    return [members[labels == g] for g in range(n_groups)]
+
+
+def _split(dist, members, prior, min_slope):
+    """Barcode gap of a group on its own pairwise distances; its subgroups, or None when it is not split."""
+    sub = dist[np.ix_(members, members)]
+    values = np.sort(sub[np.triu_indices(len(members), 1)])
+    if len(values) <= 2:
+        return None
+    threshold, rank = find_abgd(values, min_window_size(len(values)), len(values) - 1, prior, min_slope)
+    if rank == len(values) + 0.5:
+        return None
+    groups = _components(dist, members, threshold)
+    return groups if len(groups) > 1 else None
+
+
+def _labels(groups, n):
+    labels = np.empty(n, dtype=np.int64)
+    for g, members in enumerate(groups):
+        labels[members] = g
+    return labels
+
+
+def abgd(dist, n_steps=N_STEPS, min_prior=MIN_PRIOR, max_prior=MAX_PRIOR, min_slope=MIN_SLOPE):
+    """
+    ABGD partitions of a pairwise distance matrix, one step per prior as the binary runs them.
+    Returns a list of dicts (prior, distance, initial, recursive): the barcode gap distance and the label arrays
+    of the initial and recursive partitions. As in the binary, the scan stops at the first prior giving a single
+    group; that step is returned with distance None and all sequences in group 0.
+    """
+    n = len(dist)
+    if n < 2:
+        raise ValueError("ABGD needs at least two sequences")
+    everyone = np.arange(n)
+    values = np.sort(dist[np.triu_indices(n, 1)])
+    steps = []
+    for prior in priors(n_steps, min_prior, max_prior):
+        threshold, rank = find_abgd(values, min_window_size(len(values)), len(values) - 1, prior, min_slope)
+        if rank == len(values) + 0.5:
+            single = np.zeros(n, dtype=np.int64)
+            steps.append({"prior": prior, "distance": None, "initial": single, "recursive": single})
+            break
+
+        initial = _components(dist, everyone, threshold)
+
+        # Split every group on its own barcode gap until no group splits any more; the first subgroup keeps the
+        # place of the group and the others are appended
+        groups = list(initial)
+        split = True
+        while split:
+            split = False
+            for g in range(len(groups)):
+                subgroups = _split(dist, groups[g], prior, min_slope)
+                if subgroups:
+                    groups[g] = subgroups[0]
+                    groups.extend(subgroups[1:])
+                    split = True
+
+        steps.append({"prior": prior, "distance": threshold,
+                      "initial": _labels(initial, n), "recursive": _labels(groups, n)})
+        if len(groups) == 1:
+            break
+    return steps
+
+
+def abgd_fasta(fasta_path, distance="jc69", ts_tv=TS_TV, **options):
+    """Names and ABGD steps (see abgd()) of an aligned FASTA file."""
+    names, alignment = read_alignment(fasta_path)
+    return names, abgd(distance_matrix(alignment, distance, ts_tv), **options)
+
+
+def _write_groups(path, names, labels):
+    with open(path, "w") as out:
+        for g in range(labels.max() + 1):
+            members = [names[i] for i in np.flatnonzero(labels == g)]
+            out.write(f"Group[ {g + 1} ] n: {len(members)} ;id: {' '.join(members)}\n")
+
+
+def write_abgd_results(names, steps, output_dir, prefix):
+    """
+    Write the steps in the layout of `abgd -a`, without graphics: <prefix>.res.cvs and one
+    <prefix>.part.<step>.txt / <prefix>.partinit.<step>.txt per step (none for a final single-group step).
+    """
+    with open(os.path.join(output_dir, f"{prefix}.res.cvs"), "w") as res:
+        res.write("prior\tnbSubsetInitial\tnbSubsetRecursive\n")
+        for number, step in enumerate(steps, start=1):
+            # Same column order as the binary, which writes the recursive count first
+            row = f"{step['prior']:f}\t{step['recursive'].max() + 1}\t{step['initial'].max() + 1}\n"
+            res.write(row)
+            if number == 1 and step["recursive"].max() == 0:
+                # The binary writes the row of a first prior that already gives a single group twice
+                res.write(row)
+            if step["distance"] is None:
+                continue
+            _write_groups(os.path.join(output_dir, f"{prefix}.part.{number}.txt"), names, step["recursive"])
+            _write_groups(os.path.join(output_dir, f"{prefix}.partinit.{number}.txt"), names, step["initial"])
+
+
+def res_cvs_from_parts(files, prefix, n_steps=N_STEPS, min_prior=MIN_PRIOR, max_prior=MAX_PRIOR):
+    """
+    Text of the .res.cvs file of an ABGD run without -a, which writes the .part.<step>.txt and .partinit.<step>.txt
+    files but no .res.cvs: one row per step with the group counts of its two files, from {file name: text}.
+    None when there is no partition file (the first prior already gives a single group).
+    """
+    rows = []
+    for number, prior in enumerate(priors(n_steps, min_prior, max_prior), start=1):
+        part, init = f"{prefix}.part.{number}.txt", f"{prefix}.partinit.{number}.txt"
+        if part not in files or init not in files:
+            break
+        rows.append((prior, files[part].count("Group["), files[init].count("Group[")))
+    if not rows:
+        return None
+    if len(rows) < n_steps and rows[-1][1] > 1:
+        # The binary writes no partition files for a last prior giving a single group, only its row
+        rows.append((priors(n_steps, min_prior, max_prior)[len(rows)], 1, 1))
+    return "prior\tnbSubsetInitial\tnbSubsetRecursive\n" + "".join(
+        f"{prior:f}\t{recursive}\t{initial}\n" for prior, recursive, initial in rows)
+
+
+def run_gene(gene_name, fasta_path, output_dir, distance="jc69"):
+    """
+    In-process counterpart of one `abgd -a` run: the partitions of one gene are written to output_dir.
+    Like the binary, the input is either an aligned FASTA file or a phylip distance matrix (then distance is unused).
+    Returns (gene_name, CompletedProcess, wall time, peak RSS in MB of the worker process), like cgcd.jobs.run_command.
+    """
+    start = time.time()
+    cmd = ["cgcd.abgd", "-d", distance, fasta_path]
+    try:
+        with open(fasta_path) as f:
+            is_fasta = f.read(1) == ">"
+        if is_fasta:
+            names, steps = abgd_fasta(fasta_path, distance)
+        else:
+            names, dist = read_phylip(fasta_path)
+            steps = abgd(dist)
+        write_abgd_results(names, steps, output_dir, gene_name)
+        stdout = "".join(f"prior {step['prior']:f}: {step['recursive'].max() + 1} groups "
+                         f"({step['initial'].max() + 1} initial)\n" for step in steps)
+        result = subprocess.CompletedProcess(cmd, 0, stdout, "")
+    except (ValueError, OSError) as error:
+        result = subprocess.CompletedProcess(cmd, 1, "", f"ERROR: {error}\n")
+    return gene_name, result, time.time() - start, process_memory_mb(os.getpid())[1]
+
+
+def run_genes(genes, distance="jc69", jobs=1):
+    """
+    Run in-process ABGD on (gene_name, fasta_path, output_dir) genes, `jobs` worker processes at a time.
+    Yields (gene_name, CompletedProcess, wall time, peak RSS) as the genes finish.
+    """
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(run_gene, *gene, distance) for gene in genes]
+        for future in as_completed(futures):
+            yield future.result()
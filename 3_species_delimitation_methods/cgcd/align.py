@@ -0,0 +1,189 @@
+"""
+Author: Khaoula El Mchachti
+Description: Parallel MAFFT scheduler. Alignments run concurrently within a total budget of CPU cores, each job
+receiving --thread; jobs are started largest input first to shorten the tail of the run, failed jobs are retried,
+and progress is printed with an estimated time to completion. A gene that still fails loses the alignment of an earlier
+run, so that later steps never read an alignment of outdated sequences. Finished alignments can be kept in a content-addressed
+cache (keyed on the input FASTA, the MAFFT version and options), so unchanged genes are restored instead of realigned.
+Date: 2026-10-17
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import threading
+import subprocess
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def run_mafft(input_path, output_path, threads=1, options=("--auto",)):
+    """
+    Align one FASTA file with MAFFT. The alignment is written to a temporary file and only moved to output_path
+    on success, so a failed run never leaves a partial alignment. Returns (success, stderr).
+    """
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w") as out:
+        result = subprocess.run(
+            ["mafft", *options, "--thread", str(threads), input_path],
+            stdout=out,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+    if result.returncode == 0 and os.path.getsize(tmp_path) > 0:
+        os.replace(tmp_path, output_path)
+        return True, result.stderr
+    os.remove(tmp_path)
+    return False, result.stderr
+
+
+def check_mafft():
+    """Raise FileNotFoundError when there is no MAFFT executable on the PATH."""
+    if shutil.which("mafft") is None:
+        raise FileNotFoundError("MAFFT executable not found on the PATH (is the Conda environment activated?)")
+
+
+def mafft_version():
+    """Version string reported by the MAFFT on the PATH."""
+    check_mafft()
+    result = subprocess.run(["mafft", "--version"], capture_output=True, text=True)
+    return (result.stdout + result.stderr).strip()
+
+
+class AlignmentCache:
+    """
+    Content-addressed store of MAFFT alignments. An entry is keyed on the SHA-256 of the input FASTA (sequences and
+    headers), the MAFFT version and the alignment options; --thread is not part of the key. The cache is bounded to
+    max_bytes, evicting the least recently used alignments first.
+    """
+
+    def __init__(self, cache_dir, options=("--auto",), max_bytes=1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.salt = f"{mafft_version()}\0{' '.join(options)}\0".encode()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, input_path):
+        digest = hashlib.sha256(self.salt)
+        with open(input_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.fasta")
+
+    def restore(self, key, output_path):
+        """Copy a cached alignment to output_path; returns False on a cache miss."""
+        cached = self.path(key)
+        if not os.path.isfile(cached):
+            return False
+        shutil.copyfile(cached, output_path)
+        os.utime(cached)  # mark as recently used
+        return True
+
+    def store(self, key, output_path):
+        """Add a finished alignment to the cache."""
+        tmp_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, self.path(key))
+
+    def evict(self):
+        """Remove the least recently used alignments until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".fasta"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+
+def align_with_retries(input_path, output_path, threads, options, retries, cache=None, key=None):
+    """
+    Run MAFFT, retrying up to `retries` times, and store a successful alignment in the cache. When every attempt
+    fails, the alignment left at output_path by an earlier run is removed.
+    Returns (success, attempts, stderr of the last attempt).
+    """
+    for attempt in range(1, retries + 2):
+        success, stderr = run_mafft(input_path, output_path, threads, options)
+        if success:
+            if cache is not None:
+                cache.store(key, output_path)
+            break
+    else:
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+    return success, attempt, stderr
+
+
+def align_fastas(jobs, cores=None, threads_per_job=1, retries=1, options=("--auto",), cache=None):
+    """
+    Align (input_path, output_path) jobs with MAFFT, running cores // threads_per_job jobs at a time.
+    With an AlignmentCache, genes whose alignment is cached are restored without running MAFFT.
+    Returns the input paths of the jobs that still failed after all retries (their output_path is removed).
+    Raises FileNotFoundError before any job starts when MAFFT is not on the PATH.
+    """
+    cores = cores or os.cpu_count()
+    threads_per_job = max(1, min(threads_per_job, cores))
+    slots = max(1, cores // threads_per_job)
+
+    # Restore unchanged genes from the cache
+    keys = {}
+    if cache is not None:
+        pending = []
+        for input_path, output_path in jobs:
+            keys[input_path] = cache.key(input_path)
+            if not cache.restore(keys[input_path], output_path):
+                pending.append((input_path, output_path))
+        print(f"{len(jobs) - len(pending)} of {len(jobs)} alignments restored from the cache in {cache.cache_dir}")
+        jobs = pending
+
+    # Fail once here rather than in every worker when MAFFT is missing
+    if jobs:
+        check_mafft()
+
+    # Largest alignments first, so the longest jobs do not end up alone at the end of the run
+    jobs = sorted(jobs, key=lambda job: os.path.getsize(job[0]), reverse=True)
+    print(f"Aligning {len(jobs)} genes: {slots} MAFFT jobs at a time, {threads_per_job} thread(s) each")
+
+    failed = []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=slots) as executor:
+        futures = {
+            executor.submit(align_with_retries, input_path, output_path, threads_per_job, options, retries,
+                            cache, keys.get(input_path)): input_path
+            for input_path, output_path in jobs
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            input_path = futures[future]
+            success, attempts, stderr = future.result()
+            name = os.path.basename(input_path)
+
+            if success:
+                status = "aligned" if attempts == 1 else f"aligned after {attempts} attempts"
+            else:
+                status = f"FAILED after {attempts} attempts"
+                failed.append(input_path)
+                print(stderr.strip()[-1000:])
+
+            elapsed = time.time() - start
+            eta = elapsed / done * (len(jobs) - done)
+            print(f"[{done}/{len(jobs)}] {name} {status} "
+                  f"(elapsed {timedelta(seconds=int(elapsed))}, ETA {timedelta(seconds=int(eta))})")
+
+    # Keep the cache within its size limit
+    if cache is not None:
+        removed = cache.evict()
+        if removed:
+            print(f"{removed} least recently used alignments evicted from the cache")
+
+    return failed
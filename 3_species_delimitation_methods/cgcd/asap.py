@@ -0,0 +1,156 @@
+"""
+Author: Khaoula El Mchachti
+Description: Batch mode of ASAP. asap_batch (built next to asap with `make asap_batch`) runs many alignments in one
+process, without graphics, and writes one compact result per gene (<gene>.asap.tsv): the sequence names, then one row
+per ranked partition (rank, ASAP score, p-value, number of subsets, threshold distance) with the subset of every
+sequence, in input order. The .spart file of a standard asap run holds every partition as well: read_spart() reads
+them all in one pass, in the same form, so any rank can be selected without the per-rank Partition_<rank>.csv files.
+Date: 2026-10-17
+"""
+
+import os
+import re
+import math
+
+import numpy as np
+
+ASAP_RESULT_SUFFIX = ".asap.tsv"
+SPART_SUFFIX = ".spart"
+RES_CVS_SUFFIX = ".res.cvs"
+PARTITION_COLUMNS = ["rank", "asap_score", "p_value", "n_subsets", "threshold_distance"]
+
+
+def write_batch_list(pairs, list_path):
+    """Write the asap_batch input list: one "alignment<TAB>result file" line per gene."""
+    with open(list_path, "w") as f:
+        for fasta_path, result_path in pairs:
+            f.write(f"{fasta_path}\t{result_path}\n")
+
+
+def read_asap_result(path):
+    """
+    Read an asap_batch result file.
+    Returns (names, partitions): partitions are dicts (rank, asap_score, p_value, n_subsets, threshold_distance,
+    labels) sorted by rank, labels being an int array aligned with names.
+    """
+    with open(path) as f:
+        names = f.readline().rstrip("\n").split("\t")[1:]
+        f.readline()  # column header
+        partitions = []
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < len(PARTITION_COLUMNS):
+                continue
+            partition = dict(zip(PARTITION_COLUMNS, fields))
+            partition["rank"] = int(partition["rank"])
+            partition["n_subsets"] = int(partition["n_subsets"])
+            for key in ("asap_score", "p_value", "threshold_distance"):
+                partition[key] = float(partition[key])
+            partition["labels"] = np.array(fields[len(PARTITION_COLUMNS):], dtype=int)
+            partitions.append(partition)
+    return names, sorted(partitions, key=lambda partition: partition["rank"])
+
+
+def partition_assignment(names, partitions, rank=1):
+    """{sequence: subset} of the partition of a given rank; empty when there is no such partition."""
+    partition = next((partition for partition in partitions if partition["rank"] == rank), None)
+    if partition is None:
+        return {}
+    return {name: str(label) for name, label in zip(names, partition["labels"])}
+
+
+def spart_name(name):
+    """Sample name as written in a .spart file: asap replaces every character but letters, digits and _ by _."""
+    return re.sub(r"[^0-9A-Za-z_]", "_", name)
+
+
+def fasta_names(fasta_path):
+    """Sequence names of a FASTA file, in file order (headers only)."""
+    with open(fasta_path) as f:
+        return [line[1:].split()[0] for line in f if line.startswith(">") and line[1:].strip()]
+
+
+def restore_names(names, original_names):
+    """Map .spart sample names back to the original names (kept as they are when absent or ambiguous)."""
+    original = {}
+    for name in original_names:
+        original.setdefault(spart_name(name), []).append(name)
+    return [original[name][0] if len(original.get(name, ())) == 1 else name for name in names]
+
+
+def _spart_value(text):
+    return math.nan if text.strip() == "?" else float(text)
+
+
+def _read_res_cvs(path):
+    """(rank, n_subsets, asap_score, p_value, threshold_distance) of every partition of an asap .res.cvs file."""
+    rows = []
+    with open(path) as f:
+        next(f, None)  # header
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 8:
+                rows.append((int(fields[0]), int(fields[1]), float(fields[2]), float(fields[3]), float(fields[7])))
+    return rows
+
+
+def _rank_partitions(partitions, res_cvs_path):
+    """
+    Rank the partitions of a .spart file. The .res.cvs file of the same run gives the ranks of asap itself (equal
+    ASAP scores are ordered by p-value, which the .spart does not hold); without it, or when it does not match,
+    partitions are ranked by ASAP score, equal scores in .spart order (increasing threshold).
+    """
+    if res_cvs_path is not None and os.path.isfile(res_cvs_path):
+        unranked = list(partitions)
+        for rank, n_subsets, asap_score, p_value, threshold in _read_res_cvs(res_cvs_path):
+            match = next((partition for partition in unranked if partition["n_subsets"] == n_subsets
+                          and abs(partition["asap_score"] - asap_score) < 0.05), None)
+            if match is None:
+                break
+            match.update({"rank": rank, "p_value": p_value, "threshold_distance": threshold})
+            unranked.remove(match)
+        if not unranked:
+            return sorted(partitions, key=lambda partition: partition["rank"])
+    partitions = sorted(partitions, key=lambda partition: partition["asap_score"])
+    for rank, partition in enumerate(partitions, 1):
+        partition.update({"rank": rank, "p_value": math.nan, "threshold_distance": math.nan})
+    return partitions
+
+
+def read_spart(path, res_cvs_path=None):
+    """
+    Read every partition of the .spart file of an asap run, in one pass.
+    Returns (names, partitions) like read_asap_result: partitions are dicts (rank, asap_score, p_value, n_subsets,
+    threshold_distance, subset_p_values, labels) sorted by rank, labels being an int array aligned with names (sample
+    names as written in the .spart, see restore_names). p_value and threshold_distance are only known from the
+    .res.cvs file of the run (nan otherwise), which also gives the ranks of tied ASAP scores.
+    """
+    subsets, scores, names, rows = [], [], [], []
+    complete = False
+    with open(path) as f:
+        lines = iter(f)
+        for line in lines:
+            if line.startswith("N_subsets"):
+                # "N_subsets = 7 : 1.2e-01,?,... / 6 : ... ;"
+                for block in line.split("=", 1)[1].rstrip().rstrip(";").split(" / "):
+                    count, p_values = block.split(":", 1)
+                    subsets.append((int(count), [_spart_value(value) for value in p_values.split(",")]))
+            elif line.startswith("[Asap scores"):
+                scores = [float(value) for value in next(lines).strip().strip("[]").split("/")]
+            elif line.startswith("Individual_assignment"):
+                for line in lines:
+                    name, labels = line.rsplit(":", 1) if ":" in line else ("", "")
+                    if name.strip():
+                        names.append(name.strip())
+                        rows.append(labels.rstrip().rstrip(";").split("/"))
+                    if line.rstrip().endswith(";"):
+                        complete = True
+                        break
+    # Nothing usable in a file cut short (interrupted run)
+    if not complete or len(subsets) != len(scores):
+        return names, []
+
+    labels = np.array(rows, dtype=int)
+    partitions = [{"asap_score": score, "n_subsets": n_subsets, "subset_p_values": p_values, "labels": labels[:, j]}
+                  for j, ((n_subsets, p_values), score) in enumerate(zip(subsets, scores))]
+    return names, _rank_partitions(partitions, res_cvs_path)
@@ -0,0 +1,257 @@
+"""
+Author: Khaoula El Mchachti
+Description: Conspecificity matrix helpers. With soft-core genes (extracted with --min-presence) a strain pair is only
+covered by the genes present in both strains, so pair counts are normalized on the number of shared genes.
+The final matrix is kept in a binary store read by the downstream scripts: the upper triangle (diagonal included) of
+the symmetric matrix, packed row by row in a uint16 .npy file that is memory-mapped on load, with the strain names in
+a <store>.strains.txt sidecar. The dense CSV can still be exported from the store.
+The raw pair counts are kept between runs together with the label vector each gene contributed, so that adding,
+removing or rerunning a few genes updates the counts by a per-gene delta instead of re-summing every gene.
+Date: 2026-10-17
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from cgcd.partitions import ABSENT, conspecificity_counts, count_dtype
+
+STRAINS_SUFFIX = ".strains.txt"
+REBUILD_FRACTION = 0.25  # above this fraction of changed genes, the counts are rebuilt from all label vectors
+
+
+def normalize_by_shared_genes(counts, shared, n_genes):
+    """
+    Rescale pair counts to the full gene set: counts / shared genes * n_genes, rounded to whole genes
+    (0 for pairs never present in the same gene). With strict core genes (shared == n_genes) the counts are unchanged.
+    """
+    counts = np.asarray(counts, dtype=float)
+    shared = np.asarray(shared, dtype=float)
+    scaled = np.zeros_like(counts)
+    np.divide(counts * n_genes, shared, out=scaled, where=shared > 0)
+    return np.rint(scaled).astype(int)
+
+
+def strains_path(store_path):
+    """Sidecar file holding the strain names of a conspecificity store, one per line."""
+    return os.path.splitext(store_path)[0] + STRAINS_SUFFIX
+
+
+def _packed_dtype(max_value):
+    return np.uint16 if max_value <= np.iinfo(np.uint16).max else np.uint32
+
+
+class PackedMatrix:
+    """Symmetric strain x strain matrix stored as its packed upper triangle (row-major, diagonal included)."""
+
+    def __init__(self, packed, strains):
+        self.packed = packed
+        self.strains = list(strains)
+        n = len(self.strains)
+        if len(packed) != n * (n + 1) // 2:
+            raise ValueError(f"Packed matrix of {len(packed)} values does not match {n} strains")
+        # Offset of the first value of every row: row i holds columns i..n-1
+        rows = np.arange(n)
+        self.row_offsets = rows * n - rows * (rows - 1) // 2
+
+    def __len__(self):
+        return len(self.strains)
+
+    def value(self, i, j):
+        """Value of the pair of strains at positions i and j."""
+        i, j = min(i, j), max(i, j)
+        return self.packed[self.row_offsets[i] + j - i]
+
+    def pairs(self):
+        """(i, j, values) of every strain pair i < j, in packed order."""
+        i, j = np.triu_indices(len(self), k=1)
+        keep = np.ones(len(self.packed), dtype=bool)
+        keep[self.row_offsets] = False  # diagonal
+        return i, j, self.packed[keep]
+
+    def dense(self):
+        """Full symmetric matrix (a copy in memory)."""
+        n = len(self)
+        matrix = np.zeros((n, n), dtype=self.packed.dtype)
+        i, j = np.triu_indices(n)
+        matrix[i, j] = self.packed
+        matrix[j, i] = self.packed
+        return matrix
+
+    def to_frame(self):
+        """Dense matrix as a DataFrame indexed by strain, as in the CSV export."""
+        return pd.DataFrame(self.dense(), index=self.strains, columns=self.strains)
+
+
+def write_conspecificity(store_path, matrix, strains):
+    """Save a symmetric conspecificity matrix (strains in the order of its rows) to a packed store and its sidecar."""
+    matrix = np.asarray(matrix)
+    packed = matrix[np.triu_indices(len(matrix))]
+    packed = packed.astype(_packed_dtype(packed.max(initial=0)))
+
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, packed)
+    with open(f"{tmp_path}{STRAINS_SUFFIX}", "w") as f:
+        f.write("".join(f"{strain}\n" for strain in strains))
+    os.replace(f"{tmp_path}{STRAINS_SUFFIX}", strains_path(store_path))
+    os.replace(tmp_path, store_path)
+
+
+def read_conspecificity(store_path, mmap=True):
+    """PackedMatrix of a conspecificity store, memory-mapped (read-only) unless mmap is False."""
+    with open(strains_path(store_path)) as f:
+        strains = [line.rstrip("\n") for line in f]
+    return PackedMatrix(np.load(store_path, mmap_mode="r" if mmap else None), strains)
+
+
+def export_csv(matrix, csv_path):
+    """Write a PackedMatrix as the dense CSV (strain names as header row and first column)."""
+    matrix.to_frame().to_csv(csv_path)
+
+
+def canonical_labels(labels):
+    """Label vector renumbered in order of first appearance, so that equal partitions have equal vectors."""
+    labels = np.asarray(labels, dtype=np.int32)
+    canonical = np.full(len(labels), ABSENT, dtype=np.int32)
+    present = labels != ABSENT
+    values, first = np.unique(labels[present], return_index=True)
+    codes = np.empty(len(values), dtype=np.int32)
+    codes[np.argsort(first)] = np.arange(len(values), dtype=np.int32)
+    canonical[present] = codes[np.searchsorted(values, labels[present])]
+    return canonical
+
+
+class ConspecificityCounts:
+    """
+    Raw pair counts (same: genes placing both strains in the same subset, shared: genes holding both strains) with
+    the label vector counted for every gene, kept in a .npz file next to the conspecificity matrix.
+    """
+
+    def __init__(self, strains=()):
+        self.strains = list(strains)
+        self.strain_index = {strain: i for i, strain in enumerate(self.strains)}
+        self.labels = {}  # gene -> label vector counted, over self.strains
+        n = len(self.strains)
+        self.same = np.zeros((n, n), dtype=np.uint16)
+        self.shared = np.zeros((n, n), dtype=np.uint16)
+
+    @classmethod
+    def load(cls, path):
+        """Counts saved in path, or empty counts when the file does not exist."""
+        if not os.path.isfile(path):
+            return cls()
+        with np.load(path) as saved:
+            counts = cls(saved["strains"].tolist())
+            counts.labels = dict(zip(saved["genes"].tolist(), saved["labels"]))
+            counts.same = saved["same"]
+            counts.shared = saved["shared"]
+        return counts
+
+    def save(self, path):
+        genes = list(self.labels)
+        labels = np.array([self.labels[gene] for gene in genes], dtype=np.int32).reshape(len(genes), len(self.strains))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, strains=np.array(self.strains, dtype=str), genes=np.array(genes, dtype=str), labels=labels,
+                     same=self.same, shared=self.shared)
+        os.replace(tmp_path, path)
+
+    def add_strains(self, strains):
+        """Append new strains (absent from every counted gene) to the counts."""
+        new = [strain for strain in dict.fromkeys(strains) if strain not in self.strain_index]
+        if not new:
+            return
+        for strain in new:
+            self.strain_index[strain] = len(self.strains)
+            self.strains.append(strain)
+        grow = len(new)
+        self.same = np.pad(self.same, ((0, grow), (0, grow)))
+        self.shared = np.pad(self.shared, ((0, grow), (0, grow)))
+        self.labels = {gene: np.pad(labels, (0, grow), constant_values=ABSENT) for gene, labels in self.labels.items()}
+
+    def _apply(self, labels, sign):
+        """Add (sign 1) or subtract (sign -1) the pair counts of one label vector."""
+        present = labels != ABSENT
+        shared = present[:, None] & present[None, :]
+        same = (labels[:, None] == labels[None, :]) & shared
+        if sign > 0:
+            self.same += same
+            self.shared += shared
+        else:
+            self.same -= same
+            self.shared -= shared
+
+    def _widen(self, n_genes):
+        """Switch to a wider count type when n_genes no longer fits in the current one."""
+        dtype = count_dtype(n_genes)
+        if np.iinfo(dtype).max > np.iinfo(self.same.dtype).max:
+            self.same = self.same.astype(dtype)
+            self.shared = self.shared.astype(dtype)
+
+    def add(self, gene, labels):
+        """Count a new gene (labels over self.strains)."""
+        if gene in self.labels:
+            raise ValueError(f"Gene {gene} is already counted")
+        self._widen(len(self.labels) + 1)
+        labels = canonical_labels(labels)
+        self._apply(labels, 1)
+        self.labels[gene] = labels
+
+    def remove(self, gene):
+        """Subtract the counts of a gene, using the label vector it was counted with."""
+        self._apply(self.labels.pop(gene), -1)
+
+    def replace(self, gene, labels):
+        """Update a rerun gene with its new label vector."""
+        self.remove(gene)
+        self.add(gene, labels)
+
+    def rebuild(self):
+        """Recount every gene from its label vector."""
+        labels = np.array(list(self.labels.values()), dtype=np.int32).reshape(len(self.labels), len(self.strains))
+        self.same, self.shared = conspecificity_counts(labels)
+
+    def update(self, genes, strains, labels):
+        """
+        Bring the counts in line with a partition store (genes, strains and labels as from read_partitions): new
+        genes are added, genes whose partition changed are replaced and genes no longer in the store are removed.
+        Returns the (added, replaced, removed) gene lists.
+        """
+        self.add_strains(strains)
+        columns = [self.strain_index[strain] for strain in strains]
+        current = {}
+        for gene, gene_labels in zip(genes, labels):
+            aligned = np.full(len(self.strains), ABSENT, dtype=np.int32)
+            aligned[columns] = gene_labels
+            current[gene] = canonical_labels(aligned)
+
+        removed = [gene for gene in self.labels if gene not in current]
+        added = [gene for gene in current if gene not in self.labels]
+        replaced = [gene for gene in current
+                    if gene in self.labels and not np.array_equal(current[gene], self.labels[gene])]
+
+        if len(added) + len(replaced) + len(removed) > REBUILD_FRACTION * max(len(current), 1):
+            # Many changes (e.g. the first run): one vectorized pass over all genes is faster than the deltas
+            self.labels = current
+            self.rebuild()
+        else:
+            for gene in removed:
+                self.remove(gene)
+            for gene in replaced:
+                self.replace(gene, current[gene])
+            for gene in added:
+                self.add(gene, current[gene])
+        return added, replaced, removed
+
+    def matrices(self, strains):
+        """(same, shared) counts restricted to strains, in that order; strains never counted get zeros."""
+        n = len(strains)
+        same = np.zeros((n, n), dtype=self.same.dtype)
+        shared = np.zeros((n, n), dtype=self.shared.dtype)
+        known = [i for i, strain in enumerate(strains) if strain in self.strain_index]
+        index = [self.strain_index[strains[i]] for i in known]
+        same[np.ix_(known, known)] = self.same[np.ix_(index, index)]
+        shared[np.ix_(known, known)] = self.shared[np.ix_(index, index)]
+        return same, shared
@@ -0,0 +1,341 @@
+"""
+Author: Khaoula El Mchachti
+Description: Vectorized pairwise distances of an alignment, shared by the ABGD and ASAP stages. Sequences are encoded
+as uint8 nucleotide codes (A, C, G, T = 0-3, anything else = missing), and the per-pair counts (compared sites,
+identical sites, A<->G and C<->T transitions) of all pairs are obtained with a few one-hot matrix products, computed
+by blocks of alignment columns. Gaps, N and ambiguity codes are masked pairwise (or, with complete deletion, every
+column holding one is dropped). p-distance, JC69, K80 and TN93 are computed for all pairs at once, and the matrices
+can be kept in a content-addressed .npy cache (keyed on the alignment file and the model, bounded in size), so reruns
+and both delimitation methods reuse them. The matrices are handed to the abgd and asap executables as phylip files,
+for the genes on which they equal the executables' own JC69: alignments of nucleotides, gaps and N only (the
+executables count ambiguity codes as partial matches) and without a pair beyond p = 0.74 (where ABGD and ASAP cap
+saturated pairs differently). Other genes keep their alignment as input.
+Date: 2026-10-17
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+MODELS = ("p", "jc69", "k80", "tn93")
+MISSING = 4
+BLOCK_SITES = 4096
+
+# Largest p-distance treated alike by the executables: ABGD caps p above 0.74 to 0.74, ASAP only p >= 0.75
+MAX_SHARED_P = 0.74
+MODEL_SUFFIX = ".model"  # sidecar of a phylip file holding the model of its distances
+MAX_P_SUFFIX = ".max_p"  # sidecar of a cached matrix holding the largest p-distance of the alignment
+
+# uint8 code of every byte: A, C, G, T (either case) = 0-3, anything else (gap, N, ambiguity) = MISSING
+_CODES = np.full(256, MISSING, dtype=np.uint8)
+for _code, _bases in enumerate(("Aa", "Cc", "Gg", "Tt")):
+    for _base in _bases:
+        _CODES[ord(_base)] = _code
+
+
+def read_fasta(fasta_path):
+    """Names and sequences (bytes) of a FASTA file, in file order."""
+    names, sequences, current = [], [], []
+    with open(fasta_path, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if names:
+                    sequences.append(b"".join(current))
+                names.append(line[1:].split()[0].decode() if line[1:].strip() else "")
+                current = []
+            else:
+                current.append(line.strip())
+    if names:
+        sequences.append(b"".join(current))
+    return names, sequences
+
+
+# Characters the executables skip pairwise like this module (gap, N) besides the nucleotides; any other character
+# (ambiguity code, "?", ...) is compared with compare_DNA by the executables
+_SHARED_CHARS = np.zeros(256, dtype=bool)
+for _char in b"ACGTNacgtn-":
+    _SHARED_CHARS[_char] = True
+
+
+def has_only_shared_chars(sequences):
+    """True when the sequences hold nucleotides, gaps and N only."""
+    return all(_SHARED_CHARS[np.frombuffer(seq, dtype=np.uint8)].all() for seq in sequences)
+
+
+def encode_alignment(sequences):
+    """n x length uint8 array of nucleotide codes; shorter sequences are padded with missing sites."""
+    length = max((len(seq) for seq in sequences), default=0)
+    codes = np.full((len(sequences), length), MISSING, dtype=np.uint8)
+    for i, seq in enumerate(sequences):
+        codes[i, :len(seq)] = _CODES[np.frombuffer(seq, dtype=np.uint8)]
+    return codes
+
+
+def pair_counts(codes, block_sites=BLOCK_SITES):
+    """
+    Per-pair site counts of an encoded alignment, as n x n int64 arrays:
+    sites (both sequences have a nucleotide), same (identical nucleotides), ag and ct (A<->G, C<->T transitions).
+    Columns are processed by blocks of block_sites, so the one-hot matrices stay small for long genes.
+    """
+    n, length = codes.shape
+    counts = {key: np.zeros((n, n), dtype=np.float64) for key in ("sites", "same", "ag", "ct")}
+    for start in range(0, length, block_sites):
+        block = codes[:, start:start + block_sites]
+        one_hot = [(block == code).astype(np.float32) for code in range(4)]
+        stacked = np.concatenate(one_hot, axis=1)
+        valid = sum(one_hot)
+        counts["same"] += stacked @ stacked.T
+        counts["sites"] += valid @ valid.T
+        counts["ag"] += one_hot[0] @ one_hot[2].T
+        counts["ct"] += one_hot[1] @ one_hot[3].T
+    counts = {key: np.rint(value).astype(np.int64) for key, value in counts.items()}
+    counts["ag"] += counts["ag"].T
+    counts["ct"] += counts["ct"].T
+    return counts
+
+
+def base_frequencies(codes):
+    """Frequencies of A, C, G, T over the whole alignment (missing sites ignored)."""
+    counts = np.bincount(codes.ravel(), minlength=MISSING + 1)[:4].astype(np.float64)
+    if counts.sum() == 0:
+        return np.full(4, 0.25)
+    return counts / counts.sum()
+
+
+def _log(x):
+    """Natural log, inf for saturated pairs (non positive arguments)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(x > 0, np.log(np.where(x > 0, x, 1.0)), -np.inf)
+
+
+def distances_from_counts(counts, model="k80", frequencies=None):
+    """
+    n x n distance matrix of a model from pair_counts(). Saturated pairs (log of a non positive number) are inf,
+    pairs without a compared site are nan; the diagonal is 0.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown distance model {model!r}, expected one of {MODELS}")
+    sites = counts["sites"].astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p1 = counts["ag"] / sites
+        p2 = counts["ct"] / sites
+        p = (sites - counts["same"]) / sites
+        q = p - p1 - p2
+        if model == "p":
+            dist = p
+        elif model == "jc69":
+            dist = -0.75 * _log(1 - 4.0 / 3.0 * p)
+        elif model == "k80":
+            dist = -0.5 * _log(1 - 2 * (p1 + p2) - q) - 0.25 * _log(1 - 2 * q)
+        else:
+            g_a, g_c, g_g, g_t = np.full(4, 0.25) if frequencies is None else frequencies
+            g_r, g_y = g_a + g_g, g_c + g_t
+            k1 = 2 * g_a * g_g / g_r
+            k2 = 2 * g_c * g_t / g_y
+            k3 = 2 * (g_r * g_y - g_a * g_g * g_y / g_r - g_c * g_t * g_r / g_y)
+            w1 = 1 - p1 / k1 - q / (2 * g_r)
+            w2 = 1 - p2 / k2 - q / (2 * g_y)
+            w3 = 1 - q / (2 * g_r * g_y)
+            dist = -k1 * _log(w1) - k2 * _log(w2) - k3 * _log(w3)
+    dist = np.where(sites > 0, dist + 0.0, np.nan)  # + 0.0: -0 -> 0
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+
+def distance_matrix(codes, model="k80", complete_deletion=False, block_sites=BLOCK_SITES):
+    """
+    Pairwise distance matrix (n x n, float64) of an encoded alignment. Missing sites are removed pairwise, or from
+    every sequence with complete_deletion.
+    """
+    if complete_deletion:
+        codes = codes[:, (codes != MISSING).all(axis=0)]
+    counts = pair_counts(codes, block_sites)
+    return distances_from_counts(counts, model, base_frequencies(codes) if model == "tn93" else None)
+
+
+def fasta_distance_matrix(fasta_path, model="k80", complete_deletion=False):
+    """Names and pairwise distance matrix of an aligned FASTA file."""
+    names, sequences = read_fasta(fasta_path)
+    return names, distance_matrix(encode_alignment(sequences), model, complete_deletion)
+
+
+class DistanceCache:
+    """
+    Content-addressed store of distance matrices (.npy). An entry is keyed on the SHA-256 of the aligned FASTA
+    (sequences and headers, so the row order is that of the file), the model and the gap treatment. The largest
+    p-distance of the alignment can be kept next to a matrix (<key>.max_p). The cache is bounded to max_bytes,
+    evicting the least recently used matrices first.
+    """
+
+    def __init__(self, cache_dir, max_bytes=4 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, fasta_path, model, complete_deletion=False):
+        digest = hashlib.sha256(f"{model}\0{'complete' if complete_deletion else 'pairwise'}\0".encode())
+        with open(fasta_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def max_p_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{MAX_P_SUFFIX}")
+
+    def load(self, key):
+        """Cached matrix, or None on a cache miss."""
+        cached = self.path(key)
+        if not os.path.isfile(cached):
+            return None
+        os.utime(cached)  # mark as recently used
+        return np.load(cached)
+
+    def load_max_p(self, key):
+        """Largest p-distance stored with a matrix, or None when there is none."""
+        if not os.path.isfile(self.max_p_path(key)):
+            return None
+        with open(self.max_p_path(key)) as f:
+            return float(f.read())
+
+    def store(self, key, matrix, max_p=None):
+        """Add a matrix to the cache, with the largest p-distance of its alignment when given."""
+        if max_p is not None:
+            tmp_path = f"{self.max_p_path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(f"{max_p!r}\n")
+            os.replace(tmp_path, self.max_p_path(key))
+        tmp_path = f"{self.path(key)}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, matrix)
+        os.replace(tmp_path, self.path(key))
+
+    def evict(self):
+        """Remove the least recently used matrices (and their max_p) until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy") and ".tmp" not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            max_p_path = path[:-len(".npy")] + MAX_P_SUFFIX
+            if os.path.isfile(max_p_path):
+                os.remove(max_p_path)
+            total -= size
+            removed += 1
+        return removed
+
+
+def cached_distance_matrix(fasta_path, model="k80", cache=None, complete_deletion=False):
+    """
+    Names and pairwise distance matrix of an aligned FASTA file, taken from the DistanceCache when it holds them
+    (computed and stored otherwise).
+    """
+    names, sequences = read_fasta(fasta_path)
+    if cache is not None:
+        key = cache.key(fasta_path, model, complete_deletion)
+        matrix = cache.load(key)
+        if matrix is not None and len(matrix) == len(names):
+            return names, matrix
+    matrix = distance_matrix(encode_alignment(sequences), model, complete_deletion)
+    if cache is not None:
+        cache.store(key, matrix)
+    return names, matrix
+
+
+def shared_matrix(fasta_path, model="jc69", cache=None):
+    """
+    Names, distance matrix and largest p-distance (nan when a pair has no common site) of an aligned FASTA file. Both
+    come from the same pair counts, or from the DistanceCache; the p-distances themselves are not kept.
+    """
+    names, sequences = read_fasta(fasta_path)
+    if cache is not None:
+        key = cache.key(fasta_path, model)
+        matrix, max_p = cache.load(key), cache.load_max_p(key)
+        if matrix is not None and max_p is not None and len(matrix) == len(names):
+            return names, matrix, max_p
+    codes = encode_alignment(sequences)
+    counts = pair_counts(codes)
+    matrix = distances_from_counts(counts, model, base_frequencies(codes) if model == "tn93" else None)
+    max_p = float(distances_from_counts(counts, "p").max()) if len(names) else 0.0
+    if cache is not None:
+        cache.store(key, matrix, max_p)
+    return names, matrix, max_p
+
+
+def write_phylip(names, matrix, path):
+    """Write a square phylip distance matrix (the format read by the abgd and asap executables)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{len(names)}\n")
+        for name, row in zip(names, matrix):
+            f.write(name + " " + " ".join(f"{value:.10f}" for value in row) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_phylip(path):
+    """Names and matrix of a square phylip distance file."""
+    with open(path) as f:
+        n = int(f.readline())
+        names, rows = [], []
+        for _ in range(n):
+            fields = f.readline().split()
+            names.append(fields[0])
+            rows.append([float(value) for value in fields[1:n + 1]])
+    return names, np.array(rows)
+
+
+def _read_model(phylip_path):
+    """Model recorded next to a phylip file ("" when there is no sidecar)."""
+    model_path = f"{phylip_path}{MODEL_SUFFIX}"
+    if not os.path.isfile(model_path):
+        return ""
+    with open(model_path) as f:
+        return f.read().strip()
+
+
+def write_distance_file(fasta_path, phylip_path, model="jc69", cache=None):
+    """
+    Phylip distance file of an aligned FASTA file, so that several methods use the same distances. It is only
+    rewritten when older than the alignment or computed with another model (recorded in <phylip>.model), and the
+    matrix itself comes from the DistanceCache when possible.
+    Returns False (and writes nothing) when the executables would not compute the same distances from the alignment:
+    ambiguity codes, a pair beyond MAX_SHARED_P, or an undefined distance (no common site).
+    """
+    if (os.path.isfile(phylip_path) and os.path.getmtime(phylip_path) >= os.path.getmtime(fasta_path)
+            and _read_model(phylip_path) == model):
+        return True
+
+    shared = has_only_shared_chars(read_fasta(fasta_path)[1])
+    if shared:
+        names, matrix, max_p = shared_matrix(fasta_path, model, cache)
+        shared = np.isfinite(matrix).all() and max_p <= MAX_SHARED_P
+    if not shared:
+        for path in (phylip_path, f"{phylip_path}{MODEL_SUFFIX}"):
+            if os.path.isfile(path):
+                os.remove(path)
+        return False
+
+    write_phylip(names, matrix, phylip_path)
+    tmp_path = f"{phylip_path}{MODEL_SUFFIX}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{model}\n")
+    os.replace(tmp_path, f"{phylip_path}{MODEL_SUFFIX}")
+    return True
+
+
+def distance_input(fasta_path, distance_dir, model="jc69", cache=None):
+    """
+    File to hand to abgd/asap for one gene: its shared distance matrix <distance_dir>/<gene>.phy, or the alignment
+    itself when the executables would not compute the same distances (see write_distance_file).
+    """
+    gene_name = os.path.splitext(os.path.basename(fasta_path))[0]
+    phylip_path = os.path.join(distance_dir, f"{gene_name}.phy")
+    return phylip_path if write_distance_file(fasta_path, phylip_path, model, cache) else fasta_path
@@ -0,0 +1,300 @@
+"""
+Author: Khaoula El Mchachti
+Description: Core-gene extraction engine. Each Prokka .ffn file is read once per run: either scanned into a
+locus-tag -> byte-offset index (gene-major mode) or streamed straight into the core-gene FASTA files (strain-major mode).
+Roary locus tags are resolved with exact record-ID hash lookups; an optional prefix-tolerant fallback accepts
+record IDs such as gnl|CENTRE|ABC_00012 (prokka --compliant). Every resolution is counted as exact, fallback or not found.
+Date: 2026-10-17
+"""
+
+import os
+import multiprocessing
+from collections import Counter
+from contextlib import nullcontext
+from io import StringIO
+
+import pandas as pd
+from Bio import SeqIO
+
+
+def split_gene_ids(gene_ids_str):
+    """Split a Roary cell into locus tags (IDs are separated by semicolons or spaces)."""
+    return [g.strip() for g in str(gene_ids_str).replace(";", " ").split() if g.strip()]
+
+
+def strain_ffn_path(prokka_base_dir, strain):
+    """Path to the Prokka nucleotide file of one strain."""
+    return os.path.join(prokka_base_dir, strain, f"{strain}.ffn")
+
+
+def strip_id_prefix(record_id):
+    """Locus tag of a record ID carrying a database prefix (gnl|CENTRE|ABC_00012 -> ABC_00012)."""
+    return record_id.rsplit("|", 1)[-1]
+
+
+def scan_ffn(ffn_path):
+    """Yield (record_id, start, end, raw) for every record of a FASTA file, in one sequential read."""
+    record_id, start, lines = None, 0, []
+    pos = 0
+    with open(ffn_path, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if record_id is not None:
+                    yield record_id, start, pos, b"".join(lines)
+                title = line[1:].split(None, 1)
+                record_id, start, lines = (title[0].decode() if title else ""), pos, []
+            if record_id is not None:
+                lines.append(line)
+            pos += len(line)
+    if record_id is not None:
+        yield record_id, start, pos, b"".join(lines)
+
+
+def match_records(ffn_path, wanted, prefix_fallback=False, keep_raw=False):
+    """
+    Stream a .ffn once and hash the records whose ID is one of the wanted locus tags (first record per ID).
+    Returns (exact, fallback): tag -> raw bytes if keep_raw, else tag -> (start, end) byte offsets.
+    fallback is only filled with prefix_fallback, for records matching a tag once their ID prefix is stripped.
+    """
+    exact, fallback = {}, {}
+    for record_id, start, end, raw in scan_ffn(ffn_path):
+        value = raw if keep_raw else (start, end)
+        if record_id in wanted:
+            exact.setdefault(record_id, value)
+        elif prefix_fallback:
+            tag = strip_id_prefix(record_id)
+            if tag in wanted:
+                fallback.setdefault(tag, value)
+    return exact, fallback
+
+
+def select_record(tags, exact, fallback):
+    """
+    The first listed locus tag present in the .ffn is selected; for each tag the exact record ID wins over
+    the prefix-tolerant match. Returns (value, match) with match in "exact", "fallback", "not found".
+    """
+    for tag in tags:
+        if tag in exact:
+            return exact[tag], "exact"
+        if tag in fallback:
+            return fallback[tag], "fallback"
+    return None, "not found"
+
+
+def parse_record(raw):
+    """Parse the raw bytes of a single FASTA record."""
+    return SeqIO.read(StringIO(raw.decode()), "fasta")
+
+
+def read_ffn_span(ffn_path, start, end):
+    """Parse the record stored between two byte offsets of a FASTA file."""
+    with open(ffn_path, "rb") as f:
+        f.seek(start)
+        return parse_record(f.read(end - start))
+
+
+def strain_fasta(record, strain):
+    """FASTA text of a record with its header renamed to the strain."""
+    record.id = strain
+    record.description = ""
+    return record.format("fasta")
+
+
+class FastaWriterPool:
+    """
+    Buffers FASTA text per output file and flushes it in bulk, so thousands of core-gene files can be
+    filled without keeping one open file handle per gene. A file is truncated on its first flush.
+    """
+
+    def __init__(self, max_buffered_bytes=64 * 1024 * 1024):
+        self.max_buffered_bytes = max_buffered_bytes
+        self.buffers = {}
+        self.buffered_bytes = 0
+        self.started = set()
+
+    def write(self, path, text):
+        self.buffers.setdefault(path, []).append(text)
+        self.buffered_bytes += len(text)
+        if self.buffered_bytes >= self.max_buffered_bytes:
+            self.flush()
+
+    def flush(self):
+        for path, chunks in self.buffers.items():
+            with open(path, "a" if path in self.started else "w") as out:
+                out.writelines(chunks)
+            self.started.add(path)
+        self.buffers = {}
+        self.buffered_bytes = 0
+
+
+class FfnIndex:
+    """Byte offsets of the records of one Prokka .ffn file, for the requested locus tags only."""
+
+    def __init__(self, ffn_path, wanted, prefix_fallback=False):
+        self.path = ffn_path
+        self.exact, self.fallback = match_records(ffn_path, wanted, prefix_fallback)
+
+    def lookup(self, tags):
+        """Return (SeqRecord or None, match) for the first listed locus tag found in the file."""
+        span, match = select_record(tags, self.exact, self.fallback)
+        if span is None:
+            return None, match
+        return read_ffn_span(self.path, *span), match
+
+
+def build_ffn_indexes(core_genes, strain_columns, prokka_base_dir, prefix_fallback=False):
+    """Index every available strain .ffn once, keeping only the locus tags listed for the core genes."""
+    indexes = {}
+    for strain in strain_columns:
+        strain_ffn = strain_ffn_path(prokka_base_dir, strain)
+        if not os.path.isfile(strain_ffn):
+            continue
+        wanted = set()
+        for gene_ids_str in core_genes[strain].dropna():
+            wanted.update(split_gene_ids(gene_ids_str))
+        indexes[strain] = FfnIndex(strain_ffn, wanted, prefix_fallback)
+    return indexes
+
+
+def core_gene_names(core_genes):
+    """Output name of every core gene (Roary's unnamed groups become group_<row number>)."""
+    return [gene if pd.notna(gene) else f"group_{idx+1}" for idx, gene in core_genes["Gene"].items()]
+
+
+def extract_core_genes(core_genes, strain_columns, prokka_base_dir, output_dir,
+                       strain_major=False, workers=1, prefix_fallback=False):
+    """
+    Write one FASTA file per core gene (headers renamed to the strain) into output_dir.
+    Returns the missing-data rows (Gene, Strain, Reason) for missing_genes_log.csv and a Counter of how the
+    locus tags were resolved ("exact", "fallback", "not found").
+    Gene-major (default) fills one gene file at a time from the per-strain indexes; strain-major streams
+    every .ffn once and distributes its records over all gene files. Several workers imply strain-major.
+    All modes write identical outputs.
+    """
+    if strain_major or workers > 1:
+        return extract_strain_major(core_genes, strain_columns, prokka_base_dir, output_dir,
+                                    workers=workers, prefix_fallback=prefix_fallback)
+    return extract_gene_major(core_genes, strain_columns, prokka_base_dir, output_dir,
+                              prefix_fallback=prefix_fallback)
+
+
+def extract_gene_major(core_genes, strain_columns, prokka_base_dir, output_dir, prefix_fallback=False):
+    """Gene-major extraction: one pass over the core genes, resolving each strain through its .ffn index."""
+    print(f"Indexing Prokka .ffn files of {len(strain_columns)} strains...")
+    indexes = build_ffn_indexes(core_genes, strain_columns, prokka_base_dir, prefix_fallback)
+
+    missing_data = []
+    match_counts = Counter()
+
+    for gene_name, (_, row) in zip(core_gene_names(core_genes), core_genes.iterrows()):
+        output_fasta = os.path.join(output_dir, f"{gene_name}.fasta")
+        sequences_written = 0
+
+        with open(output_fasta, "w") as out_fasta:
+            for strain in strain_columns:
+                gene_ids_str = row[strain]
+
+                # Check whether Roary contains a gene ID
+                if pd.isna(gene_ids_str):
+                    missing_data.append((gene_name, strain, "Missing gene ID in Roary"))
+                    continue
+
+                # Check .ffn file
+                index = indexes.get(strain)
+                if index is None:
+                    missing_data.append((gene_name, strain, "Missing .ffn file"))
+                    continue
+
+                record, match = index.lookup(split_gene_ids(gene_ids_str))
+                match_counts[match] += 1
+
+                # Gene ID was not found in Prokka .ffn
+                if record is None:
+                    missing_data.append((gene_name, strain, "Gene ID not found in .ffn"))
+                    continue
+
+                out_fasta.write(strain_fasta(record, strain))
+                print(f"{gene_name}  {strain} (selected {record.id})")
+                sequences_written += 1
+
+        # Remove empty FASTA files
+        if sequences_written == 0:
+            os.remove(output_fasta)
+
+    return missing_data, match_counts
+
+
+def extract_strain(task):
+    """
+    Resolve the core-gene records of one strain with a single sequential read of its .ffn.
+    task is (strain, [(gene position, Roary cell of that strain)], prokka_base_dir, prefix_fallback);
+    runs in worker processes. Returns the FASTA text per gene position, the missing entries as
+    (gene position, reason) and the Counter of locus-tag resolutions.
+    """
+    strain, gene_cells, prokka_base_dir, prefix_fallback = task
+    sequences, missing = [], []
+    match_counts = Counter()
+
+    # Locus tags listed by Roary for this strain, per core gene
+    listed = {}
+    for g_pos, gene_ids_str in gene_cells:
+        if pd.isna(gene_ids_str):
+            missing.append((g_pos, "Missing gene ID in Roary"))
+        else:
+            listed[g_pos] = split_gene_ids(gene_ids_str)
+
+    strain_ffn = strain_ffn_path(prokka_base_dir, strain)
+    if not os.path.isfile(strain_ffn):
+        missing.extend((g_pos, "Missing .ffn file") for g_pos in listed)
+        return sequences, missing, match_counts
+
+    # Stream the .ffn once, keeping the records requested by any core gene
+    wanted = {tag for tags in listed.values() for tag in tags}
+    exact, fallback = match_records(strain_ffn, wanted, prefix_fallback, keep_raw=True)
+
+    for g_pos, tags in listed.items():
+        raw, match = select_record(tags, exact, fallback)
+        match_counts[match] += 1
+        if raw is None:
+            missing.append((g_pos, "Gene ID not found in .ffn"))
+        else:
+            sequences.append((g_pos, strain_fasta(parse_record(raw), strain)))
+
+    return sequences, missing, match_counts
+
+
+def extract_strain_major(core_genes, strain_columns, prokka_base_dir, output_dir, workers=1, prefix_fallback=False):
+    """
+    Strain-major extraction: a single sequential read of each .ffn feeds every core-gene file.
+    With workers > 1 the strains are resolved in a process pool; results are consumed in strain order,
+    so the output is identical to the serial run.
+    """
+    gene_names = core_gene_names(core_genes)
+    gene_paths = [os.path.join(output_dir, f"{name}.fasta") for name in gene_names]
+    writer = FastaWriterPool()
+    match_counts = Counter()
+
+    # Missing entries as (gene position, strain position, reason), sorted into gene-major order at the end
+    missing = []
+
+    tasks = ((strain, list(enumerate(core_genes[strain].tolist())), prokka_base_dir, prefix_fallback)
+             for strain in strain_columns)
+    with multiprocessing.Pool(workers) if workers > 1 else nullcontext() as pool:
+        results = pool.imap(extract_strain, tasks) if pool else map(extract_strain, tasks)
+
+        for s_pos, (sequences, strain_missing, strain_counts) in enumerate(results):
+            for g_pos, text in sequences:
+                writer.write(gene_paths[g_pos], text)
+            missing.extend((g_pos, s_pos, reason) for g_pos, reason in strain_missing)
+            match_counts.update(strain_counts)
+            print(f"{strain_columns[s_pos]}: {len(sequences)} core gene sequences extracted")
+
+    writer.flush()
+
+    # Genes without any sequence get no FASTA file (remove leftovers from earlier runs)
+    for path in gene_paths:
+        if path not in writer.started and os.path.isfile(path):
+            os.remove(path)
+
+    missing_data = [(gene_names[g_pos], strain_columns[s_pos], reason) for g_pos, s_pos, reason in sorted(missing)]
+    return missing_data, match_counts
@@ -0,0 +1,125 @@
+"""
+Author: Khaoula El Mchachti
+Description: Haplotype deduplication. Identical sequences of a core gene are collapsed into one haplotype before
+alignment, so MAFFT, ABGD and ASAP only process the distinct sequences. Each haplotype is named after the first strain
+carrying it, and the haplotype -> strain map is saved so the ABGD/ASAP partitions can be expanded back to strains.
+Genes whose strains all share one sequence are not delimited at all: they are one group, added from the map.
+ABGD and ASAP find their thresholds in the distribution of pairwise distances, and collapsing removes the zero
+distances between strains sharing a sequence. With few haplotypes left this changes their partitions (ABGD finds no
+barcode gap, ASAP aborts on two sequences), so a gene is only collapsed when it keeps at least MIN_HAPLOTYPES distinct
+sequences; smaller genes are written unchanged, each strain being its own haplotype in the map.
+Date: 2026-10-17
+"""
+
+import os
+from collections import defaultdict
+
+import pandas as pd
+from Bio import SeqIO
+
+HAPLOTYPE_MAP_NAME = "haplotype_map.csv"
+
+# Fewest distinct sequences for which collapsing left the ABGD and ASAP partitions unchanged on simulated genes
+MIN_HAPLOTYPES = 20
+
+
+def collapse_fasta(input_path, output_path, min_haplotypes=MIN_HAPLOTYPES):
+    """
+    Write the distinct sequences of a FASTA file, each under the name of its first strain, or every sequence unchanged
+    when there are fewer than min_haplotypes distinct ones. Returns {haplotype: [strains]}.
+    Nothing is written for a gene whose strains all share one sequence.
+    """
+    records = list(SeqIO.parse(input_path, "fasta"))
+    haplotypes = {}  # sequence -> haplotype record
+    members = {}
+    for record in records:
+        sequence = str(record.seq).upper()
+        if sequence in haplotypes:
+            members[haplotypes[sequence].id].append(record.id)
+        else:
+            haplotypes[sequence] = record
+            members[record.id] = [record.id]
+
+    if len(haplotypes) < 2:
+        return members
+    if len(haplotypes) < min_haplotypes:
+        # Too few haplotypes to collapse without changing the partitions
+        members = {record.id: [record.id] for record in records}
+    else:
+        records = list(haplotypes.values())
+
+    with open(output_path, "w") as out:
+        for record in records:
+            record.description = ""
+            out.write(record.format("fasta"))
+    return members
+
+
+def dedup_fastas(input_dir, output_dir, map_path, min_haplotypes=MIN_HAPLOTYPES):
+    """
+    Collapse every <gene>.fasta of input_dir into output_dir and save the haplotype map (Gene, Haplotype, Strain).
+    Returns the number of sequences before and after deduplication, the genes with a single haplotype (left out
+    of output_dir) and the genes written unchanged (fewer than min_haplotypes haplotypes, or no shared sequence).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for fasta_file in os.listdir(output_dir):
+        if fasta_file.endswith(".fasta"):
+            os.remove(os.path.join(output_dir, fasta_file))  # genes of an earlier run
+
+    rows = []
+    single_genes, kept_genes = [], []
+    n_sequences = n_haplotypes = 0
+    for fasta_file in sorted(os.listdir(input_dir)):
+        if not fasta_file.endswith(".fasta"):
+            continue
+        gene = os.path.splitext(fasta_file)[0]
+        members = collapse_fasta(os.path.join(input_dir, fasta_file), os.path.join(output_dir, fasta_file),
+                                 min_haplotypes)
+        for haplotype, strains in members.items():
+            rows.extend((gene, haplotype, strain) for strain in strains)
+            n_sequences += len(strains)
+        n_haplotypes += len(members)
+        if len(members) == 1:
+            single_genes.append(gene)
+        elif all(len(strains) == 1 for strains in members.values()):
+            kept_genes.append(gene)
+
+    pd.DataFrame(rows, columns=["Gene", "Haplotype", "Strain"]).to_csv(map_path, index=False)
+    return n_sequences, n_haplotypes, single_genes, kept_genes
+
+
+def load_haplotype_map(map_path):
+    """Haplotype map as {gene: {haplotype: [strains]}}; empty when the alignments were not deduplicated."""
+    haplotype_map = defaultdict(lambda: defaultdict(list))
+    if not os.path.isfile(map_path):
+        return {}
+    for row in pd.read_csv(map_path, dtype=str).itertuples(index=False):
+        haplotype_map[row.Gene][row.Haplotype].append(row.Strain)
+    return haplotype_map
+
+
+def gene_members(haplotype_map, gene_folder):
+    """Haplotype -> strains of one gene; ABGD/ASAP folders are named after the alignment (<gene>_aligned)."""
+    gene = gene_folder[:-len("_aligned")] if gene_folder.endswith("_aligned") else gene_folder
+    return haplotype_map.get(gene, {})
+
+
+def single_haplotype_partitions(haplotype_map):
+    """
+    One-group partition {gene_folder: {strain: group}} of every gene with a single haplotype, named like the ABGD/ASAP
+    folders (<gene>_aligned); these genes have no alignment and no ABGD/ASAP results.
+    """
+    return {
+        f"{gene}_aligned": {strain: "1" for strain in sorted(next(iter(members.values())))}
+        for gene, members in haplotype_map.items() if len(members) == 1
+    }
+
+
+def expand_groups(groups, members):
+    """Expand {group: [haplotypes]} to {group: [strains]}."""
+    return {group: [strain for name in names for strain in members.get(name, [name])] for group, names in groups.items()}
+
+
+def expand_assignment(group_of, members):
+    """Expand {haplotype: group} to {strain: group}."""
+    return {strain: group for name, group in group_of.items() for strain in members.get(name, [name])}
@@ -0,0 +1,179 @@
+"""
+Author: Khaoula El Mchachti
+Description: Incremental core-gene extraction. A manifest in the output directory records, for every (gene, strain),
+the Roary locus tags, the hash of the strain's .ffn file and the outcome. When genomes are added, genes whose recorded
+strains are unchanged only get the sequences of the new strains appended; genes with changed Roary cells or re-annotated
+strains are rebuilt, and genes that are no longer core are removed and listed as invalidated.
+Date: 2026-10-17
+"""
+
+import os
+import hashlib
+import multiprocessing
+from collections import Counter
+from contextlib import nullcontext
+
+import pandas as pd
+
+from cgcd.extraction import FastaWriterPool, core_gene_names, extract_strain, strain_ffn_path
+
+MANIFEST_NAME = "extraction_manifest.csv"
+HASHES_NAME = "ffn_hashes.csv"
+INVALIDATED_NAME = "invalidated_genes.txt"
+EXTRACTED = "extracted"
+
+
+def file_sha1(path):
+    """SHA-1 of a file's content."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ffn_hashes(strain_columns, prokka_base_dir, cache_path):
+    """
+    Content hash of every available strain .ffn ("" when the file is missing). Hashes are cached with the file
+    size and modification time, so only new or modified annotation files are read.
+    """
+    cache = {}
+    if os.path.isfile(cache_path):
+        for row in pd.read_csv(cache_path, dtype={"Strain": str, "Hash": str}).itertuples(index=False):
+            cache[row.Strain] = (row.Size, row.Mtime_ns, row.Hash)
+
+    hashes, rows = {}, []
+    for strain in strain_columns:
+        path = strain_ffn_path(prokka_base_dir, strain)
+        if not os.path.isfile(path):
+            hashes[strain] = ""
+            continue
+        stat = os.stat(path)
+        cached = cache.get(strain)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            hashes[strain] = cached[2]
+        else:
+            hashes[strain] = file_sha1(path)
+        rows.append((strain, stat.st_size, stat.st_mtime_ns, hashes[strain]))
+
+    pd.DataFrame(rows, columns=["Strain", "Size", "Mtime_ns", "Hash"]).to_csv(cache_path, index=False)
+    return hashes
+
+
+def load_manifest(manifest_path):
+    """Previous extraction manifest as {gene: {strain: (roary_ids, source_hash, status)}}."""
+    previous = {}
+    if not os.path.isfile(manifest_path):
+        return previous
+    manifest = pd.read_csv(manifest_path, dtype=str, keep_default_na=False)
+    for row in manifest.itertuples(index=False):
+        previous.setdefault(row.Gene, {})[row.Strain] = (row.Roary_IDs, row.Source_hash, row.Status)
+    return previous
+
+
+def extract_incremental(core_genes, strain_columns, prokka_base_dir, output_dir, workers=1, prefix_fallback=False):
+    """
+    Bring the core-gene FASTA files of output_dir up to date with the current Roary matrix, extracting only the
+    (gene, strain) pairs not covered by the manifest. Appended strains go to the end of existing FASTA files.
+    Returns the missing-data rows (Gene, Strain, Reason) and the Counter of locus-tag resolutions, like
+    extract_core_genes.
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    previous = load_manifest(manifest_path)
+    hashes = ffn_hashes(strain_columns, prokka_base_dir, os.path.join(output_dir, HASHES_NAME))
+
+    gene_names = core_gene_names(core_genes)
+    gene_paths = [os.path.join(output_dir, f"{name}.fasta") for name in gene_names]
+    strain_pos = {strain: s_pos for s_pos, strain in enumerate(strain_columns)}
+    cells = {strain: ["" if pd.isna(c) else str(c) for c in core_genes[strain]] for strain in strain_columns}
+
+    writer = FastaWriterPool()
+    manifest_rows = {}   # (gene position, strain position) -> (roary_ids, source_hash, status)
+    todo = {strain: [] for strain in strain_columns}
+    rebuilt = appended_genes = 0
+
+    # Decide per gene: keep the existing FASTA (and append new strains) or rebuild it
+    for g_pos, (name, path) in enumerate(zip(gene_names, gene_paths)):
+        old = previous.get(name)
+        up_to_date = old is not None and all(
+            strain in strain_pos and cells[strain][g_pos] == roary_ids and hashes[strain] == source_hash
+            for strain, (roary_ids, source_hash, _) in old.items()
+        )
+        has_sequences = old is not None and any(status == EXTRACTED for _, _, status in old.values())
+        if up_to_date and os.path.isfile(path) != has_sequences:
+            up_to_date = False
+
+        if up_to_date:
+            for strain, entry in old.items():
+                manifest_rows[(g_pos, strain_pos[strain])] = entry
+            new_strains = [strain for strain in strain_columns if strain not in old]
+            if has_sequences:
+                writer.started.add(path)  # append to the existing file
+            if new_strains:
+                appended_genes += 1
+        else:
+            new_strains = list(strain_columns)
+            rebuilt += 1
+
+        for strain in new_strains:
+            todo[strain].append(g_pos)
+
+    # Extract the pending (gene, strain) pairs, one sequential read per strain .ffn
+    match_counts = Counter()
+    tasks = [
+        (strain, [(g_pos, core_genes[strain].iat[g_pos]) for g_pos in todo[strain]], prokka_base_dir, prefix_fallback)
+        for strain in strain_columns if todo[strain]
+    ]
+    with multiprocessing.Pool(workers) if workers > 1 else nullcontext() as pool:
+        results = pool.imap(extract_strain, tasks) if pool else map(extract_strain, tasks)
+
+        for task, (sequences, strain_missing, strain_counts) in zip(tasks, results):
+            strain = task[0]
+            s_pos = strain_pos[strain]
+            for g_pos, text in sequences:
+                writer.write(gene_paths[g_pos], text)
+                manifest_rows[(g_pos, s_pos)] = (cells[strain][g_pos], hashes[strain], EXTRACTED)
+            for g_pos, reason in strain_missing:
+                manifest_rows[(g_pos, s_pos)] = (cells[strain][g_pos], hashes[strain], reason)
+            match_counts.update(strain_counts)
+            print(f"{strain}: {len(sequences)} core gene sequences extracted")
+
+    writer.flush()
+
+    # Genes without any sequence get no FASTA file (remove leftovers from earlier runs)
+    for path in gene_paths:
+        if path not in writer.started and os.path.isfile(path):
+            os.remove(path)
+
+    # Genes of the previous run that are no longer core are invalidated
+    current = set(gene_names)
+    invalidated = sorted(name for name in previous if name not in current)
+    for name in invalidated:
+        path = os.path.join(output_dir, f"{name}.fasta")
+        if os.path.isfile(path):
+            os.remove(path)
+    with open(os.path.join(output_dir, INVALIDATED_NAME), "w") as f:
+        f.writelines(f"{name}\n" for name in invalidated)
+
+    # Save the updated manifest
+    ordered = sorted(manifest_rows.items())
+    pd.DataFrame(
+        [(gene_names[g_pos], strain_columns[s_pos], *entry) for (g_pos, s_pos), entry in ordered],
+        columns=["Gene", "Strain", "Roary_IDs", "Source_hash", "Status"]
+    ).to_csv(manifest_path, index=False)
+
+    print(f"Incremental extraction: {len(gene_names) - rebuilt} genes kept ({appended_genes} with new strains appended), "
+          f"{rebuilt} genes rebuilt, {len(invalidated)} genes invalidated (listed in {INVALIDATED_NAME})")
+
+    missing_data = [
+        (gene_names[g_pos], strain_columns[s_pos], status)
+        for (g_pos, s_pos), (_, _, status) in ordered if status != EXTRACTED
+    ]
+    return missing_data, match_counts
+
+
+def discard_manifest(output_dir):
+    """Remove the manifest after a full (non-incremental) run, whose outputs it no longer describes."""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.isfile(manifest_path):
+        os.remove(manifest_path)
@@ -0,0 +1,71 @@
+"""
+Author: Khaoula El Mchachti
+Description: Bounded pool of external delimitation jobs (ABGD, ASAP). Commands run concurrently, at most `jobs`
+at a time, and every job is recorded with its exit status, wall time and peak memory; a summary table is printed
+at the end.
+Date: 2026-10-17
+"""
+
+import time
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from cgcd.scheduler import process_memory_mb
+
+JOB_COLUMNS = ["Gene", "Status", "Exit_code", "Wall_time_s", "Peak_RSS_MB"]
+
+
+def run_command(name, cmd, cwd=None, timeout=None, poll_interval=0.1):
+    """
+    Run one command, sampling its resident memory while it runs.
+    Returns (name, CompletedProcess, wall time in seconds, peak RSS in MB); raises subprocess.TimeoutExpired
+    after killing the command when it runs longer than timeout seconds.
+    """
+    start = time.time()
+    peak = 0.0
+    with tempfile.TemporaryFile("w+") as out, tempfile.TemporaryFile("w+") as err:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=err, text=True)
+        while proc.poll() is None:
+            peak = max(peak, *process_memory_mb(proc.pid))
+            if timeout is not None and time.time() - start > timeout:
+                proc.kill()
+                proc.wait()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            time.sleep(poll_interval)
+        out.seek(0)
+        err.seek(0)
+        result = subprocess.CompletedProcess(cmd, proc.returncode, out.read(), err.read())
+    return name, result, time.time() - start, peak
+
+
+def run_commands(commands, jobs=1):
+    """
+    Run (name, cmd, cwd) commands with at most `jobs` at a time.
+    Yields (name, CompletedProcess, wall time, peak RSS) as the jobs finish.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(run_command, name, cmd, cwd) for name, cmd, cwd in commands]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def save_job_records(records, path, columns=JOB_COLUMNS):
+    """Save the per-job records (Gene, Status, Exit_code, Wall_time_s, ...) sorted by gene."""
+    table = pd.DataFrame(records, columns=columns).sort_values("Gene")
+    table.to_csv(path, index=False)
+    return table
+
+
+def print_job_summary(table, elapsed, slowest=5):
+    """Print the number of jobs per status, their wall times and the slowest genes."""
+    print("\n===== Job summary =====")
+    summary = table.groupby("Status")["Wall_time_s"].agg(["count", "sum", "mean", "max"])
+    print(summary.round(1).to_string())
+    busy = table["Wall_time_s"].sum()
+    print(f"Elapsed: {elapsed:.1f} s, summed job time: {busy:.1f} s (speed-up {busy / max(elapsed, 1e-9):.1f}x)")
+    if len(table):
+        print("Slowest genes:")
+        print(table.nlargest(slowest, "Wall_time_s").to_string(index=False))
@@ -0,0 +1,68 @@
+"""
+Author: Khaoula El Mchachti
+Description: Resumable job manifest for the per-gene ABGD/ASAP runs. Every state change of a gene is appended to a
+JSON-lines file (gene, state, input hash, parameters, runtime, peak RSS, outcome); the last line of a gene is its
+current state. A gene is only skipped on a later run when it finished successfully with the same input alignment and
+parameters, so interrupted ("running"), failed and stale genes are rerun, from an emptied output folder.
+Date: 2026-10-17
+"""
+
+import os
+import json
+import time
+import shutil
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobManifest:
+    """Append-only JSON-lines record of the per-gene job states."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # line cut short by a crash
+                    self.records[record["gene"]] = record
+
+    def append(self, record):
+        record["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.records[record["gene"]] = record
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, gene, input_hash, params):
+        """True when the gene already finished successfully with this input and these parameters."""
+        record = self.records.get(gene)
+        return (record is not None and record["state"] == DONE
+                and record["input_hash"] == input_hash and record["params"] == params)
+
+    def start(self, gene, input_hash, params):
+        self.append({"gene": gene, "state": RUNNING, "input_hash": input_hash, "params": params})
+
+    def finish(self, gene, success, runtime_s, peak_rss_mb, outcome):
+        """Record the end of the gene's current run ("done" only on success)."""
+        record = dict(self.records[gene])
+        record.update({
+            "state": DONE if success else FAILED,
+            "runtime_s": round(runtime_s, 3),
+            "peak_rss_mb": round(peak_rss_mb, 1),
+            "outcome": outcome,
+        })
+        self.append(record)
+
+
+def reset_output_dir(path):
+    """Empty a gene's output folder, so outputs of an interrupted or stale run can never be mistaken for results."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
@@ -0,0 +1,17 @@
+"""
+Author: Khaoula El Mchachti
+Description: Memory usage reporting for the pipeline scripts.
+Date: 2026-10-17
+"""
+
+import resource
+import sys
+
+
+def peak_rss_mb(children=False):
+    """Peak resident set size of this process (or of its finished child processes) in MB."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return usage.ru_maxrss / (1024 * 1024)
+    return usage.ru_maxrss / 1024
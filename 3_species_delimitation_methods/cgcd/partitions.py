@@ -0,0 +1,110 @@
+"""
+Author: Khaoula El Mchachti
+Description: Compact store of the selected per-gene partitions. Instead of one N x N 0/1 CSV per gene, the partitions
+of a method are kept in a single compressed .npz file: the gene names, one shared strain index and an int32 label
+matrix (one row per gene, one column per strain; strains in the same subset share a label, -1 = strain absent from
+the gene, e.g. soft-core genes). The co-membership matrix of a gene is derived on demand, and the pair counts of
+all genes are accumulated from the label vectors by chunks of one-hot encoded genes (one matrix product per chunk).
+Date: 2026-10-17
+"""
+
+import os
+
+import numpy as np
+
+ABSENT = -1
+CHUNK_COLUMNS = 4096  # subset columns per one-hot chunk: about n_strains x 16 KB of float32 per chunk
+
+
+def assignment_labels(assignment, strain_index):
+    """int32 label vector of a {strain: subset} assignment over strain_index ({strain: column}); ABSENT elsewhere."""
+    labels = np.full(len(strain_index), ABSENT, dtype=np.int32)
+    codes = {}
+    for strain, subset in assignment.items():
+        labels[strain_index[strain]] = codes.setdefault(subset, len(codes))
+    return labels
+
+
+def write_partitions(path, assignments, strains=None):
+    """
+    Save {gene: {strain: subset}} assignments to one .npz file. The strain index is strains when given (strains of
+    the assignments missing from it are appended), else the strains in order of first appearance.
+    """
+    strains = list(strains or [])
+    strain_index = {strain: i for i, strain in enumerate(strains)}
+    for assignment in assignments.values():
+        for strain in assignment:
+            if strain not in strain_index:
+                strain_index[strain] = len(strains)
+                strains.append(strain)
+
+    genes = list(assignments)
+    labels = np.full((len(genes), len(strains)), ABSENT, dtype=np.int32)
+    for row, gene in enumerate(genes):
+        labels[row] = assignment_labels(assignments[gene], strain_index)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, genes=np.array(genes, dtype=str), strains=np.array(strains, dtype=str), labels=labels)
+    os.replace(tmp_path, path)
+
+
+def read_partitions(path):
+    """(genes, strains, labels) of a partition store; labels is the n_genes x n_strains int32 matrix."""
+    with np.load(path) as store:
+        return list(store["genes"]), list(store["strains"]), store["labels"]
+
+
+def comembership(labels):
+    """
+    Co-membership matrix of one gene's label vector: 1 where both strains are present and in the same subset,
+    0 otherwise (int array, strain x strain).
+    """
+    present = labels != ABSENT
+    same = (labels[:, None] == labels[None, :]) & present[:, None] & present[None, :]
+    return same.astype(int)
+
+
+def count_dtype(n_genes):
+    """Smallest unsigned type holding a count of n_genes (uint16 up to 65535 genes)."""
+    return np.uint16 if n_genes <= np.iinfo(np.uint16).max else np.uint32
+
+
+def conspecificity_counts(labels, chunk_columns=CHUNK_COLUMNS):
+    """
+    Pair counts of a genes x strains label matrix, as two strain x strain arrays: same (number of genes placing both
+    strains in the same subset) and shared (number of genes in which both strains are present), in uint16.
+    Each subset of a gene becomes one 0/1 column and the genes are processed in chunks of about chunk_columns
+    columns, so that a chunk costs a single matrix product and the memory used does not grow with the number of genes.
+    """
+    labels = np.asarray(labels)
+    n_genes, n_strains = labels.shape
+    dtype = count_dtype(n_genes)
+    same = np.zeros((n_strains, n_strains), dtype=dtype)
+    shared = np.zeros((n_strains, n_strains), dtype=dtype)
+    if n_genes == 0:
+        return same, shared
+
+    # Column offset of each gene's subsets in the concatenated one-hot matrix
+    n_subsets = labels.max(axis=1).astype(np.int64) + 1
+    offsets = np.concatenate(([0], np.cumsum(n_subsets)))
+
+    start = 0
+    while start < n_genes:
+        # Genes of the chunk: as many as fit in chunk_columns subset columns, at least one
+        end = max(start + 1, int(np.searchsorted(offsets, offsets[start] + chunk_columns, side="right")) - 1)
+        end = min(end, n_genes)
+        chunk = labels[start:end]
+        present = chunk != ABSENT
+
+        # One-hot strain x subset matrix of the chunk
+        gene_idx, strain_idx = np.nonzero(present)
+        one_hot = np.zeros((n_strains, offsets[end] - offsets[start]), dtype=np.float32)
+        one_hot[strain_idx, offsets[start:end][gene_idx] - offsets[start] + chunk[gene_idx, strain_idx]] = 1.0
+        presence = present.T.astype(np.float32)
+
+        # Counts of a chunk are below 2^24, hence exact in float32
+        same += np.rint(one_hot @ one_hot.T).astype(dtype)
+        shared += np.rint(presence @ presence.T).astype(dtype)
+        start = end
+    return same, shared
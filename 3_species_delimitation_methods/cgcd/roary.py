@@ -0,0 +1,53 @@
+"""
+Author: Khaoula El Mchachti
+Description: Streaming reader for Roary's gene_presence_absence.csv. The table is read in row chunks and only the
+core-gene rows, with the Gene, No. isolates and strain columns, are kept, so peak memory follows the number of
+core genes instead of the size of the pangenome. Core genes are strict (all strains) by default, or soft-core when a
+minimum presence fraction is given.
+Date: 2026-10-17
+"""
+
+import math
+
+import pandas as pd
+
+# Roary writes 14 annotation columns before the strain columns
+SKIPPED_COLUMNS = 14
+
+
+def read_strain_columns(csv_path, skipped_columns=SKIPPED_COLUMNS):
+    """Strain names from the header of gene_presence_absence.csv."""
+    return pd.read_csv(csv_path, nrows=0).columns[skipped_columns:]
+
+
+def min_isolates(number_of_strains, min_presence=1.0):
+    """Smallest number of isolates a gene must be present in to count as (soft-)core."""
+    return max(1, math.ceil(min_presence * number_of_strains - 1e-9))
+
+
+def read_core_genes(csv_path, min_presence=1.0, chunksize=1000):
+    """
+    Stream gene_presence_absence.csv and return (core_genes, strain_columns).
+    core_genes holds the rows present in at least min_presence of the strains (1.0 = strict core), keeps
+    Roary's row numbers as index and only the Gene, No. isolates (as integers) and strain columns (as strings,
+    missing cells as NaN).
+    """
+    strain_columns = read_strain_columns(csv_path)
+    required = min_isolates(len(strain_columns), min_presence)
+
+    kept = []
+    reader = pd.read_csv(
+        csv_path,
+        usecols=["Gene", "No. isolates", *strain_columns],
+        dtype={"No. isolates": "int64", **dict.fromkeys(["Gene", *strain_columns], str)},
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        kept.append(chunk[chunk["No. isolates"] >= required])
+
+    columns = ["Gene", "No. isolates", *strain_columns]
+    if not kept:
+        # Header without gene rows: no core gene
+        return pd.DataFrame(columns=columns, dtype=str).astype({"No. isolates": "int64"}), strain_columns
+    core_genes = pd.concat(kept)[columns]
+    return core_genes, strain_columns
@@ -0,0 +1,75 @@
+"""
+Author: Khaoula El Mchachti
+Description: One-pass threshold scan of a conspecificity matrix. Strains are linked when their conspecificity is at least
+the threshold and the groups are the connected components. Instead of building a graph for every threshold, the strain
+pairs are sorted once by conspecificity and merged with a union-find while the thresholds are swept from high to low,
+so that the number of groups (and of groups holding a marked strain, e.g. the VUB strains) is known at every
+threshold after a single pass over the pairs.
+Date: 2026-10-17
+"""
+
+import numpy as np
+
+
+class UnionFind:
+    """Disjoint sets of strains, counting the sets and the sets holding at least one marked strain."""
+
+    def __init__(self, n, marked=()):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.marked = [False] * n
+        for i in marked:
+            self.marked[i] = True
+        self.n_components = n
+        self.n_marked_components = sum(self.marked)
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]  # path halving
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        """Merge the sets of i and j; returns False when they were already in the same set."""
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size[root_j]
+        if self.marked[root_i] and self.marked[root_j]:
+            self.n_marked_components -= 1
+        self.marked[root_i] = self.marked[root_i] or self.marked[root_j]
+        self.n_components -= 1
+        return True
+
+
+def threshold_scan(matrix, thresholds, marked=()):
+    """
+    Number of groups at every threshold of a PackedMatrix, strains being linked when their value is >= threshold.
+    marked are strain positions (e.g. the VUB strains). Returns [(threshold, n_groups, n_marked_groups)] in the
+    order of thresholds.
+    """
+    thresholds = list(thresholds)
+    if not thresholds:
+        return []
+    i, j, values = matrix.pairs()
+
+    # Only the pairs reaching the lowest threshold can link strains; sort them once, highest value first
+    keep = values >= min(thresholds)
+    i, j, values = i[keep], j[keep], np.asarray(values[keep])
+    order = np.argsort(values, kind="stable")[::-1]
+    i, j, values = i[order].tolist(), j[order].tolist(), values[order].tolist()
+
+    groups = UnionFind(len(matrix), marked)
+    counts = {}
+    edge = 0
+    for threshold in sorted(set(thresholds), reverse=True):
+        # Add the pairs linked at this threshold (all pairs linked at higher thresholds are already merged)
+        while edge < len(values) and values[edge] >= threshold and groups.n_components > 1:
+            groups.union(i[edge], j[edge])
+            edge += 1
+        counts[threshold] = (groups.n_components, groups.n_marked_components)
+    return [(threshold, *counts[threshold]) for threshold in thresholds]
@@ -0,0 +1,178 @@
+"""
+Author: Khaoula El Mchachti
+Description: Memory-aware scheduler for ASAP runs. The peak memory of every gene is estimated from its number of
+sequences and alignment length, and jobs are only started while the estimates of the running jobs fit a RAM budget.
+The resident memory of the running jobs is watched: when together they exceed the budget, the job furthest above its
+estimate is stopped and requeued to run alone, and a job killed by the system (SIGKILL, e.g. the OOM killer) while
+sharing the node is requeued alone as well. No gene is dropped without a final, solitary attempt. With a
+TimeoutPolicy (cgcd/timeouts.py), a job running longer than the predicted timeout of its genes is stopped and
+requeued once with an escalated timeout, and the runtime model is refreshed with every job that succeeds.
+Date: 2026-10-17
+"""
+
+import os
+import time
+import signal
+import subprocess
+
+# ASAP memory model, calibrated with the asap binary of this repository: a few MB of fixed cost, ~48 bytes per
+# sequence pair (distance matrix, pair list and n x n work tables) and the sequences themselves
+ASAP_BASE_MB = 4
+ASAP_BYTES_PER_PAIR = 48
+ASAP_BYTES_PER_BASE = 2
+
+
+def alignment_shape(fasta_path):
+    """Number of sequences and alignment length (longest record) of a FASTA file, in one streaming read."""
+    n_sequences, length, current = 0, 0, 0
+    with open(fasta_path) as f:
+        for line in f:
+            if line.startswith(">"):
+                n_sequences += 1
+                length, current = max(length, current), 0
+            else:
+                current += len(line.strip())
+    return n_sequences, max(length, current)
+
+
+def estimate_asap_mb(n_sequences, length):
+    """Predicted peak resident memory of ASAP (MB) for an alignment of n_sequences x length."""
+    return ASAP_BASE_MB + (ASAP_BYTES_PER_PAIR * n_sequences ** 2 + ASAP_BYTES_PER_BASE * n_sequences * length) / 1024 ** 2
+
+
+def total_memory_mb():
+    """Physical memory of the machine (MB)."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 2
+
+
+def process_memory_mb(pid):
+    """
+    Current and peak resident memory of a process (MB), read from /proc (VmRSS, VmHWM);
+    zeros when unavailable (e.g. macOS, process already gone).
+    """
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    memory[line[:5]] = int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return memory.get("VmRSS", 0.0), memory.get("VmHWM", 0.0)
+
+
+class MemoryAwareScheduler:
+    """
+    Runs jobs (dicts with name, cmd, cwd, estimate_mb, stdout, stderr) within ram_budget_mb and max_jobs.
+    Pending jobs are started largest estimate first, using the first one that fits next to the running jobs;
+    a job larger than the whole budget runs alone. With timeouts, jobs also need shapes, the (n_sequences, length)
+    of their genes: their timeout is the sum of the timeouts of their genes. Names of the jobs given up after
+    timing out twice are kept in timed_out.
+    """
+
+    def __init__(self, ram_budget_mb, max_jobs=None, poll_interval=0.5, timeouts=None):
+        self.ram_budget_mb = ram_budget_mb
+        self.max_jobs = max_jobs or os.cpu_count()
+        self.poll_interval = poll_interval
+        self.timeouts = timeouts
+        self.timed_out = set()
+
+    def start(self, job):
+        job["stdout_file"] = open(job["stdout"], "w")
+        job["stderr_file"] = open(job["stderr"], "w")
+        job["proc"] = subprocess.Popen(job["cmd"], cwd=job["cwd"], stdout=job["stdout_file"], stderr=job["stderr_file"])
+        job["start"] = time.time()
+        job["rss"] = job["peak"] = 0.0
+        job["evicted"] = False
+        job["expired"] = False
+        if self.timeouts is not None:
+            job["timeout"] = sum(self.timeouts.timeout(n_sequences, length, job["escalated"])
+                                 for n_sequences, length in job["shapes"])
+
+    def admit(self, pending, running):
+        """Start pending jobs while their estimates fit in the budget."""
+        while pending and len(running) < self.max_jobs:
+            if any(job["alone"] for job in running):
+                return
+            if pending[0]["alone"]:
+                # A requeued job waits until the node is free
+                if running:
+                    return
+                job = pending.pop(0)
+            else:
+                reserved = sum(max(job["estimate_mb"], job["rss"]) for job in running)
+                job = next((job for job in pending if not job["alone"]
+                            and reserved + job["estimate_mb"] <= self.ram_budget_mb), None)
+                if job is None:
+                    if running:
+                        return
+                    # Larger than the whole budget: run it alone
+                    job = pending[0]
+                    job["alone"] = True
+                pending.remove(job)
+            self.start(job)
+            running.append(job)
+
+    def watch(self, running):
+        """Update the RSS of the running jobs and stop the worst offender when the budget is exceeded."""
+        for job in running:
+            job["rss"], hwm = process_memory_mb(job["proc"].pid)
+            job["peak"] = max(job["peak"], job["rss"], hwm)
+            if self.timeouts is not None and not job["expired"] and time.time() - job["start"] > job["timeout"]:
+                print(f"Timeout after {job['timeout']:.0f} s: stopping {job['name']}")
+                job["expired"] = True
+                job["proc"].kill()
+        active = [job for job in running if not job["evicted"]]
+        if len(active) > 1 and sum(job["rss"] for job in active) > self.ram_budget_mb:
+            victim = max(active, key=lambda job: job["rss"] - job["estimate_mb"])
+            print(f"Memory budget exceeded: stopping {victim['name']} ({victim['rss']:.0f} MB, "
+                  f"estimated {victim['estimate_mb']:.0f} MB) to rerun it alone")
+            victim["evicted"] = True
+            victim["proc"].kill()
+
+    def run(self, jobs):
+        """
+        Run all jobs; yields (name, returncode, wall time, peak RSS in MB, attempts) as they finish.
+        """
+        pending = sorted(jobs, key=lambda job: job["estimate_mb"], reverse=True)
+        for job in pending:
+            job["alone"] = False
+            job["attempts"] = 0
+            job["escalated"] = False
+        running = []
+
+        while pending or running:
+            self.admit(pending, running)
+            time.sleep(self.poll_interval)
+            self.watch(running)
+
+            for job in [job for job in running if job["proc"].poll() is not None]:
+                running.remove(job)
+                job["stdout_file"].close()
+                job["stderr_file"].close()
+                job["attempts"] += 1
+                returncode = job["proc"].returncode
+
+                # Stopped at its timeout: one more attempt with an escalated timeout, then given up
+                if job["expired"]:
+                    if not job["escalated"]:
+                        job["escalated"] = True
+                        pending.insert(0, job)
+                        print(f"{job['name']} requeued with a longer timeout")
+                        continue
+                    self.timed_out.add(job["name"])
+                    yield job["name"], returncode, time.time() - job["start"], job["peak"], job["attempts"]
+                    continue
+                if returncode == 0 and self.timeouts is not None and len(job["shapes"]) == 1:
+                    self.timeouts.observe(*job["shapes"][0], time.time() - job["start"])
+
+                # Stopped for memory, or killed by the system while sharing the node: requeue to run alone
+                killed = returncode == -signal.SIGKILL
+                if (job["evicted"] or killed) and not job["alone"]:
+                    job["alone"] = True
+                    job["estimate_mb"] = max(job["estimate_mb"], job["peak"])
+                    pending.insert(0, job)
+                    print(f"{job['name']} requeued to run alone")
+                    continue
+
+                yield job["name"], returncode, time.time() - job["start"], job["peak"], job["attempts"]
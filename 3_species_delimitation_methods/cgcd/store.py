@@ -0,0 +1,90 @@
+"""
+Author: Khaoula El Mchachti
+Description: Compact per-run store of the ABGD/ASAP results. In minimal-output mode the runners let the executables
+write into a scratch folder (e.g. on tmpfs), keep only the files the best-partition scripts read (.res.cvs, the
+partition files and .spart) in one JSON-lines file per run, and delete the rest, so a run leaves a handful of files
+instead of tens per gene. The last line of a gene holds its current files; a gene that still has a result folder
+(run without minimal output) is read from that folder as before.
+Date: 2026-10-17
+"""
+
+import os
+import json
+import shutil
+import fnmatch
+import tempfile
+
+ABGD_STORE_NAME = "abgd_results.jsonl"
+ASAP_STORE_NAME = "asap_results.jsonl"
+
+# Files consumed downstream (3_2_abgd_best_partitions.py, 4_2_asap_best_partitions.py)
+ABGD_PATTERNS = ("*.res.cvs", "*.part.*.txt", "*.partinit.*.txt", "*.spart")
+ASAP_PATTERNS = ("*.res.cvs", "*.Partition_*.csv", "*.spart")
+
+
+def scratch_dir(parent=None, prefix="cgcd_"):
+    """New scratch folder under parent, by default /dev/shm (tmpfs) when it exists, else the system temp folder."""
+    if parent is None and os.path.isdir("/dev/shm"):
+        parent = "/dev/shm"
+    return tempfile.mkdtemp(prefix=prefix, dir=parent)
+
+
+def read_result_files(directory, patterns):
+    """{file name: text} of the files of a result folder matching the patterns."""
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            with open(os.path.join(directory, name), errors="replace") as f:
+                files[name] = f.read()
+    return files
+
+
+class ResultStore:
+    """Append-only JSON-lines store: one {"gene", "files": {name: text}} record per finished gene."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # line cut short by a crash
+                    self.records[record["gene"]] = record["files"]
+
+    def __contains__(self, gene):
+        return gene in self.records
+
+    def genes(self):
+        return sorted(self.records)
+
+    def files(self, gene):
+        return self.records[gene]
+
+    def add(self, gene, files):
+        self.records[gene] = files
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"gene": gene, "files": files}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def collect(self, gene, directory, patterns):
+        """Store the consumed files of a gene's result folder, then delete the folder."""
+        self.add(gene, read_result_files(directory, patterns))
+        shutil.rmtree(directory)
+
+
+def gene_results(results_dir, store_name, patterns):
+    """
+    Yields (gene, {file name: text}) for every gene of a results folder: from the gene's own folder when it has one,
+    else from the run store.
+    """
+    store = ResultStore(os.path.join(results_dir, store_name))
+    folders = {name for name in os.listdir(results_dir) if os.path.isdir(os.path.join(results_dir, name))}
+    for gene in sorted(folders | set(store.genes())):
+        if gene in folders:
+            yield gene, read_result_files(os.path.join(results_dir, gene), patterns)
+        else:
+            yield gene, store.files(gene)
@@ -0,0 +1,106 @@
+"""
+Author: Khaoula El Mchachti
+Description: Adaptive per-gene timeouts for the ASAP runs. The runtime of a gene is predicted from its number of
+sequences n and alignment length L with a log-linear model, log(t) = a + b log(n) + c log(L), fitted on the genes
+that already finished (earlier runs in the job manifest, then every job of the current run as it completes). The fit
+is pulled towards a generous prior, so it is usable from the first gene and only moves away from the prior as
+evidence accumulates. A gene's timeout is its predicted runtime widened by the spread of the fit, within
+[min_timeout, max_timeout]; a gene that times out is retried once with an escalated timeout before being given up.
+Date: 2026-10-17
+"""
+
+import math
+
+import numpy as np
+
+# Prior runtime model of the asap binary (-a, alignment input): ~50 s for 100 sequences x 1500 sites, growing
+# linearly with both dimensions; deliberately on the slow side of the timings measured with this repository's binary
+PRIOR_COEFFICIENTS = (-8.0, 1.0, 1.0)
+PRIOR_WEIGHT = 2.0  # the prior counts as this many observations
+PRIOR_SIGMA = 0.75  # spread of log(runtime) assumed until enough genes have finished
+MIN_SIGMA_SAMPLES = 5
+
+DEFAULT_MIN_TIMEOUT = 60
+DEFAULT_SPREAD = 3.0  # the timeout is exp(prediction + spread * sigma)
+ESCALATION = 4.0
+
+
+def _features(n_sequences, length):
+    return np.array([1.0, math.log(max(n_sequences, 2)), math.log(max(length, 1))])
+
+
+class RuntimeModel:
+    """Log-linear runtime model (seconds) of a delimitation method, refitted after every observed job."""
+
+    def __init__(self, prior=PRIOR_COEFFICIENTS, prior_weight=PRIOR_WEIGHT):
+        self.prior = np.array(prior, dtype=float)
+        self.prior_weight = prior_weight
+        # Running sums of the least squares (X'X, X'y, y'y), so refitting costs the same after any number of jobs
+        self.n_samples = 0
+        self.xtx = np.zeros((3, 3))
+        self.xty = np.zeros(3)
+        self.yty = 0.0
+        self.coefficients = self.prior.copy()
+        self.sigma = PRIOR_SIGMA
+
+    def observe(self, n_sequences, length, runtime_s):
+        """Add the runtime of a finished job and refit the model."""
+        if runtime_s <= 0:
+            return
+        x, y = _features(n_sequences, length), math.log(runtime_s)
+        self.n_samples += 1
+        self.xtx += np.outer(x, x)
+        self.xty += x * y
+        self.yty += y * y
+        self.fit()
+
+    def fit(self):
+        """Least squares on the observed jobs, regularized towards the prior (ridge with the prior as centre)."""
+        lhs = self.xtx + self.prior_weight * np.eye(3)
+        rhs = self.xty + self.prior_weight * self.prior
+        self.coefficients = np.linalg.solve(lhs, rhs)
+        if self.n_samples >= MIN_SIGMA_SAMPLES:
+            beta = self.coefficients
+            rss = max(self.yty - 2 * beta @ self.xty + beta @ self.xtx @ beta, 0.0)
+            # Never trust a fit more than a quarter of the prior spread (timings of small genes are noisy)
+            self.sigma = max(math.sqrt(rss / self.n_samples), PRIOR_SIGMA / 4)
+
+    def predict(self, n_sequences, length):
+        """Predicted runtime (seconds) of an alignment of n_sequences x length."""
+        return math.exp(float(_features(n_sequences, length) @ self.coefficients))
+
+    @classmethod
+    def from_manifest(cls, manifest, shapes, params):
+        """
+        Model fitted on the genes of a JobManifest that finished successfully with these parameters,
+        shapes being {gene: (n_sequences, length)}.
+        """
+        model = cls()
+        for gene, record in manifest.records.items():
+            if (gene in shapes and record["state"] == "done" and record["params"] == params
+                    and record.get("runtime_s")):
+                model.observe(*shapes[gene], record["runtime_s"])
+        return model
+
+
+class TimeoutPolicy:
+    """Per-gene timeouts derived from a RuntimeModel, with one escalated retry for genes that time out."""
+
+    def __init__(self, model, min_timeout=DEFAULT_MIN_TIMEOUT, max_timeout=None, spread=DEFAULT_SPREAD,
+                 escalation=ESCALATION):
+        self.model = model
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.spread = spread
+        self.escalation = escalation
+
+    def timeout(self, n_sequences, length, retry=False):
+        """Timeout (seconds) of a gene; max_timeout bounds the first attempt, a retry gets escalation times more."""
+        timeout = max(self.model.predict(n_sequences, length) * math.exp(self.spread * self.model.sigma),
+                      self.min_timeout)
+        if self.max_timeout is not None:
+            timeout = min(timeout, self.max_timeout)
+        return timeout * self.escalation if retry else timeout
+
+    def observe(self, n_sequences, length, runtime_s):
+        self.model.observe(n_sequences, length, runtime_s)
@@ -0,0 +1,38 @@
+"""
+Author: Khaoula El Mchachti
+Description: Shared fixtures of the tests: cgcd importable from the tests, and runnable copies of the abgd and asap
+executables of the repository (the tests using them are skipped where the executables cannot run).
+Date: 2026-10-17
+"""
+
+import os
+import shutil
+import stat
+import subprocess
+import sys
+
+import pytest
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+sys.path.insert(0, TOOLS_DIR)
+
+
+@pytest.fixture
+def executable(tmp_path):
+    """Factory of runnable copies of the abgd or asap executable of the repo; skips the test when it cannot run."""
+
+    def copy(tool):
+        source = os.path.join(TOOLS_DIR, tool.upper(), tool)
+        if not os.path.isfile(source):
+            pytest.skip(f"No {tool} executable")
+        path = tmp_path / tool
+        shutil.copy(source, path)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        try:
+            subprocess.run([str(path), "-h"], capture_output=True, timeout=30)
+        except OSError:
+            pytest.skip(f"The {tool} executable cannot run here")
+        return str(path)
+
+    return copy
@@ -0,0 +1,80 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the in-process ABGD (cgcd/abgd.py): its .res.cvs and .part.<step>.txt files against those of
+the abgd executable, checked in under tests/data/abgd, and the .res.cvs rebuilt from the partition files of a run
+without -a (3_1_abgd.py --minimal), against the .res.cvs of the NumPy port and, when it can run here, of the abgd
+executable.
+Date: 2026-10-17
+"""
+
+import os
+import subprocess
+
+import pytest
+
+from cgcd.abgd import abgd_fasta, res_cvs_from_parts, run_gene, write_abgd_results
+from cgcd.distances import write_distance_file
+from cgcd.store import read_result_files
+
+from test_haplotypes import simulated_gene, write_fasta
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "abgd")
+PART_PATTERNS = ("*.part.*.txt", "*.partinit.*.txt")
+
+
+@pytest.mark.parametrize("case", ["three_species", "one_species"])
+def test_port_writes_the_executable_results(tmp_path, case):
+    # Expected files written by `abgd -a` on gene.fasta (the one-species gene stops at a single group on step 3)
+    expected = read_result_files(os.path.join(DATA_DIR, case), ("*.res.cvs", "*.part.*.txt"))
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    _, result, _, _ = run_gene("gene", os.path.join(DATA_DIR, case, "gene.fasta"), str(out_dir))
+    assert result.returncode == 0
+    assert read_result_files(out_dir, ("*.res.cvs", "*.part.*.txt")) == expected
+
+
+def test_port_reads_the_distance_matrix(tmp_path):
+    # Same partitions from the JC69 matrix of the alignment as from the alignment
+    case_dir = os.path.join(DATA_DIR, "three_species")
+    phylip_path = tmp_path / "gene.phy"
+    assert write_distance_file(os.path.join(case_dir, "gene.fasta"), phylip_path, "jc69")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    _, result, _, _ = run_gene("gene", str(phylip_path), str(out_dir))
+    assert result.returncode == 0
+    assert read_result_files(out_dir, ("*.res.cvs", "*.part.*.txt")) == \
+        read_result_files(case_dir, ("*.res.cvs", "*.part.*.txt"))
+
+
+def simulated_fasta(tmp_path, seed, n_species):
+    return write_fasta(tmp_path / "g.fasta", simulated_gene(seed, n_species=n_species, n_haplotypes=4, n_strains=20))
+
+
+@pytest.mark.parametrize("seed, n_species", [(0, 3), (20, 1), (22, 1), (23, 1)])
+def test_res_cvs_from_the_port_partitions(tmp_path, seed, n_species):
+    names, steps = abgd_fasta(simulated_fasta(tmp_path, seed, n_species))
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    write_abgd_results(names, steps, out_dir, "g")
+    with open(out_dir / "g.res.cvs") as f:
+        expected = f.read()
+    assert res_cvs_from_parts(read_result_files(out_dir, PART_PATTERNS), "g") == expected
+
+
+@pytest.mark.parametrize("seed, n_species", [(0, 3), (20, 1), (22, 1), (23, 1), (24, 1)])
+def test_res_cvs_from_the_executable_partitions(tmp_path, executable, seed, n_species):
+    abgd = executable("abgd")
+    fasta_path = simulated_fasta(tmp_path, seed, n_species)
+    for name, options in [("all", ["-a"]), ("minimal", [])]:
+        (tmp_path / name).mkdir()
+        subprocess.run([abgd, *options, "-o", ".", str(fasta_path)], capture_output=True, cwd=tmp_path / name,
+                       timeout=300)
+    assert not os.path.exists(tmp_path / "minimal" / "g.res.cvs")
+    with open(tmp_path / "all" / "g.res.cvs") as f:
+        expected = f.read()
+    assert res_cvs_from_parts(read_result_files(tmp_path / "minimal", PART_PATTERNS), "g") == expected
+
+
+def test_no_partition_files():
+    assert res_cvs_from_parts({}, "g") is None
+    assert res_cvs_from_parts({"g.part.1.txt": "Group[ 1 ] n: 1 ;id: s0\n"}, "g") is None
@@ -0,0 +1,104 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the ASAP result readers (cgcd/asap.py) on the outputs of `asap -a -x 1` and
+`asap_batch -x 1 -r 10000` checked in under tests/data/asap (24 strains whose names asap rewrites in the .spart, and
+two partitions with equal ASAP scores): the partitions read from the .spart and from the batch result against asap's
+Partition_<rank>.csv files.
+Date: 2026-10-17
+"""
+
+import csv
+import math
+import os
+import subprocess
+
+import pytest
+
+from cgcd.asap import fasta_names, partition_assignment, read_asap_result, read_spart, restore_names
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "asap")
+FASTA = os.path.join(DATA_DIR, "gene.fasta")
+N_PARTITIONS = 7
+
+
+def partition_csv(path):
+    """{sequence: subset} of an asap Partition_<rank>.csv file, read like 4_2_asap_best_partitions.py."""
+    with open(path) as f:
+        return {row[0].strip(): row[1].strip() for row in csv.reader(f) if len(row) >= 2}
+
+
+def groups(assignment, names=None):
+    """Partition (of names only, when given) as sorted groups of sequences, whatever the subset labels."""
+    members = {}
+    for name, subset in assignment.items():
+        if names is None or name in names:
+            members.setdefault(subset, []).append(name)
+    return sorted(sorted(group) for group in members.values())
+
+
+def assert_same_partitions(names, partitions, prefix):
+    """Partitions of every rank against asap's Partition_<rank>.csv files."""
+    for rank in range(1, N_PARTITIONS + 1):
+        expected = partition_csv(f"{prefix}.Partition_{rank}.csv")
+        assignment = partition_assignment(names, partitions, rank)
+        if rank < N_PARTITIONS:
+            assert groups(assignment) == groups(expected)
+        else:
+            # asap leaves one sequence out of the .csv of its partition into singletons
+            assert len(expected) == len(names) - 1
+            assert groups(assignment, expected) == groups(expected)
+
+
+def spart_partitions(prefix, with_res_cvs=True):
+    res_cvs = f"{prefix}.res.cvs" if with_res_cvs else None
+    names, partitions = read_spart(f"{prefix}.spart", res_cvs)
+    return restore_names(names, fasta_names(FASTA)), partitions
+
+
+def test_spart_matches_the_partition_files():
+    prefix = os.path.join(DATA_DIR, "gene.fasta")
+    names, partitions = spart_partitions(prefix)
+    assert sorted(names) == sorted(fasta_names(FASTA))
+    assert [partition["rank"] for partition in partitions] == list(range(1, N_PARTITIONS + 1))
+    assert_same_partitions(names, partitions, prefix)
+
+    # p-value and threshold of the .res.cvs, subset counts of the .spart
+    assert partitions[0]["n_subsets"] == 3 and partitions[0]["p_value"] == pytest.approx(1.696776e-03)
+    assert partitions[0]["threshold_distance"] == pytest.approx(0.104819)
+    assert partition_assignment(names, partitions, N_PARTITIONS + 1) == {}
+
+
+def test_spart_without_res_cvs():
+    prefix = os.path.join(DATA_DIR, "gene.fasta")
+    names, partitions = spart_partitions(prefix, with_res_cvs=False)
+    assert all(math.isnan(partition["p_value"]) for partition in partitions)
+    # Same ranks as asap but for the two partitions of equal ASAP score, which only asap's p-values order
+    for rank in range(1, N_PARTITIONS - 1):
+        expected = partition_csv(f"{prefix}.Partition_{rank}.csv")
+        assert groups(partition_assignment(names, partitions, rank)) == groups(expected)
+
+
+def test_truncated_spart(tmp_path):
+    with open(os.path.join(DATA_DIR, "gene.fasta.spart")) as f:
+        lines = f.readlines()
+    cut = next(i for i, line in enumerate(lines) if line.startswith("Individual_assignment")) + 5
+    (tmp_path / "gene.fasta.spart").write_text("".join(lines[:cut]))
+    names, partitions = read_spart(tmp_path / "gene.fasta.spart")
+    assert len(names) == 4 and partitions == []
+
+
+def test_batch_result_matches_the_partition_files():
+    names, partitions = read_asap_result(os.path.join(DATA_DIR, "gene.asap.tsv"))
+    assert names == fasta_names(FASTA)
+    assert_same_partitions(names, partitions, os.path.join(DATA_DIR, "gene.fasta"))
+    _, spart = spart_partitions(os.path.join(DATA_DIR, "gene.fasta"))
+    assert [partition["n_subsets"] for partition in partitions] == [partition["n_subsets"] for partition in spart]
+
+
+def test_spart_of_the_executable(tmp_path, executable):
+    asap = executable("asap")
+    subprocess.run([asap, "-a", "-x", "1", "-o", ".", FASTA], capture_output=True, cwd=tmp_path, timeout=300)
+    prefix = str(tmp_path / "gene.fasta")
+    names, partitions = spart_partitions(prefix)
+    assert len(partitions) == N_PARTITIONS
+    assert_same_partitions(names, partitions, prefix)
@@ -0,0 +1,134 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the conspecificity matrix store (cgcd/conspecificity.py): round trip of the packed upper triangle
+and its strain sidecar, element and pair access, and the CSV export; and of the incremental pair counts
+(ConspecificityCounts), whose delta and rebuild paths must give the counts of conspecificity_counts.
+Date: 2026-10-17
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cgcd.conspecificity
+from cgcd.conspecificity import (ConspecificityCounts, PackedMatrix, export_csv, read_conspecificity, strains_path,
+                                 write_conspecificity)
+from cgcd.partitions import ABSENT, conspecificity_counts
+
+
+def random_symmetric(rng, n, high):
+    upper = np.triu(rng.integers(0, high, size=(n, n)))
+    return upper + np.triu(upper, 1).T
+
+
+@pytest.mark.parametrize("n", [1, 2, 7, 40])
+def test_store_round_trip(tmp_path, n):
+    matrix = random_symmetric(np.random.default_rng(n), n, 500)
+    strains = [f"strain_{i}" for i in range(n)]
+    store_path = str(tmp_path / "conspecificity.npy")
+    write_conspecificity(store_path, matrix, strains)
+    assert sorted(os.listdir(tmp_path)) == ["conspecificity.npy", "conspecificity.strains.txt"]
+    assert strains_path(store_path) == str(tmp_path / "conspecificity.strains.txt")
+
+    packed = read_conspecificity(store_path)
+    assert isinstance(packed.packed, np.memmap) and packed.packed.dtype == np.uint16
+    assert len(packed.packed) == n * (n + 1) // 2
+    assert packed.strains == strains
+    np.testing.assert_array_equal(packed.dense(), matrix)
+    np.testing.assert_array_equal(read_conspecificity(store_path, mmap=False).dense(), matrix)
+
+    for i in range(n):
+        for j in range(n):
+            assert packed.value(i, j) == matrix[i, j]
+    i, j, values = packed.pairs()
+    np.testing.assert_array_equal(values, matrix[np.triu_indices(n, 1)])
+    np.testing.assert_array_equal(values, matrix[i, j])
+
+
+def test_wide_counts_and_csv_export(tmp_path):
+    matrix = random_symmetric(np.random.default_rng(0), 5, 70000)
+    matrix[0, 0] = 70000
+    strains = ["A", "B", "C", "D", "E"]
+    store_path = str(tmp_path / "conspecificity.npy")
+    write_conspecificity(store_path, matrix, strains)
+    packed = read_conspecificity(store_path)
+    assert packed.packed.dtype == np.uint32
+    np.testing.assert_array_equal(packed.dense(), matrix)
+
+    csv_path = tmp_path / "conspecificity.csv"
+    export_csv(packed, csv_path)
+    frame = pd.read_csv(csv_path, index_col=0)
+    assert list(frame.index) == strains and list(frame.columns) == strains
+    np.testing.assert_array_equal(frame.to_numpy(), matrix)
+
+
+def test_packed_size_must_match_the_strains():
+    with pytest.raises(ValueError):
+        PackedMatrix(np.zeros(5, dtype=np.uint16), ["A", "B"])
+
+
+def random_labels(rng, n_genes, n_strains, absent=0.1):
+    """Label vectors of random partitions (up to 4 subsets), with a few absent strains."""
+    labels = rng.integers(0, 4, size=(n_genes, n_strains)).astype(np.int32)
+    labels[rng.random((n_genes, n_strains)) < absent] = ABSENT
+    return labels
+
+
+def assert_counts(counts, genes, strains, labels):
+    """Counts restricted to strains equal conspecificity_counts of the label vectors of genes."""
+    same, shared = counts.matrices(strains)
+    expected_same, expected_shared = conspecificity_counts(labels)
+    assert sorted(counts.labels) == sorted(genes)
+    np.testing.assert_array_equal(same, expected_same)
+    np.testing.assert_array_equal(shared, expected_shared)
+
+
+@pytest.mark.parametrize("rebuild_fraction", [0.0, 1.0])
+def test_counts_follow_the_partition_store(tmp_path, monkeypatch, rebuild_fraction):
+    # 0.0 rebuilds on every change, 1.0 always applies the per-gene deltas
+    rng = np.random.default_rng(3)
+    genes = [f"gene_{g}" for g in range(30)]
+    strains = [f"strain_{i}" for i in range(12)]
+    labels = random_labels(rng, len(genes), len(strains))
+    counts = ConspecificityCounts()
+    assert counts.update(genes, strains, labels) == (genes, [], [])
+    assert_counts(counts, genes, strains, labels)
+
+    # Saved and reloaded between runs
+    path = tmp_path / "counts.npz"
+    counts.save(path)
+    counts = ConspecificityCounts.load(path)
+    assert_counts(counts, genes, strains, labels)
+
+    # One gene rerun with a new partition, one removed, one added; relabelled partitions are unchanged
+    monkeypatch.setattr(cgcd.conspecificity, "REBUILD_FRACTION", rebuild_fraction)
+    new_genes = genes[1:] + ["gene_new"]
+    new_labels = np.vstack([labels[1:], random_labels(rng, 1, len(strains))])
+    new_labels[0] = random_labels(rng, 1, len(strains))[0]
+    present = new_labels[1] != ABSENT
+    new_labels[1][present] = new_labels[1][present] + 10
+    assert counts.update(new_genes, strains, new_labels) == (["gene_new"], ["gene_1"], ["gene_0"])
+    assert_counts(counts, new_genes, strains, new_labels)
+
+    # New strains, in a different column order: absent from the genes already counted
+    more_strains = ["strain_new", *reversed(strains)]
+    more_labels = np.full((len(new_genes), len(more_strains)), ABSENT, dtype=np.int32)
+    more_labels[:, 1:] = new_labels[:, ::-1]
+    more_labels[-1, 0] = 0
+    added, replaced, removed = counts.update(new_genes, more_strains, more_labels)
+    assert (added, replaced, removed) == ([], ["gene_new"], [])
+    assert_counts(counts, new_genes, more_strains, more_labels)
+
+
+def test_counts_widen_past_uint16():
+    # 65535 genes placing A and B together, as counted by earlier runs
+    counts = ConspecificityCounts(["A", "B"])
+    together = np.array([0, 0], dtype=np.int32)
+    counts.labels = {f"gene_{g}": together for g in range(np.iinfo(np.uint16).max)}
+    counts.same[:] = counts.shared[:] = np.iinfo(np.uint16).max
+    counts.add("gene_new", together)
+    assert counts.same.dtype == np.uint32 and counts.same[0, 1] == counts.shared[1, 1] == 65536
+    with pytest.raises(ValueError):
+        counts.add("gene_new", together)
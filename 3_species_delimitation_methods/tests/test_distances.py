@@ -0,0 +1,202 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the shared JC69 distance matrices (cgcd/distances.py) against the JC69 of the abgd and asap
+executables: pure Python ports of their distanceJC69 loops and, when the executables can run here, their outputs on
+the alignment and on the phylip matrix.
+Date: 2026-10-17
+"""
+
+import math
+import os
+import subprocess
+
+import numpy as np
+import pytest
+
+from cgcd.abgd import _compare_dna
+from cgcd.distances import (MAX_P_SUFFIX, MODEL_SUFFIX, DistanceCache, distance_input, fasta_distance_matrix,
+                            read_phylip, shared_matrix, write_distance_file)
+
+
+def _pair_jc69(s1, s2, tool):
+    """distanceJC69 of ABGD (abgdCore.c) or ASAP (oldfns.c) for one pair of sequences."""
+    v, newl = 0.0, 0
+    for c1, c2 in zip(s1.upper(), s2.upper()):
+        if c1 not in "-N" and c2 not in "-N":
+            newl += 1
+        if _compare_dna(c1, c2) == 0:
+            v += 1
+    if tool == "abgd":
+        if newl != 0:
+            v /= newl
+        if v > 0.74:
+            v = 0.74
+    else:
+        v /= newl
+        if v >= 0.75:
+            v = 0.74
+    return (-3.0 / 4.0) * math.log(1.0 - ((4.0 / 3.0) * v)) + 0.0
+
+
+def tool_jc69(sequences, tool):
+    n = len(sequences)
+    matrix = np.zeros((n, n))
+    for a in range(n):
+        for b in range(a + 1, n):
+            matrix[a, b] = matrix[b, a] = _pair_jc69(sequences[a], sequences[b], tool)
+    return matrix
+
+
+def write_fasta(path, sequences):
+    with open(path, "w") as f:
+        for i, seq in enumerate(sequences):
+            f.write(f">s{i}\n{seq}\n")
+    return path
+
+
+def random_alignment(rng, n=12, length=300, rate=0.05, alphabet="ACGT", missing=0.03):
+    """Two clusters of mutated sequences (centers 20% apart), with gaps and N at a few sites."""
+    centers = [rng.choice(list("ACGT"), length)]
+    centers.append(centers[0].copy())
+    diverged = rng.random(length) < 0.2
+    centers[1][diverged] = rng.choice(list("ACGT"), diverged.sum())
+    sequences = []
+    for i in range(n):
+        seq = centers[i % 2].copy()
+        mutated = rng.random(length) < rate
+        seq[mutated] = rng.choice(list(alphabet), mutated.sum())
+        lost = rng.random(length) < missing
+        seq[lost] = rng.choice(["-", "N", "n"], lost.sum())
+        sequences.append("".join(seq))
+    return sequences
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_jc69_matches_both_tools(tmp_path, seed):
+    sequences = random_alignment(np.random.default_rng(seed))
+    fasta_path = write_fasta(tmp_path / "gene.fasta", sequences)
+    _, matrix = fasta_distance_matrix(fasta_path, "jc69")
+    for tool in ("abgd", "asap"):
+        np.testing.assert_allclose(matrix, tool_jc69(sequences, tool), rtol=1e-12, atol=1e-15)
+
+    phylip_path = tmp_path / "gene.phy"
+    assert write_distance_file(fasta_path, phylip_path, "jc69")
+    names, written = read_phylip(phylip_path)
+    assert names == [f"s{i}" for i in range(len(sequences))]
+    np.testing.assert_allclose(written, matrix, atol=1e-10)
+
+
+def test_ambiguity_codes_keep_the_alignment(tmp_path):
+    sequences = random_alignment(np.random.default_rng(0), alphabet="ACGTRYKM")
+    fasta_path = write_fasta(tmp_path / "gene.fasta", sequences)
+    # The executables count ambiguity codes as partial matches, the matrix does not
+    _, matrix = fasta_distance_matrix(fasta_path, "jc69")
+    assert not np.allclose(matrix, tool_jc69(sequences, "abgd"))
+
+    distance_dir = tmp_path / "distances"
+    distance_dir.mkdir()
+    assert distance_input(str(fasta_path), str(distance_dir), "jc69") == str(fasta_path)
+    assert not os.listdir(distance_dir)
+
+
+def test_near_saturated_pair_keeps_the_alignment(tmp_path):
+    # p = 0.745 between the two sequences: capped by ABGD (p > 0.74) but not by ASAP (p >= 0.75)
+    length = 200
+    s1 = "A" * length
+    s2 = "C" * 149 + "A" * 51
+    assert _pair_jc69(s1, s2, "abgd") != _pair_jc69(s1, s2, "asap")
+    fasta_path = write_fasta(tmp_path / "gene.fasta", [s1, s2, s1])
+    assert not write_distance_file(fasta_path, tmp_path / "gene.phy", "jc69")
+    assert not os.path.exists(tmp_path / "gene.phy")
+
+    # p = 0.74 exactly is treated alike by both executables
+    s2 = "C" * 148 + "A" * 52
+    assert _pair_jc69(s1, s2, "abgd") == _pair_jc69(s1, s2, "asap")
+    fasta_path = write_fasta(tmp_path / "gene.fasta", [s1, s2, s1])
+    assert write_distance_file(fasta_path, tmp_path / "gene.phy", "jc69")
+
+
+def test_model_change_rewrites_the_matrix(tmp_path):
+    sequences = random_alignment(np.random.default_rng(1))
+    fasta_path = write_fasta(tmp_path / "gene.fasta", sequences)
+    phylip_path = tmp_path / "gene.phy"
+    assert write_distance_file(fasta_path, phylip_path, "jc69")
+    assert write_distance_file(fasta_path, phylip_path, "p")
+    _, written = read_phylip(phylip_path)
+    np.testing.assert_allclose(written, fasta_distance_matrix(fasta_path, "p")[1], atol=1e-10)
+    with open(f"{phylip_path}{MODEL_SUFFIX}") as f:
+        assert f.read().strip() == "p"
+
+
+def test_cache_keeps_one_matrix_and_max_p_per_gene(tmp_path):
+    sequences = random_alignment(np.random.default_rng(2))
+    fasta_path = write_fasta(tmp_path / "gene.fasta", sequences)
+    cache = DistanceCache(tmp_path / "cache")
+    assert write_distance_file(fasta_path, tmp_path / "gene.phy", "jc69", cache)
+    entries = sorted(os.listdir(tmp_path / "cache"))
+    assert len(entries) == 2 and entries[0].endswith(".max_p") and entries[1].endswith(".npy")
+
+    # The largest p-distance comes from the sidecar on the next run, the p-distance matrix is never stored
+    _, p_distances = fasta_distance_matrix(fasta_path, "p")
+    names, matrix, max_p = shared_matrix(fasta_path, "jc69", cache)
+    assert max_p == p_distances.max()
+    np.testing.assert_array_equal(matrix, fasta_distance_matrix(fasta_path, "jc69")[1])
+    key = cache.key(fasta_path, "jc69")
+    assert os.path.isfile(os.path.join(tmp_path / "cache", f"{key}{MAX_P_SUFFIX}"))
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = DistanceCache(tmp_path / "cache", max_bytes=0)
+    keys = []
+    for seed in range(3):
+        fasta_path = write_fasta(tmp_path / f"gene{seed}.fasta", random_alignment(np.random.default_rng(seed)))
+        shared_matrix(fasta_path, "jc69", cache)
+        keys.append(cache.key(fasta_path, "jc69"))
+        os.utime(cache.path(keys[-1]), (seed, seed))
+    size = os.path.getsize(cache.path(keys[0]))
+    cache.max_bytes = 2 * size
+    cache.load(keys[0])  # now the most recently used
+    assert cache.evict() == 1
+    assert not os.path.exists(cache.path(keys[1])) and not os.path.exists(cache.max_p_path(keys[1]))
+    assert os.path.isfile(cache.path(keys[0])) and os.path.isfile(cache.path(keys[2]))
+
+
+def _outputs(out_dir, suffixes):
+    """Contents of the output files of a run, keyed on their name without the input file prefix."""
+    outputs = {}
+    for fname in os.listdir(out_dir):
+        for suffix in suffixes:
+            if suffix in fname:
+                with open(os.path.join(out_dir, fname)) as f:
+                    outputs[fname[fname.index(suffix):]] = f.read()
+    return outputs
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_executables_give_the_same_partitions(tmp_path, executable, seed):
+    abgd = executable("abgd")
+    asap = executable("asap")
+    sequences = random_alignment(np.random.default_rng(seed), n=16, length=400)
+    fasta_path = write_fasta(tmp_path / "gene.fasta", sequences)
+    phylip_path = tmp_path / "gene.phy"
+    assert write_distance_file(fasta_path, phylip_path, "jc69")
+
+    # Run from the output folder like 4_1_asap.py (asap writes its .res.cvs in the working directory), with a fixed
+    # ASAP seed
+    runs = {}
+    for name, cmd in [
+        ("abgd_fasta", [abgd, "-a", "-o", ".", str(fasta_path)]),
+        ("abgd_phylip", [abgd, "-a", "-o", ".", str(phylip_path)]),
+        ("asap_fasta", [asap, "-a", "-x", "1", "-o", ".", str(fasta_path)]),
+        ("asap_phylip", [asap, "-a", "-x", "1", "-l", str(len(sequences[0])), "-o", ".", str(phylip_path)]),
+    ]:
+        (tmp_path / name).mkdir()
+        subprocess.run(cmd, capture_output=True, cwd=tmp_path / name, timeout=300)
+        runs[name] = tmp_path / name
+
+    abgd_fasta = _outputs(runs["abgd_fasta"], (".res.cvs", ".part."))
+    assert ".res.cvs" in abgd_fasta
+    assert abgd_fasta == _outputs(runs["abgd_phylip"], (".res.cvs", ".part."))
+    asap_fasta = _outputs(runs["asap_fasta"], (".res.cvs", ".Partition_"))
+    assert ".res.cvs" in asap_fasta
+    assert asap_fasta == _outputs(runs["asap_phylip"], (".res.cvs", ".Partition_"))
@@ -0,0 +1,122 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the core-gene extraction engine (cgcd/extraction.py) on a small Roary table and three Prokka
+.ffn files (tests/data/roary, tests/data/prokka): locus-tag resolution through the per-strain .ffn indexes,
+including the prefix-tolerant fallback, and identical outputs in gene-major, strain-major and parallel (--workers)
+modes.
+Date: 2026-10-17
+"""
+
+import os
+import shutil
+from collections import Counter
+
+import pytest
+from Bio import SeqIO
+
+from cgcd.extraction import FfnIndex, extract_core_genes, split_gene_ids, strain_ffn_path, strip_id_prefix
+from cgcd.roary import read_core_genes
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+ROARY_CSV = os.path.join(DATA_DIR, "roary", "gene_presence_absence.csv")
+PROKKA_DIR = os.path.join(DATA_DIR, "prokka")
+
+
+def ffn_sequences(strain):
+    """{record ID: sequence} of the .ffn fixture of a strain."""
+    return {record.id: str(record.seq) for record in SeqIO.parse(strain_ffn_path(PROKKA_DIR, strain), "fasta")}
+
+
+def fasta_outputs(output_dir):
+    """{file name: text} of the core-gene FASTA files of an extraction."""
+    outputs = {}
+    for fname in sorted(os.listdir(output_dir)):
+        if fname.endswith(".fasta"):
+            with open(os.path.join(output_dir, fname)) as f:
+                outputs[fname] = f.read()
+    return outputs
+
+
+def extract(output_dir, min_presence=1.0, prokka_dir=PROKKA_DIR, **options):
+    """Run the extraction of the fixtures; returns (outputs, missing-data rows, match counts)."""
+    os.makedirs(output_dir, exist_ok=True)
+    core_genes, strain_columns = read_core_genes(ROARY_CSV, min_presence=min_presence)
+    missing_data, match_counts = extract_core_genes(core_genes, strain_columns, prokka_dir, str(output_dir), **options)
+    return fasta_outputs(output_dir), missing_data, match_counts
+
+
+def test_split_gene_ids_and_prefix():
+    assert split_gene_ids("A_00009 A_00004") == ["A_00009", "A_00004"]
+    assert split_gene_ids("A_00009;A_00004; ") == ["A_00009", "A_00004"]
+    assert strip_id_prefix("gnl|CENTRE|C_00002") == "C_00002"
+    assert strip_id_prefix("C_00002") == "C_00002"
+
+
+def test_index_prefers_exact_ids():
+    wanted = {"C_00001", "C_00002", "C_00003"}
+    index = FfnIndex(strain_ffn_path(PROKKA_DIR, "C"), wanted)
+    assert sorted(index.exact) == ["C_00001"] and not index.fallback
+    assert index.lookup(["C_00002"]) == (None, "not found")
+
+    index = FfnIndex(strain_ffn_path(PROKKA_DIR, "C"), wanted, prefix_fallback=True)
+    assert sorted(index.fallback) == ["C_00001", "C_00002"]
+    record, match = index.lookup(["C_00001"])
+    assert (record.id, match) == ("C_00001", "exact")
+    record, match = index.lookup(["C_00003", "C_00002"])
+    assert (record.id, match) == ("gnl|CENTRE|C_00002", "fallback")
+
+
+def test_gene_major_extraction(tmp_path):
+    outputs, missing_data, match_counts = extract(tmp_path / "exact")
+    assert list(outputs) == ["dnaK.fasta", "gyrB.fasta", "recA.fasta", "rpoB.fasta"]
+    recA = {record.id: str(record.seq) for record in SeqIO.parse(tmp_path / "exact" / "recA.fasta", "fasta")}
+    assert recA == {"A": ffn_sequences("A")["A_00001"], "B": ffn_sequences("B")["B_00001"],
+                    "C": ffn_sequences("C")["C_00001"]}
+
+    # First listed locus tag present in the .ffn
+    dnaK = {record.id: str(record.seq) for record in SeqIO.parse(tmp_path / "exact" / "dnaK.fasta", "fasta")}
+    assert dnaK["A"] == ffn_sequences("A")["A_00004"]
+
+    assert missing_data == [("gyrB", "C", "Gene ID not found in .ffn"), ("rpoB", "B", "Gene ID not found in .ffn")]
+    assert match_counts == Counter({"exact": 10, "not found": 2})
+
+
+def test_prefix_fallback(tmp_path):
+    outputs, missing_data, match_counts = extract(tmp_path / "fallback", prefix_fallback=True)
+    gyrB = {record.id: str(record.seq) for record in SeqIO.parse(tmp_path / "fallback" / "gyrB.fasta", "fasta")}
+    assert gyrB["C"] == ffn_sequences("C")["gnl|CENTRE|C_00002"]
+    assert missing_data == [("rpoB", "B", "Gene ID not found in .ffn")]
+    assert match_counts == Counter({"exact": 10, "fallback": 1, "not found": 1})
+
+    # Only gyrB changes: the exact C_00001 still wins over gnl|CENTRE|C_00001
+    exact_outputs, _, _ = extract(tmp_path / "exact")
+    assert {name for name in outputs if outputs[name] != exact_outputs[name]} == {"gyrB.fasta"}
+
+
+@pytest.mark.parametrize("min_presence", [1.0, 0.6])
+@pytest.mark.parametrize("prefix_fallback", [False, True])
+def test_strain_major_matches_gene_major(tmp_path, min_presence, prefix_fallback):
+    gene_major = extract(tmp_path / "gene_major", min_presence, prefix_fallback=prefix_fallback)
+    strain_major = extract(tmp_path / "strain_major", min_presence, prefix_fallback=prefix_fallback,
+                           strain_major=True)
+    assert strain_major == gene_major
+
+
+def test_strain_major_with_a_missing_ffn(tmp_path):
+    prokka_dir = tmp_path / "prokka"
+    shutil.copytree(PROKKA_DIR, prokka_dir)
+    shutil.rmtree(prokka_dir / "B")
+    gene_major = extract(tmp_path / "gene_major", prokka_dir=str(prokka_dir))
+    assert ("recA", "B", "Missing .ffn file") in gene_major[1]
+    assert extract(tmp_path / "strain_major", prokka_dir=str(prokka_dir), strain_major=True) == gene_major
+
+    # Leftover gene files of an earlier run are rewritten, not appended to
+    assert extract(tmp_path / "strain_major", prokka_dir=str(prokka_dir), strain_major=True) == gene_major
+
+
+@pytest.mark.parametrize("prefix_fallback", [False, True])
+def test_workers_match_the_serial_run(tmp_path, prefix_fallback):
+    serial = extract(tmp_path / "serial", 0.6, prefix_fallback=prefix_fallback)
+    assert extract(tmp_path / "workers_2", 0.6, prefix_fallback=prefix_fallback, workers=2) == serial
+    assert extract(tmp_path / "workers_3", 0.6, prefix_fallback=prefix_fallback, workers=3,
+                   strain_major=True) == serial
@@ -0,0 +1,128 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the haplotype deduplication (cgcd/haplotypes.py): genes with one haplotype, genes too small to be
+collapsed, and the same ABGD and ASAP partitions of the strains with and without deduplication.
+Date: 2026-10-17
+"""
+
+import csv
+import os
+import subprocess
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from cgcd.abgd import abgd_fasta
+from cgcd.haplotypes import MIN_HAPLOTYPES, collapse_fasta, dedup_fastas, expand_assignment, load_haplotype_map
+
+
+def simulated_gene(seed, n_species=3, n_haplotypes=8, n_strains=60, length=400):
+    """Strains sampling the haplotypes of a few species (species 12% apart, haplotypes 0.5% apart)."""
+    rng = np.random.default_rng(seed)
+    base = rng.choice(list("ACGT"), length)
+    haplotypes = []
+    for _ in range(n_species):
+        center = base.copy()
+        mutated = rng.random(length) < 0.12
+        center[mutated] = rng.choice(list("ACGT"), mutated.sum())
+        for _ in range(n_haplotypes):
+            seq = center.copy()
+            mutated = rng.random(length) < 0.005
+            seq[mutated] = rng.choice(list("ACGT"), mutated.sum())
+            haplotypes.append("".join(seq))
+    return [haplotypes[int(rng.integers(len(haplotypes)))] for _ in range(n_strains)]
+
+
+def write_fasta(path, sequences):
+    with open(path, "w") as f:
+        for i, seq in enumerate(sequences):
+            f.write(f">s{i}\n{seq}\n")
+    return path
+
+
+def fasta_ids(path):
+    with open(path) as f:
+        return [line[1:].strip() for line in f if line.startswith(">")]
+
+
+def strain_groups(group_of, members):
+    """Partition of the strains as sorted groups, whatever the group labels."""
+    groups = {}
+    for strain, group in expand_assignment(group_of, members).items():
+        groups.setdefault(group, []).append(strain)
+    return sorted(sorted(strains) for strains in groups.values())
+
+
+def abgd_partition(fasta_path):
+    """ABGD partition picked like 3_2_abgd_analysis.py: the last step with the most frequent number of groups."""
+    names, steps = abgd_fasta(fasta_path)
+    n_groups = [step["recursive"].max() + 1 for step in steps]
+    top = Counter(n_groups).most_common(1)[0][0]
+    step = steps[max(i for i, n in enumerate(n_groups) if n == top)]
+    return dict(zip(names, step["recursive"]))
+
+
+def asap_partition(asap, fasta_path, out_dir):
+    """First ASAP partition, read like 4_2_asap_analysis.py (run from its output folder, with a fixed seed)."""
+    os.makedirs(out_dir)
+    subprocess.run([asap, "-a", "-x", "1", "-o", ".", os.path.abspath(fasta_path)], capture_output=True,
+                   cwd=out_dir, timeout=300)
+    prefix = os.path.join(out_dir, os.path.basename(fasta_path))
+    with open(f"{prefix}.res.cvs") as f:
+        first = f.read().splitlines()[1].split()[0]
+    with open(f"{prefix}.Partition_{first}.csv") as f:
+        return {row[0].strip(): row[1].strip() for row in csv.reader(f) if len(row) >= 2}
+
+
+def test_single_haplotype_gene_is_one_group(tmp_path):
+    input_dir = tmp_path / "genes"
+    input_dir.mkdir()
+    write_fasta(input_dir / "same.fasta", ["ACGTACGT"] * 4)
+    write_fasta(input_dir / "small.fasta", ["ACGTACGT", "ACGTACGA", "ACGTACGT", "acgtacga"])
+    n_sequences, n_haplotypes, single_genes, kept_genes = dedup_fastas(input_dir, tmp_path / "dedup",
+                                                                       tmp_path / "map.csv")
+    assert single_genes == ["same"] and kept_genes == ["small"]
+    assert not os.path.exists(tmp_path / "dedup" / "same.fasta")
+    haplotype_map = load_haplotype_map(tmp_path / "map.csv")
+    assert haplotype_map["same"] == {"s0": ["s0", "s1", "s2", "s3"]}
+
+    # Below MIN_HAPLOTYPES the gene is written unchanged, each strain being its own haplotype
+    assert fasta_ids(tmp_path / "dedup" / "small.fasta") == ["s0", "s1", "s2", "s3"]
+    assert haplotype_map["small"] == {f"s{i}": [f"s{i}"] for i in range(4)}
+    assert (n_sequences, n_haplotypes) == (8, 5)
+
+
+def test_large_gene_is_collapsed(tmp_path):
+    sequences = simulated_gene(2)
+    fasta_path = write_fasta(tmp_path / "gene.fasta", sequences)
+    members = collapse_fasta(fasta_path, tmp_path / "dedup.fasta")
+    assert len(members) == len(set(sequences)) >= MIN_HAPLOTYPES
+    assert fasta_ids(tmp_path / "dedup.fasta") == list(members)
+    for haplotype, strains in members.items():
+        assert len({sequences[int(strain[1:])] for strain in strains}) == 1
+        assert haplotype == strains[0]
+
+    # The same gene is left unchanged when the threshold is above its number of haplotypes
+    members = collapse_fasta(fasta_path, tmp_path / "kept.fasta", min_haplotypes=len(set(sequences)) + 1)
+    assert fasta_ids(tmp_path / "kept.fasta") == fasta_ids(fasta_path)
+    assert all(strains == [haplotype] for haplotype, strains in members.items())
+
+
+@pytest.mark.parametrize("seed", [2, 3, 4, 6])
+def test_dedup_keeps_the_abgd_partition(tmp_path, seed):
+    fasta_path = write_fasta(tmp_path / "gene.fasta", simulated_gene(seed))
+    members = collapse_fasta(fasta_path, tmp_path / "dedup.fasta")
+    assert len(members) >= MIN_HAPLOTYPES
+    assert strain_groups(abgd_partition(tmp_path / "dedup.fasta"), members) == \
+        strain_groups(abgd_partition(fasta_path), {})
+
+
+@pytest.mark.parametrize("seed", [2, 3, 4, 6])
+def test_dedup_keeps_the_asap_partition(tmp_path, executable, seed):
+    asap = executable("asap")
+    fasta_path = write_fasta(tmp_path / "gene.fasta", simulated_gene(seed))
+    members = collapse_fasta(fasta_path, tmp_path / "dedup.fasta")
+    plain = asap_partition(asap, fasta_path, tmp_path / "plain")
+    dedup = asap_partition(asap, tmp_path / "dedup.fasta", tmp_path / "dedup")
+    assert strain_groups(dedup, members) == strain_groups(plain, {})
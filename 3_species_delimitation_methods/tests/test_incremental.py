@@ -0,0 +1,98 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the incremental core-gene extraction (cgcd/incremental.py) on the Roary and Prokka fixtures of
+tests/data: strains added to a previous run, a re-annotated strain (.ffn hash change) and a gene that is no longer
+core, each compared with a full extraction of the same inputs.
+Date: 2026-10-17
+"""
+
+import os
+import shutil
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from cgcd.extraction import extract_core_genes, strain_ffn_path
+from cgcd.incremental import HASHES_NAME, INVALIDATED_NAME, MANIFEST_NAME, extract_incremental
+from cgcd.roary import read_core_genes
+
+from test_extraction import PROKKA_DIR, ROARY_CSV, fasta_outputs
+
+
+@pytest.fixture
+def prokka_dir(tmp_path):
+    """Copy of the Prokka fixtures, which the tests modify."""
+    shutil.copytree(PROKKA_DIR, tmp_path / "prokka")
+    return str(tmp_path / "prokka")
+
+
+def full_extraction(core_genes, strain_columns, prokka_dir, output_dir):
+    os.makedirs(output_dir)
+    missing_data, _ = extract_core_genes(core_genes, strain_columns, prokka_dir, str(output_dir))
+    return fasta_outputs(output_dir), missing_data
+
+
+def incremental(core_genes, strain_columns, prokka_dir, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    missing_data, match_counts = extract_incremental(core_genes, strain_columns, prokka_dir, str(output_dir))
+    return fasta_outputs(output_dir), missing_data, match_counts
+
+
+def test_added_strains_are_appended(tmp_path, prokka_dir):
+    core_genes, strain_columns = read_core_genes(ROARY_CSV)
+    strain_columns = list(strain_columns)
+    out_dir = tmp_path / "incremental"
+
+    # First run on strains A and B, like a full extraction
+    outputs, missing_data, _ = incremental(core_genes.drop(columns=["C"]), ["A", "B"], prokka_dir, out_dir)
+    assert (outputs, missing_data) == full_extraction(core_genes.drop(columns=["C"]), ["A", "B"], prokka_dir,
+                                                      tmp_path / "full_ab")
+
+    # Adding C only resolves the locus tags of C, appended at the end of the existing files
+    outputs, missing_data, match_counts = incremental(core_genes, strain_columns, prokka_dir, out_dir)
+    assert match_counts == Counter({"exact": 3, "not found": 1})
+    assert (outputs, missing_data) == full_extraction(core_genes, strain_columns, prokka_dir, tmp_path / "full")
+
+    # Nothing left to extract on an unchanged rerun
+    outputs_again, _, match_counts = incremental(core_genes, strain_columns, prokka_dir, out_dir)
+    assert outputs_again == outputs and not match_counts
+
+
+def test_reannotated_strain_is_extracted_again(tmp_path, prokka_dir):
+    core_genes, strain_columns = read_core_genes(ROARY_CSV)
+    strain_columns = list(strain_columns)
+    out_dir = tmp_path / "incremental"
+    before, _, _ = incremental(core_genes, strain_columns, prokka_dir, out_dir)
+    hashes = pd.read_csv(out_dir / HASHES_NAME, index_col="Strain")["Hash"]
+
+    # Re-annotate C: new sequence for C_00001
+    ffn_path = strain_ffn_path(prokka_dir, "C")
+    with open(ffn_path) as f:
+        text = f.read()
+    with open(ffn_path, "w") as f:
+        f.write(text.replace(">C_00001 hypothetical protein 2\n", ">C_00001 hypothetical protein 2\nACGTACGTAC\n"))
+
+    outputs, missing_data, match_counts = incremental(core_genes, strain_columns, prokka_dir, out_dir)
+    assert (outputs, missing_data) == full_extraction(core_genes, strain_columns, prokka_dir, tmp_path / "full")
+    assert outputs["recA.fasta"] != before["recA.fasta"]
+    assert sum(match_counts.values()) == 12  # every gene listing C is rebuilt
+
+    new_hashes = pd.read_csv(out_dir / HASHES_NAME, index_col="Strain")["Hash"]
+    assert new_hashes["C"] != hashes["C"] and new_hashes["A"] == hashes["A"]
+    manifest = pd.read_csv(out_dir / MANIFEST_NAME, dtype=str, keep_default_na=False)
+    assert set(manifest.loc[manifest["Strain"] == "C", "Source_hash"]) == {new_hashes["C"]}
+
+
+def test_gene_no_longer_core_is_invalidated(tmp_path, prokka_dir):
+    core_genes, strain_columns = read_core_genes(ROARY_CSV)
+    strain_columns = list(strain_columns)
+    out_dir = tmp_path / "incremental"
+    incremental(core_genes, strain_columns, prokka_dir, out_dir)
+
+    kept = core_genes[core_genes["Gene"] != "dnaK"]
+    outputs, missing_data, match_counts = incremental(kept, strain_columns, prokka_dir, out_dir)
+    assert not match_counts
+    with open(out_dir / INVALIDATED_NAME) as f:
+        assert f.read().split() == ["dnaK"]
+    assert (outputs, missing_data) == full_extraction(kept, strain_columns, prokka_dir, tmp_path / "full")
@@ -0,0 +1,42 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the streaming Roary reader (cgcd/roary.py) on a small gene_presence_absence.csv
+(tests/data/roary): strict and soft core genes, column types, and a table without gene rows.
+Date: 2026-10-17
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from cgcd.roary import min_isolates, read_core_genes
+
+ROARY_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "roary", "gene_presence_absence.csv")
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 1000])
+def test_strict_core_genes(chunksize):
+    core_genes, strain_columns = read_core_genes(ROARY_CSV, chunksize=chunksize)
+    assert list(strain_columns) == ["A", "B", "C"]
+    assert list(core_genes.columns) == ["Gene", "No. isolates", "A", "B", "C"]
+    assert list(core_genes.index) == [0, 1, 3, 5]
+    assert list(core_genes["Gene"]) == ["recA", "gyrB", "dnaK", "rpoB"]
+    assert core_genes["No. isolates"].dtype == "int64"
+    assert core_genes.loc[3, "A"] == "A_00009 A_00004"
+
+
+def test_soft_core_genes():
+    assert min_isolates(3, 0.6) == 2
+    core_genes, _ = read_core_genes(ROARY_CSV, min_presence=0.6, chunksize=2)
+    assert list(core_genes.index) == [0, 1, 2, 3, 5]
+    assert pd.isna(core_genes.loc[2, "Gene"]) and pd.isna(core_genes.loc[2, "C"])
+
+
+def test_no_gene_rows(tmp_path):
+    csv_path = tmp_path / "gene_presence_absence.csv"
+    with open(ROARY_CSV) as f:
+        csv_path.write_text(f.readline())
+    core_genes, strain_columns = read_core_genes(csv_path)
+    assert core_genes.empty and list(core_genes.columns) == ["Gene", "No. isolates", *strain_columns]
+    assert core_genes["No. isolates"].dtype == "int64"
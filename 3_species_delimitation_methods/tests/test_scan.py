@@ -0,0 +1,75 @@
+"""
+Author: Khaoula El Mchachti
+Description: Tests of the one-pass threshold scan (cgcd/scan.py): group counts of the union-find sweep against the
+connected components computed separately at every threshold.
+Date: 2026-10-17
+"""
+
+import numpy as np
+import pytest
+
+from cgcd.conspecificity import PackedMatrix
+from cgcd.scan import UnionFind, threshold_scan
+
+
+def packed(matrix, strains=None):
+    n = len(matrix)
+    return PackedMatrix(np.asarray(matrix)[np.triu_indices(n)], strains or [f"s{i}" for i in range(n)])
+
+
+def components(matrix, threshold):
+    """Connected components of the strains linked at threshold (value >= threshold), by depth-first search."""
+    n = len(matrix)
+    group = [-1] * n
+    groups = []
+    for start in range(n):
+        if group[start] >= 0:
+            continue
+        group[start] = len(groups)
+        stack, members = [start], []
+        while stack:
+            i = stack.pop()
+            members.append(i)
+            for j in range(n):
+                if j != i and group[j] < 0 and matrix[i][j] >= threshold:
+                    group[j] = group[start]
+                    stack.append(j)
+        groups.append(members)
+    return groups
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_scan_matches_the_components_at_every_threshold(seed):
+    rng = np.random.default_rng(seed)
+    n = 30
+    # Three blocks of strongly linked strains, weakly linked to each other
+    blocks = rng.integers(0, 3, n)
+    matrix = np.where(blocks[:, None] == blocks[None, :], rng.integers(60, 101, (n, n)), rng.integers(0, 70, (n, n)))
+    matrix = np.triu(matrix, 1) + np.triu(matrix, 1).T + np.diag(np.full(n, 100))
+    marked = sorted(rng.choice(n, 5, replace=False).tolist())
+
+    thresholds = [100, 0, 55, 70, 70, 101, 85, 1, 60]
+    scan = threshold_scan(packed(matrix), thresholds, marked)
+    assert [threshold for threshold, _, _ in scan] == thresholds
+    for threshold, n_groups, n_marked_groups in scan:
+        groups = components(matrix, threshold)
+        assert n_groups == len(groups)
+        assert n_marked_groups == sum(any(i in marked for i in members) for members in groups)
+
+
+def test_scan_edge_cases():
+    matrix = np.array([[5, 3, 0], [3, 5, 3], [0, 3, 5]])
+    assert threshold_scan(packed(matrix), []) == []
+    assert threshold_scan(packed(matrix), [6, 3, 4], marked=[0, 2]) == [(6, 3, 2), (3, 1, 1), (4, 3, 2)]
+    assert threshold_scan(packed([[1]]), [0, 1, 2], marked=[0]) == [(0, 1, 1), (1, 1, 1), (2, 1, 1)]
+
+
+def test_union_find_counts():
+    groups = UnionFind(5, marked=[1, 3])
+    assert (groups.n_components, groups.n_marked_components) == (5, 2)
+    assert groups.union(0, 1) and groups.union(2, 0)
+    assert not groups.union(1, 2)
+    assert (groups.n_components, groups.n_marked_components) == (3, 2)
+    assert groups.union(3, 2)
+    assert (groups.n_components, groups.n_marked_components) == (2, 1)
+    assert groups.find(3) == groups.find(0) != groups.find(4)
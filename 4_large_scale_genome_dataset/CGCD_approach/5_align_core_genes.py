@@ -2,29 +2,102 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Align all core gene FASTA files using MAFFT
+Description: Align all core gene FASTA files using MAFFT (several alignments at once within a budget of CPU cores)
 Input: core_genes_fasta/*.fasta
-Output: core_genes_aligned/*_aligned.fasta
+Output: core_genes_aligned/*_aligned.fasta, mafft_failed_genes.txt, haplotype_map.csv (with --dedup), alignment_cache/
 Date: 2026-04-12
 """
 
 import os
-import subprocess
+import sys
+import argparse
+
+# Shared CGCD helpers
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../3_species_delimitation_methods"))
+from cgcd.align import AlignmentCache, align_fastas
+from cgcd.haplotypes import HAPLOTYPE_MAP_NAME, MIN_HAPLOTYPES, dedup_fastas
 
 # Define input/output
 input_dir = os.path.expanduser("core_genes_fasta")
 output_dir = os.path.expanduser("core_genes_aligned")
+haplotype_dir = os.path.expanduser("core_genes_haplotypes")
+cache_dir = os.path.expanduser("alignment_cache")
+failed_log_path = os.path.join(output_dir, "mafft_failed_genes.txt")
+haplotype_map_path = os.path.join(output_dir, HAPLOTYPE_MAP_NAME)
+
+
+def main():
+    # Command-line options
+    parser = argparse.ArgumentParser(description="Align the core gene FASTA files with MAFFT")
+    parser.add_argument("--cores", type=int, default=os.cpu_count(),
+                        help="Total number of CPU cores shared by the MAFFT jobs [Default: all cores]")
+    parser.add_argument("--threads-per-job", type=int, default=1,
+                        help="MAFFT --thread value of each job [Default: 1]")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="Number of times a failed alignment is retried [Default: 1]")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Collapse identical sequences into haplotypes before alignment; ABGD/ASAP partitions are "
+                             "expanded back to strains with the haplotype map saved next to the alignments")
+    parser.add_argument("--min-haplotypes", type=int, default=MIN_HAPLOTYPES,
+                        help="With --dedup, genes with fewer distinct sequences are aligned without collapsing, so "
+                             f"that ABGD/ASAP give the same partitions [Default: {MIN_HAPLOTYPES}]")
+    parser.add_argument("--cache-dir", default=cache_dir,
+                        help="Directory of the alignment cache (unchanged genes are restored instead of realigned)")
+    parser.add_argument("--cache-size-mb", type=float, default=2048,
+                        help="Maximum size of the alignment cache, least recently used alignments are evicted [Default: 2048]")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Realign every gene without using the alignment cache")
+    args = parser.parse_args()
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    print("===== Starting MAFFT alignments =====")
+
+    # Collapse identical sequences of each gene into haplotypes (the map is needed to expand the partitions later)
+    fasta_dir = input_dir
+    if args.dedup:
+        n_sequences, n_haplotypes, single_genes, kept_genes = dedup_fastas(input_dir, haplotype_dir, haplotype_map_path,
+                                                                           args.min_haplotypes)
+        print(f"{n_sequences} sequences collapsed into {n_haplotypes} haplotypes (map saved to {haplotype_map_path})")
+        fasta_dir = haplotype_dir
+
+        # Genes with a single haplotype are one group without alignment: drop their alignments of an earlier run
+        for gene in single_genes:
+            stale_path = os.path.join(output_dir, f"{gene}_aligned.fasta")
+            if os.path.isfile(stale_path):
+                os.remove(stale_path)
+        print(f"{len(single_genes)} genes with a single haplotype are not aligned (one group each)")
+        print(f"{len(kept_genes)} genes aligned without collapsing (fewer than {args.min_haplotypes} haplotypes "
+              "or no shared sequence)")
+    elif os.path.isfile(haplotype_map_path):
+        # The alignments now contain every strain, so a map from an earlier run must not be applied
+        os.remove(haplotype_map_path)
+
+    # One job per core gene FASTA file
+    jobs = [
+        (os.path.join(fasta_dir, fasta_file),
+         os.path.join(output_dir, fasta_file.replace(".fasta", "_aligned.fasta")))
+        for fasta_file in os.listdir(fasta_dir) if fasta_file.endswith(".fasta")
+    ]
+
+    # Alignments of unchanged genes (same sequences, MAFFT version and options) are reused
+    cache = None
+    if not args.no_cache:
+        cache = AlignmentCache(args.cache_dir, max_bytes=int(args.cache_size_mb * 1024 ** 2))
 
-os.makedirs(output_dir, exist_ok=True)
+    # Run the remaining alignments in parallel (largest genes first)
+    failed = align_fastas(jobs, cores=args.cores, threads_per_job=args.threads_per_job, retries=args.retries,
+                          cache=cache)
 
-print("===== Starting MAFFT alignments =====")
+    # Save the genes that could not be aligned
+    with open(failed_log_path, "w") as f:
+        f.writelines(f"{os.path.basename(path)}\n" for path in failed)
+    if failed:
+        print(f"{len(failed)} alignments failed, listed in: {failed_log_path}")
 
-for fasta_file in os.listdir(input_dir):
-    if fasta_file.endswith(".fasta"):
-        input_path = os.path.join(input_dir, fasta_file)
-        output_path = os.path.join(output_dir, fasta_file.replace(".fasta", "_aligned.fasta"))
+    print("All alignments saved to:", output_dir)
 
-        print(f"Aligning {fasta_file}...")
-        subprocess.run(["mafft", "--auto", input_path], stdout=open(output_path, "w"))
 
-print("All alignments saved to:", output_dir)
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,32 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Run ABGD on each aligned core-gene (one gene at a time)
+Description: Run ABGD on each aligned core-gene (several genes at a time with --jobs; genes already finished with the same alignment and parameters are skipped, see abgd_manifest.jsonl). With --engine python, ABGD runs in-process (cgcd/abgd.py, a NumPy port of the binary) and only the .res.cvs and partition files are written
 Input: core_genes_aligned/
-Output: ABGD_results/<gene_name>/ (ABGD results per gene), failed_abgd_genes.txt (log file listing failures) and abgd_warnings.txt (listing genes with warnings, non-zero exit codes, or stderr output)
+Output: ABGD_results/<gene_name>/ (ABGD results per gene), failed_abgd_genes.txt (log file listing failures), abgd_warnings.txt (listing genes with warnings, non-zero exit codes, or stderr output) abgd_jobs.csv (exit status, wall time and peak memory of every gene) and abgd_manifest.jsonl (resumable job states)
 Date: 2026-04-12
 """
 
-import os, glob, subprocess
+import os, sys, glob, time, argparse
+
+# Shared CGCD helpers
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../3_species_delimitation_methods"))
+from cgcd.abgd import run_genes
+from cgcd.incremental import file_sha1
+from cgcd.jobs import print_job_summary, run_commands, save_job_records
+from cgcd.manifest import JobManifest, reset_output_dir
 
 abgd_exec = os.path.expanduser("~/Bacterial_species_delimitation/3_species_delimitation_methods/ABGD/abgd")
 input_dir = os.path.expanduser("core_genes_aligned")
 main_output_dir = os.path.expanduser("ABGD_results")
 failed_genes_file = os.path.expanduser("ABGD_results/failed_abgd_genes.txt")
 warnings_file = os.path.join(main_output_dir, "abgd_warnings.txt")
-
-os.makedirs(main_output_dir, exist_ok=True)
+jobs_file = os.path.join(main_output_dir, "abgd_jobs.csv")
+manifest_file = os.path.join(main_output_dir, "abgd_manifest.jsonl")
+abgd_params = "abgd -a -d JC69"  # a gene is rerun when the options change
+# abgd reads "-d JC69" as -d 0 (not a number), i.e. the K80 distance: the in-process engine uses K80 to give the same partitions
+python_abgd_params = "cgcd.abgd -d k80"
 
 def abgd_outputs_exist(outdir, basename):
     # any partition file or the result cvs counts as success
@@ -24,52 +35,110 @@ def abgd_outputs_exist(outdir, basename):
     cvs   = os.path.join(outdir, f"{basename}.res.cvs")
     return (len(parts) > 0) or os.path.isfile(cvs)
 
-with open(failed_genes_file, "w") as failed, open(warnings_file, "w") as warnlog:
-    failed.write("Failed genes:\n")
-    for fname in os.listdir(input_dir):
+def abgd_command(fname):
+    gene_path = os.path.join(input_dir, fname)
+    gene_name = os.path.splitext(fname)[0]
+    gene_output_dir = os.path.join(main_output_dir, gene_name)
+    reset_output_dir(gene_output_dir)  # no leftovers of an interrupted run
+
+    cmd = [abgd_exec, "-a", "-d", "JC69" , "-o", gene_output_dir, gene_path]
+    return gene_name, cmd, None
+
+def check_gene(gene_name, result, failed, warnlog):
+    """Classify a finished ABGD run from its outputs; returns "ok" or "failed"."""
+    gene_output_dir = os.path.join(main_output_dir, gene_name)
+
+    # Save raw logs for debugging
+    with open(os.path.join(gene_output_dir, "abgd.stdout.txt"), "w") as f: f.write(result.stdout or "")
+    with open(os.path.join(gene_output_dir, "abgd.stderr.txt"), "w") as f: f.write(result.stderr or "")
+
+    outputs_ok = abgd_outputs_exist(gene_output_dir, gene_name)
+
+    if outputs_ok:
+        # success, but keep a heads-up if something looked noisy
+        if result.returncode != 0 or ("error" in (result.stderr or "").lower()):
+            warnlog.write(f"[{gene_name}] returncode={result.returncode}\n")
+            if result.stderr:
+                warnlog.write(result.stderr + "\n---\n")
+        # Optional: tag “single-partition” if CVS is empty
+        cvs_path = os.path.join(gene_output_dir, f"{gene_name}.res.cvs")
+        if os.path.isfile(cvs_path):
+            try:
+                # if only header or blank, likely single partition
+                lines = [ln for ln in open(cvs_path) if ln.strip()]
+                if len(lines) <= 1:
+                    print(f"ABGD completed (single partition) for {gene_name}.")
+                else:
+                    print(f"ABGD completed successfully for {gene_name}.")
+            except Exception:
+                print(f"ABGD completed for {gene_name} (could not read CVS).")
+        else:
+            print(f"ABGD completed successfully for {gene_name}.")
+        return "ok"
+
+    print(f"ABGD produced no outputs for {gene_name}. Marking as failed.")
+    failed.write(f"{gene_name}\n")
+    return "failed"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ABGD on every aligned core gene")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of ABGD runs at a time [Default: 1]")
+    parser.add_argument("--engine", choices=["binary", "python"], default="binary",
+                        help="Run the ABGD executable, or the in-process NumPy port (no graphics, "
+                             "no per-gene process) [Default: binary]")
+    args = parser.parse_args()
+    params = abgd_params if args.engine == "binary" else python_abgd_params
+
+    os.makedirs(main_output_dir, exist_ok=True)
+
+    # skip genes already finished with the same alignment and parameters
+    manifest = JobManifest(manifest_file)
+    commands = []
+    skipped = 0
+    for fname in sorted(os.listdir(input_dir)):
         if not fname.endswith(".fasta"):
             continue
-
-        gene_path = os.path.join(input_dir, fname)
         gene_name = os.path.splitext(fname)[0]
-        gene_output_dir = os.path.join(main_output_dir, gene_name)
-        os.makedirs(gene_output_dir, exist_ok=True)
-
-        cmd = [abgd_exec, "-a", "-d", "JC69" , "-o", gene_output_dir, gene_path]
-        print(f"Running ABGD on: {gene_name}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        # Save raw logs for debugging
-        with open(os.path.join(gene_output_dir, "abgd.stdout.txt"), "w") as f: f.write(result.stdout or "")
-        with open(os.path.join(gene_output_dir, "abgd.stderr.txt"), "w") as f: f.write(result.stderr or "")
-
-        outputs_ok = abgd_outputs_exist(gene_output_dir, gene_name)
-
-        if outputs_ok:
-            # success, but keep a heads-up if something looked noisy
-            if result.returncode != 0 or ("error" in (result.stderr or "").lower()):
-                warnlog.write(f"[{gene_name}] returncode={result.returncode}\n")
-                if result.stderr:
-                    warnlog.write(result.stderr + "\n---\n")
-            # Optional: tag “single-partition” if CVS is empty
-            cvs_path = os.path.join(gene_output_dir, f"{gene_name}.res.cvs")
-            if os.path.isfile(cvs_path):
-                try:
-                    # if only header or blank, likely single partition
-                    lines = [ln for ln in open(cvs_path) if ln.strip()]
-                    if len(lines) <= 1:
-                        print(f"ABGD completed (single partition) for {gene_name}.")
-                    else:
-                        print(f"ABGD completed successfully for {gene_name}.")
-                except Exception:
-                    print(f"ABGD completed for {gene_name} (could not read CVS).")
-            else:
-                print(f"ABGD completed successfully for {gene_name}.")
-        else:
-            print(f"ABGD produced no outputs for {gene_name}. Marking as failed.")
-            failed.write(f"{gene_name}\n")
+        input_hash = file_sha1(os.path.join(input_dir, fname))
+        if manifest.is_done(gene_name, input_hash, params):
+            skipped += 1
+            continue
+        commands.append(abgd_command(fname))
+        manifest.start(gene_name, input_hash, params)
+    print(f"Running ABGD ({args.engine}) on {len(commands)} genes, {args.jobs} at a time ({skipped} genes already done)")
+
+    if args.engine == "python":
+        # same genes and output folders, partitioned in worker processes instead of ABGD executables
+        results = run_genes(
+            [(gene_name, os.path.join(input_dir, f"{gene_name}.fasta"), os.path.join(main_output_dir, gene_name))
+             for gene_name, _, _ in commands],
+            distance="k80",
+            jobs=args.jobs
+        )
+    else:
+        results = run_commands(commands, jobs=args.jobs)
+
+    records = []
+    start = time.time()
+    with open(failed_genes_file, "w") as failed, open(warnings_file, "w") as warnlog:
+        failed.write("Failed genes:\n")
+        # results arrive as the ABGD runs finish
+        for gene_name, result, wall_time, peak_mb in results:
+            status = check_gene(gene_name, result, failed, warnlog)
+            records.append((gene_name, status, result.returncode, round(wall_time, 3), round(peak_mb, 1)))
+            manifest.finish(gene_name, status == "ok", wall_time, peak_mb, f"returncode={result.returncode}")
+
+    # per-gene exit status and wall time, then a summary of the run
+    table = save_job_records(records, jobs_file)
+    print_job_summary(table, time.time() - start)
+
+    print("All genes processed with ABGD.")
+    print("Failed genes are logged in:", failed_genes_file)
+    print("Any warnings (non-zero exit or stderr noise) are in:", warnings_file)
+    print("Exit status, wall time and peak memory of every gene are in:", jobs_file)
+    print("Job states (used to resume interrupted runs) are in:", manifest_file)
+    print("\nNote: Check failed and warning logs for genes affected by ABGD issues (often memory-related).")
 
-print("All genes processed with ABGD.")
-print("Failed genes are logged in:", failed_genes_file)
-print("Any warnings (non-zero exit or stderr noise) are in:", warnings_file)
-print("\nNote: Check failed and warning logs for genes affected by ABGD issues (often memory-related).")
+if __name__ == "__main__":
+    main()
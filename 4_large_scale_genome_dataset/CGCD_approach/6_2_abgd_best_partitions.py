@@ -2,24 +2,37 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Extract the best ABGD partition for each gene and convert it into a pairwise partition matrix (1 = same group, 0 = different group).
+Description: Extract the best ABGD partition for each gene and store it as a label vector (one label per strain, strains with the same label are in the same group); the pairwise partition matrix of a gene is derived on demand.
 Input: ABGD_results/ (one folder per gene containing *.res.cvs and *.part.*.txt files)
-Output: ABGD_partition_matrices/ (<gene>.csv partition matrices)
+Output: ABGD_partitions.npz (label vectors of all genes over one strain index, haplotypes expanded to strains when core_genes_aligned/haplotype_map.csv exists)
 Date: 2026-04-13
 """
 
 import os
+import sys
 import pandas as pd
 from collections import defaultdict
 
-# Define directories for ABGD results and where the partition matrices will be saved
+# Shared CGCD helpers
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../3_species_delimitation_methods"))
+from cgcd.haplotypes import (HAPLOTYPE_MAP_NAME, expand_groups, gene_members, load_haplotype_map,
+                             single_haplotype_partitions)
+from cgcd.partitions import write_partitions
+
+# Directory of the ABGD results and file where the partitions will be saved
 abgd_dir = os.path.expanduser("ABGD_results")
-output_dir = os.path.expanduser("ABGD_partition_matrices")
+partitions_path = os.path.expanduser("ABGD_partitions.npz")
+
+# Haplotype -> strain map (only present when the alignments were deduplicated)
+haplotype_map_path = os.path.join(os.path.expanduser("core_genes_aligned"), HAPLOTYPE_MAP_NAME)
+
+haplotype_map = load_haplotype_map(haplotype_map_path)
 
-# Make sure output directory exists
-os.makedirs(output_dir, exist_ok=True)
+print("===== Extracting ABGD partitions =====")
 
-print("===== Generating ABGD partition matrices =====")
+# {gene: {strain: group}} of the best partition of every gene
+assignments = {}
 
 # Loop through each gene folder in the ABGD results directory
 for gene_folder in os.listdir(abgd_dir):
@@ -51,9 +64,12 @@ for gene_folder in os.listdir(abgd_dir):
         continue
         
     
+    # Last partition with the most frequent value. The part.# files are numbered by prior (from 1), not by row:
+    # the row of a first prior that already gives a single group is written twice
     top_recursive = freq_counts.index[0]
+    res_df["step"] = pd.factorize(res_df["prior"])[0] + 1
     matches = res_df[res_df["nbSubsetRecursive"] == top_recursive]
-    partition_index = matches.index[-1] + 1
+    partition_index = matches["step"].iloc[-1]
 
     part_file = os.path.join(gene_path, f"{gene_folder}.part.{partition_index}.txt")
 
@@ -79,18 +95,17 @@ for gene_folder in os.listdir(abgd_dir):
                     group_id = line.split("Group[")[1].split("]")[0].strip()
                     groups[group_id].extend(strains)
 
-    # Get all strains
-    all_strains = sorted({strain for group in groups.values() for strain in group})
+    # Expand haplotypes back to the strains carrying them
+    groups = expand_groups(groups, gene_members(haplotype_map, gene_folder))
 
-    # Build partition matrix
-    matrix = pd.DataFrame(0, index=all_strains, columns=all_strains, dtype=int)
-    for group in groups.values():
-        for i in group:
-            for j in group:
-                matrix.loc[i, j] = 1
+    # Group of every strain, strains in sorted order
+    group_of = {strain: group_id for group_id, group in groups.items() for strain in group}
+    assignments[gene_folder] = {strain: group_of[strain] for strain in sorted(group_of)}
+    print(f" Extracted partition for {gene_folder}")
 
-    # Save the matrix
-    matrix.to_csv(os.path.join(output_dir, f"{gene_folder}.csv"))
-    print(f" Saved matrix for {gene_folder}")
+# Genes whose strains all share one sequence were not delimited: one group
+assignments.update(single_haplotype_partitions(haplotype_map))
 
-print(" All ABGD partition matrices generated.")
+# Save the label vectors of all genes in one file
+write_partitions(partitions_path, assignments)
+print(f" ABGD partitions of {len(assignments)} genes saved to: {partitions_path}")
@@ -2,25 +2,48 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Run ASAP on each aligned core-gene (one gene at a time)
+Description: Run ASAP on each aligned core-gene (several genes at a time, within a RAM budget)
 Input: core_genes_aligned/
-Output: ASAP_results/<gene_name>/ (ASAP results per gene), failed_genes.txt (log file listing failures) and asap_warnings.txt (listing genes with warnings, non-zero exit codes, or stderr output)
+Output: ASAP_results/<gene_name>/ (ASAP results per gene), failed_genes.txt (log file listing failures), asap_warnings.txt (listing genes with warnings, non-zero exit codes, or stderr output) asap_jobs.csv (exit status, wall time, estimated and peak memory of every gene) and asap_manifest.jsonl (resumable job states)
 Note: Failed and warning logs should be checked to identify genes affected by ASAP execution or output-generation issues, which are often related to memory issues.
+The memory of every gene is estimated from its number of sequences and alignment length; genes only start while the
+estimates fit --ram-budget-gb, and genes that outgrow the budget are stopped and rerun alone. Genes already finished
+with the same alignment and parameters (asap_manifest.jsonl) are skipped.
+With --batch-size N, genes are run N at a time by a single asap_batch process (no graphics, one <gene>.asap.tsv
+result per gene, build it with `make asap_batch` in 3_species_delimitation_methods/ASAP); genes left without a
+result by a crashing batch are rerun alone with asap.
+Every gene gets a timeout derived from its predicted runtime (number of sequences and alignment length, model refitted
+on the genes already finished, see cgcd/timeouts.py); a job that times out is retried once with a longer timeout.
 Date: 2026-04-18
 """
 
 import os
+import sys
 import glob
-import subprocess
+import time
+import argparse
+
+# Shared CGCD helpers
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../3_species_delimitation_methods"))
+from cgcd.asap import ASAP_RESULT_SUFFIX, read_asap_result, read_spart, write_batch_list
+from cgcd.incremental import file_sha1
+from cgcd.jobs import print_job_summary, save_job_records
+from cgcd.manifest import JobManifest, reset_output_dir
+from cgcd.scheduler import MemoryAwareScheduler, alignment_shape, estimate_asap_mb, total_memory_mb
+from cgcd.timeouts import DEFAULT_MIN_TIMEOUT, RuntimeModel, TimeoutPolicy
 
 # Paths
 asap_exec   = os.path.expanduser("~/Bacterial_species_delimitation/3_species_delimitation_methods/ASAP/asap")
+asap_batch_exec = os.path.expanduser("~/Bacterial_species_delimitation/3_species_delimitation_methods/ASAP/asap_batch")
 input_dir   = os.path.expanduser("~/Bacterial_species_delimitation/4_large_scale_genome_dataset/CGCD_approach/core_genes_aligned")
 output_dir  = os.path.expanduser("~/Bacterial_species_delimitation/4_large_scale_genome_dataset/CGCD_approach/ASAP_results2")
 failed_log  = os.path.join(output_dir, "failed_asap_genes.txt")
 warnings_log = os.path.join(output_dir, "asap_warnings.txt")
-
-os.makedirs(output_dir, exist_ok=True)
+jobs_log    = os.path.join(output_dir, "asap_jobs.csv")
+manifest_log = os.path.join(output_dir, "asap_manifest.jsonl")
+asap_params = "asap -a"  # a gene is rerun when the options change
+asap_batch_params = "asap_batch"
 
 def find_spart(out_dir, gene_base):
     """
@@ -37,91 +60,211 @@ def find_spart(out_dir, gene_base):
             return p
     return None
 
-def spart_has_partitions(spart_path):
-    """Quick check: does the .spart file contain any partition lines?"""
+def spart_partitions(spart_path):
+    """Number of partitions of a .spart file (0 when it cannot be read)."""
     try:
-        with open(spart_path, "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                # ASAP .spart has blocks like: "Partition X;" followed by assignments
-                if line.strip().lower().startswith("partition"):
-                    return True
-        # Fallback: non-empty file counts as something
-        return os.path.getsize(spart_path) > 0
-    except Exception:
-        return False
-
-# Initialize logs
-with open(failed_log, "w") as flog:
-    flog.write("Failed Genes:\n")
-with open(warnings_log, "w") as wlog:
-    wlog.write("Warnings (non-zero return code or stderr present):\n\n")
-
-# Loop through aligned files
-for fname in os.listdir(input_dir):
-    if not fname.endswith(".fasta"):
-        continue
-
-    gene_base = os.path.splitext(fname)[0]          
-    in_path   = os.path.join(input_dir, fname)
-    out_dir   = os.path.join(output_dir, gene_base)
-    os.makedirs(out_dir, exist_ok=True)
-
-    # Skip if already processed (a .spart exists)
-    existing_spart = find_spart(out_dir, gene_base)
-    if existing_spart:
-        print(f"Skipping {gene_base} (already processed: {os.path.basename(existing_spart)})")
-        continue
-
-    print(f"\nRunning ASAP for {gene_base}...")
-    try:
-        result = subprocess.run(
-            [asap_exec, "-a", "-o", out_dir, in_path],
-            capture_output=True,
-            text=True,
-            cwd=out_dir
-            # , timeout=90
-        )
+        _, partitions = read_spart(spart_path)
+    except (OSError, ValueError):
+        return 0
+    return len(partitions)
+
+def check_gene(gene_base, returncode, attempts):
+    """Decide success from the ASAP outputs of one gene; returns "ok" or "failed"."""
+    out_dir = os.path.join(output_dir, gene_base)
+    with open(os.path.join(out_dir, "asap.stderr.txt")) as f:
+        stderr = f.read()
+
+    # Decide success based on outputs
+    spart_path = find_spart(out_dir, gene_base)
+    n_parts = spart_partitions(spart_path) if spart_path else 0
+    success = n_parts > 0
+
+    if success:
+        # It succeeded; still record warnings if something looked off
+        if returncode != 0 or stderr.strip():
+            with open(warnings_log, "a") as wlog:
+                wlog.write(f"[{gene_base}] returncode={returncode}\n")
+                if stderr:
+                    wlog.write(stderr + "\n---\n")
+        if n_parts == 1:
+            print(f"ASAP completed (single partition) for {gene_base}.")
+        else:
+            print(f"ASAP completed for {gene_base} ({n_parts} partitions).")
+        return "ok"
 
+    print(f"ASAP produced no usable .spart for {gene_base}. Marking as failed.")
+    with open(failed_log, "a") as flog:
+        # genes that also failed when rerun alone are flagged, they most likely ran out of memory
+        flog.write(f"{gene_base}\n" if attempts == 1 else f"{gene_base} (failed alone after {attempts} attempts)\n")
+    return "failed"
+
+def check_batch_gene(gene_base, result_path):
+    """Decide success from the asap_batch result of one gene; returns "ok", or None when it has no result."""
+    if not os.path.isfile(result_path):
+        return None
+    _, partitions = read_asap_result(result_path)
+    if not partitions:
+        return None
+    if len(partitions) == 1:
+        print(f"ASAP completed (single partition) for {gene_base}.")
+    else:
+        print(f"ASAP completed for {gene_base} ({len(partitions)} partitions).")
+    return "ok"
+
+def single_job(gene_base, in_path, out_dir, estimate_mb, shape):
+    """One standalone asap run of a gene."""
+    return {
+        "name": gene_base,
+        "cmd": [asap_exec, "-a", "-o", out_dir, in_path],
+        "cwd": out_dir,
+        "estimate_mb": estimate_mb,
+        "shapes": [shape],
         # Save raw logs for debugging
-        with open(os.path.join(out_dir, "asap.stdout.txt"), "w") as f: f.write(result.stdout or "")
-        with open(os.path.join(out_dir, "asap.stderr.txt"), "w") as f: f.write(result.stderr or "")
-
-        # Decide success based on outputs
-        spart_path = find_spart(out_dir, gene_base)
-        success = bool(spart_path and spart_has_partitions(spart_path))
-
-        if success:
-            # It succeeded; still record warnings if something looked off
-            if result.returncode != 0 or (result.stderr and result.stderr.strip()):
-                with open(warnings_log, "a") as wlog:
-                    wlog.write(f"[{gene_base}] returncode={result.returncode}\n")
-                    if result.stderr:
-                        wlog.write(result.stderr + "\n---\n")
-            # Optional: detect “single partition” by counting blocks
-            n_parts = 0
-            if spart_path:
-                with open(spart_path, "r", encoding="utf-8", errors="ignore") as f:
-                    n_parts = sum(1 for ln in f if ln.strip().lower().startswith("partition"))
-            if n_parts <= 1:
-                print(f"ASAP completed (single partition) for {gene_base}.")
-            else:
-                print(f"ASAP completed for {gene_base} ({n_parts} partitions).")
+        "stdout": os.path.join(out_dir, "asap.stdout.txt"),
+        "stderr": os.path.join(out_dir, "asap.stderr.txt"),
+    }
+
+def batch_jobs(genes, batch_size):
+    """
+    Group genes (dicts with name, in_path, out_dir, estimate_mb, shape) into asap_batch jobs of batch_size genes.
+    Genes of similar size are batched together; a batch runs its genes one after the other, so its memory
+    estimate is that of its largest gene (and its timeout the sum of theirs).
+    """
+    batch_dir = os.path.join(output_dir, "batches")
+    os.makedirs(batch_dir, exist_ok=True)
+    genes = sorted(genes, key=lambda gene: gene["estimate_mb"], reverse=True)
+    jobs = []
+    for start in range(0, len(genes), batch_size):
+        members = genes[start:start + batch_size]
+        name = f"batch_{start // batch_size + 1}"
+        list_path = os.path.join(batch_dir, f"{name}.txt")
+        write_batch_list([(gene["in_path"], gene["result"]) for gene in members], list_path)
+        jobs.append({
+            "name": name,
+            "cmd": [asap_batch_exec, list_path],
+            "cwd": batch_dir,
+            "estimate_mb": members[0]["estimate_mb"],
+            "shapes": [gene["shape"] for gene in members],
+            "stdout": os.path.join(batch_dir, f"{name}.stdout.txt"),
+            "stderr": os.path.join(batch_dir, f"{name}.stderr.txt"),
+            "genes": members,
+        })
+    return jobs
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ASAP on every aligned core gene within a RAM budget")
+    parser.add_argument("--ram-budget-gb", type=float, default=0.8 * total_memory_mb() / 1024,
+                        help="Memory the concurrent ASAP runs may use together [Default: 80%% of the physical memory]")
+    parser.add_argument("--max-jobs", type=int, default=os.cpu_count(),
+                        help="Maximum number of ASAP runs at a time [Default: number of cores]")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="Genes per asap_batch process, 0 runs one asap process per gene [Default: 0]")
+    parser.add_argument("--min-timeout", type=float, default=DEFAULT_MIN_TIMEOUT,
+                        help=f"Shortest timeout of a gene, in seconds [Default: {DEFAULT_MIN_TIMEOUT}]")
+    parser.add_argument("--max-timeout", type=float, default=None,
+                        help="Longest first-attempt timeout of a gene, in seconds [Default: no limit]")
+    args = parser.parse_args()
+
+    if args.batch_size > 0 and not os.path.isfile(asap_batch_exec):
+        sys.exit(f"{asap_batch_exec} not found: run `make asap_batch` in its directory, or drop --batch-size")
+    params = asap_batch_params if args.batch_size > 0 else asap_params
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Initialize logs
+    with open(failed_log, "w") as flog:
+        flog.write("Failed Genes:\n")
+    with open(warnings_log, "w") as wlog:
+        wlog.write("Warnings (non-zero return code or stderr present):\n\n")
+
+    # Job states of earlier (possibly interrupted) runs
+    manifest = JobManifest(manifest_log)
+
+    # One job per aligned file, with its predicted peak memory
+    jobs = []
+    genes = []
+    shapes = {}
+    for fname in sorted(os.listdir(input_dir)):
+        if not fname.endswith(".fasta"):
+            continue
+
+        gene_base = os.path.splitext(fname)[0]          
+        in_path   = os.path.join(input_dir, fname)
+        out_dir   = os.path.join(output_dir, gene_base)
+        shapes[gene_base] = alignment_shape(in_path)
+
+        # Skip if already processed successfully with the same alignment and parameters
+        # (a .spart alone may be the partial output of an interrupted run)
+        input_hash = file_sha1(in_path)
+        if manifest.is_done(gene_base, input_hash, params):
+            print(f"Skipping {gene_base} (already processed)")
+            continue
+        reset_output_dir(out_dir)
+        manifest.start(gene_base, input_hash, params)
+
+        estimate_mb = estimate_asap_mb(*shapes[gene_base])
+        if args.batch_size > 0:
+            genes.append({"name": gene_base, "in_path": in_path, "out_dir": out_dir, "estimate_mb": estimate_mb,
+                          "shape": shapes[gene_base],
+                          "result": os.path.join(out_dir, f"{gene_base}{ASAP_RESULT_SUFFIX}")})
         else:
-            print(f"ASAP produced no usable .spart for {gene_base}. Marking as failed.")
+            jobs.append(single_job(gene_base, in_path, out_dir, estimate_mb, shapes[gene_base]))
+
+    estimates = {job["name"]: job["estimate_mb"] for job in jobs}
+    estimates.update({gene["name"]: gene["estimate_mb"] for gene in genes})
+    # Timeouts predicted by a runtime model fitted on the genes finished by standalone asap runs
+    policy = TimeoutPolicy(RuntimeModel.from_manifest(manifest, shapes, asap_params),
+                           min_timeout=args.min_timeout, max_timeout=args.max_timeout)
+    scheduler = MemoryAwareScheduler(args.ram_budget_gb * 1024, max_jobs=args.max_jobs, timeouts=policy)
+
+    records = []
+    start = time.time()
+    if genes:
+        batches = batch_jobs(genes, args.batch_size)
+        print(f"\nRunning ASAP for {len(genes)} genes in {len(batches)} asap_batch processes: "
+              f"at most {args.max_jobs} at a time within {args.ram_budget_gb:.1f} GB")
+        members = {job["name"]: job["genes"] for job in batches}
+        for batch, returncode, wall_time, peak_mb, attempts in scheduler.run(batches):
+            for gene in members[batch]:
+                # Each gene is credited with an equal share of its batch's wall time
+                if check_batch_gene(gene["name"], gene["result"]) == "ok":
+                    gene_time = wall_time / len(members[batch])
+                    manifest.finish(gene["name"], True, gene_time, peak_mb, f"{batch} returncode={returncode}")
+                    records.append((gene["name"], "ok", returncode, round(gene_time, 3),
+                                    round(peak_mb, 1), round(gene["estimate_mb"], 1), attempts))
+                else:
+                    # A crash loses this gene and the ones after it in the batch: rerun them alone with asap
+                    print(f"No asap_batch result for {gene['name']} ({batch} returncode={returncode}): rerunning it with asap")
+                    reset_output_dir(gene["out_dir"])
+                    manifest.start(gene["name"], manifest.records[gene["name"]]["input_hash"], asap_params)
+                    jobs.append(single_job(gene["name"], gene["in_path"], gene["out_dir"], gene["estimate_mb"],
+                                           gene["shape"]))
+
+    if jobs:
+        print(f"\nRunning ASAP for {len(jobs)} genes: at most {args.max_jobs} at a time within {args.ram_budget_gb:.1f} GB")
+    for gene_base, returncode, wall_time, peak_mb, attempts in scheduler.run(jobs):
+        if gene_base in scheduler.timed_out:
+            print(f"ASAP timed out twice for {gene_base}. Marking as failed.")
             with open(failed_log, "a") as flog:
-                flog.write(f"{gene_base}\n")
-
-    except subprocess.TimeoutExpired:
-        print(f"Timeout: ASAP took too long on {gene_base}. Skipping.")
-        with open(failed_log, "a") as flog:
-            flog.write(f"{gene_base} (timeout)\n")
-
-    except Exception as e:
-        print(f"Exception for {gene_base}: {e}")
-        with open(failed_log, "a") as flog:
-            flog.write(f"{gene_base} (exception)\n")
-
-print("\nAll genes processed.")
-print("Failed genes listed in:", failed_log)
-print("Warnings (non-zero exit / stderr) in:", warnings_log)
-print("\nNote: Check failed and warning logs for genes affected by ASAP issues (often memory-related).")
+                flog.write(f"{gene_base} (timeout)\n")
+            status = "timeout"
+        else:
+            status = check_gene(gene_base, returncode, attempts)
+        manifest.finish(gene_base, status == "ok", wall_time, peak_mb, f"returncode={returncode}, attempts={attempts}")
+        records.append((gene_base, status, returncode, round(wall_time, 3),
+                        round(peak_mb, 1), round(estimates[gene_base], 1), attempts))
+
+    # Exit status, wall time and memory of every gene
+    table = save_job_records(records, jobs_log, columns=["Gene", "Status", "Exit_code", "Wall_time_s",
+                                                         "Peak_RSS_MB", "Estimate_MB", "Attempts"])
+    print_job_summary(table, time.time() - start)
+
+    print("\nAll genes processed.")
+    print("Failed genes listed in:", failed_log)
+    print("Warnings (non-zero exit / stderr) in:", warnings_log)
+    print("Exit status, wall time and peak memory per gene in:", jobs_log)
+    print("Job states (used to resume interrupted runs) in:", manifest_log)
+    print("\nNote: Check failed and warning logs for genes affected by ASAP issues (often memory-related).")
+
+if __name__ == "__main__":
+    main()
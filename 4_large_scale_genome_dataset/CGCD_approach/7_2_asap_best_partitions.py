@@ -2,107 +2,90 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Extract the best ASAP partition for each gene and convert it into a pairwise partition matrix (1 = same group, 0 = different group).
-Input: ASAP_results/ (<gene>.csv files), strains.txt
-Output: ASAP_partition_matrices/ (<gene>.csv partition matrices)
+Description: Extract the best ASAP partition for each gene and store it as a label vector (one label per strain, strains with the same label are in the same group); the pairwise partition matrix of a gene is derived on demand.
+All ranked partitions of a gene are read at once from its .spart file (ranks from its .res.cvs), so --rank 2 or 3 selects the 2nd or 3rd best partition instead.
+Input: ASAP_results/ (<gene>.fasta.spart and .res.cvs files, or <gene>.asap.tsv results of asap_batch), core_genes_aligned/ (original sequence names), strains.txt
+Output: ASAP_partitions.npz (label vectors of all genes over one strain index, haplotypes expanded to strains when core_genes_aligned/haplotype_map.csv exists)
 Date: 2026-04-18
 """
 
 #!/usr/bin/env python3
 import os
-import csv
+import sys
+import argparse
+
+# Shared CGCD helpers
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../3_species_delimitation_methods"))
+from cgcd.asap import (ASAP_RESULT_SUFFIX, RES_CVS_SUFFIX, SPART_SUFFIX, fasta_names, partition_assignment,
+                       read_asap_result, read_spart, restore_names)
+from cgcd.haplotypes import (HAPLOTYPE_MAP_NAME, expand_assignment, gene_members, load_haplotype_map,
+                             single_haplotype_partitions)
+from cgcd.partitions import write_partitions
 
 # Base directory for ASAP results
 ASAP_DIR = os.path.expanduser("ASAP_results")
-OUT_DIR  = os.path.expanduser("ASAP_partition_matrices")
-os.makedirs(OUT_DIR, exist_ok=True)
-
-def read_selected_partition_number(res_cvs_path: str) -> str | None:
-    """Return the selected partition number from *.res.cvs (always it's the first partition)."""
-    try:
-        with open(res_cvs_path, "r") as f:
-            lines = [ln.strip() for ln in f.readlines()]
-        if len(lines) < 2:
-            return None
-        return lines[1].split()[0]
-    except Exception:
-        return None
+PARTITIONS = os.path.expanduser("ASAP_partitions.npz")
+ALIGN_DIR = os.path.expanduser("core_genes_aligned")
+# Haplotype -> strain map (only present when the alignments were deduplicated)
+HAPLOTYPE_MAP = os.path.join(ALIGN_DIR, HAPLOTYPE_MAP_NAME)
 
-def load_partition_map(partition_csv_path: str) -> dict[str, str]:
+def load_gene_partitions(gene: str, gene_dir: str):
     """
-    Load strain -> group mapping from the ASAP partition CSV (two columns: strain, group).
-    Returns a dict {strain: group}.
+    (names, ranked partitions) of a gene, from its asap_batch result or from the .spart of a standard asap run;
+    None when the gene has neither. .spart sample names are mapped back to the names of the alignment.
     """
-    m = {}
-    with open(partition_csv_path, "r") as f:
-        rdr = csv.reader(f)
-        for row in rdr:
-            if len(row) < 2:
-                continue
-            strain = row[0].strip()
-            group  = row[1].strip()
-            if strain:
-                m[strain] = group
-    return m
-
-def build_matrix(strains: list[str], group_map: dict[str, str]) -> list[list[int]]:
-    """
-    Create a symmetric 0/1 matrix over the provided strain list.
-    """
-    # Assign a "missing" group label for absent strains so diagonal stays 1.
-    MISS = "__MISSING__"
-    lbl = [group_map.get(s, MISS) for s in strains]
-    n = len(strains)
-    M = [[0]*n for _ in range(n)]
-    for i in range(n):
-        for j in range(n):
-            M[i][j] = int(lbl[i] == lbl[j])
-    return M
-
-def save_matrix(strains: list[str], mat: list[list[int]], out_csv: str):
-    """Write header + square matrix with row/col labels."""
-    with open(out_csv, "w", newline="") as f:
-        w = csv.writer(f)
-        w.writerow([""] + strains)
-        for s, row in zip(strains, mat):
-            w.writerow([s] + row)
+    batch_result = os.path.join(gene_dir, f"{gene}{ASAP_RESULT_SUFFIX}")
+    if os.path.exists(batch_result):
+        return read_asap_result(batch_result)
+    prefix = os.path.join(gene_dir, f"{gene}.fasta")
+    if not os.path.exists(prefix + SPART_SUFFIX):
+        return None
+    names, partitions = read_spart(prefix + SPART_SUFFIX, prefix + RES_CVS_SUFFIX)
+    alignment = os.path.join(ALIGN_DIR, f"{gene}.fasta")
+    if os.path.exists(alignment):
+        names = restore_names(names, fasta_names(alignment))
+    return names, partitions
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract the selected ASAP partition of every gene")
+    parser.add_argument("--rank", type=int, default=1,
+                        help="Rank of the ASAP partition to use, 1 being the best [Default: 1]")
+    args = parser.parse_args()
+
     # each subfolder of ASAP_DIR is a gene folder
     genes = [d for d in os.listdir(ASAP_DIR) if os.path.isdir(os.path.join(ASAP_DIR, d))]
-    if not genes:
+    haplotype_map = load_haplotype_map(HAPLOTYPE_MAP)
+    if not genes and not single_haplotype_partitions(haplotype_map):
         print("No gene directories found in:", ASAP_DIR)
         return
 
+    assignments = {}
+
     for gene in sorted(genes):
         gene_dir = os.path.join(ASAP_DIR, gene)
-        res_cvs  = os.path.join(gene_dir, f"{gene}.fasta.res.cvs")
-        if not os.path.exists(res_cvs):
-            print(f"[{gene}] Missing {gene}.fasta.res.cvs — skipping.")
+        result = load_gene_partitions(gene, gene_dir)
+        if result is None:
+            print(f"[{gene}] Missing {gene}.fasta.spart — skipping.")
             continue
 
-        part_num = read_selected_partition_number(res_cvs)
-        if not part_num:
-            print(f"[{gene}] Could not read selected partition number — skipping.")
+        group_map = partition_assignment(*result, args.rank)
+        if not group_map:
+            print(f"[{gene}] No partition of rank {args.rank} — skipping.")
             continue
 
-        part_csv = os.path.join(gene_dir, f"{gene}.fasta.Partition_{part_num}.csv")
-        if not os.path.exists(part_csv):
-            print(f"[{gene}] Partition file not found: {os.path.basename(part_csv)} — skipping.")
-            continue
+        # expand haplotypes back to the strains carrying them
+        group_map = expand_assignment(group_map, gene_members(haplotype_map, gene))
 
-        group_map = load_partition_map(part_csv)
-        if not group_map:
-            print(f"[{gene}] Partition file empty or invalid — skipping.")
-            continue
+        assignments[gene] = {strain: group_map[strain] for strain in sorted(group_map)}
+        print(f"[{gene}] Partition extracted ({len(set(group_map.values()))} groups)")
 
-        strains = sorted(group_map.keys())  # use only strains present in this partition file
-        mat = build_matrix(strains, group_map)
-        out_csv = os.path.join(OUT_DIR, f"{gene}.csv")
-        save_matrix(strains, mat, out_csv)
-        print(f"[{gene}] Matrix saved {out_csv}")
+    # genes whose strains all share one sequence were not delimited: one group
+    assignments.update(single_haplotype_partitions(haplotype_map))
 
-    print("\nAll ASAP partition matrices generated. Output:", OUT_DIR)
+    # label vectors of all genes in one file
+    write_partitions(PARTITIONS, assignments)
+    print(f"\nASAP partitions of {len(assignments)} genes saved to:", PARTITIONS)
 
 if __name__ == "__main__":
     main()
@@ -2,61 +2,59 @@
 
 """
 Author: Khaoula El Mchachti
-Description: Generate the conspecificity matrix by summing ASAP per-gene partition matrices.
-Input: ASAP_partition_matrices/ 
-Output: ASAP_conspecificity_matrix.csv (pairwise counts of how many genes place two strains in the same group)
+Description: Generate the conspecificity matrix by summing the ASAP per-gene partition matrices, derived from the label vectors.
+Input: ASAP_partitions.npz
+Output: ASAP_conspecificity_matrix.npy + .strains.txt (packed store read by the next steps) and ASAP_conspecificity_matrix.csv (pairwise counts of how many genes place two strains in the same group, normalized on the genes shared by the pair),
+ASAP_shared_genes_matrix.csv (number of genes in which both strains are present),
+ASAP_conspecificity_counts.npz (pair counts and the partition counted for every gene, updated incrementally on the next run)
 Date: 2026-04-18
 """
 
 import os
+import sys
 import pandas as pd
 
+# Shared CGCD helpers
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../3_species_delimitation_methods"))
+from cgcd.conspecificity import (ConspecificityCounts, export_csv, normalize_by_shared_genes, read_conspecificity,
+                                  write_conspecificity)
+from cgcd.partitions import read_partitions
+
 # Define directories
-partition_dir = os.path.expanduser("ASAP_partition_matrices")  
+partitions_path = os.path.expanduser("ASAP_partitions.npz")
 output_dir = os.path.expanduser("ASAP_conspecificity_matrix")
 os.makedirs(output_dir, exist_ok=True)
+store_path = os.path.join(output_dir, "ASAP_conspecificity_matrix.npy")
 output_path = os.path.join(output_dir, "ASAP_conspecificity_matrix.csv")
+shared_path = os.path.join(output_dir, "ASAP_shared_genes_matrix.csv")
+counts_path = os.path.join(output_dir, "ASAP_conspecificity_counts.npz")
 
-# Get all CSV files in the partition directory
-files = [f for f in os.listdir(partition_dir) if f.endswith(".csv")]
+# Label vectors of the best partition of every gene
+if not os.path.isfile(partitions_path):
+    print(" No partitions found.")
+    exit()
+genes, strains, labels = read_partitions(partitions_path)
 
-if not files:
-    print(" No partition matrices found.")
+if not genes:
+    print(" No partitions found.")
     exit()
 
-# Load the first matrix to initialize structure
-first_path = os.path.join(partition_dir, files[0])
-first_matrix = pd.read_csv(first_path, index_col=0)
-strains = list(first_matrix.index)
-matrix = pd.DataFrame(0, index=strains, columns=strains, dtype=int)
-
-# Loop through all partition matrices
-for f in files:
-    path = os.path.join(partition_dir, f)
-    try:
-        df = pd.read_csv(path, index_col=0)
-
-        # Check for missing rows/columns
-        missing_rows = set(strains) - set(df.index)
-        missing_cols = set(strains) - set(df.columns)
-
-        if missing_rows or missing_cols:
-            print(f" Skipping {f}:")
-            if missing_rows:
-                print(f" Missing strains in rows: {sorted(missing_rows)}")
-            if missing_cols:
-                print(f" Missing strains in columns: {sorted(missing_cols)}")
-            continue
-
-        # Reorder rows and columns to match reference
-        df = df.loc[strains, strains]
-
-        # Accumulate values
-        matrix += df
-
-    except Exception as e:
-        print(f" Error processing {f}: {e}")
-
-# Save final conspecificity matrix
-matrix.to_csv(output_path)
-print(f"\n ASAP conspecificity matrix saved to:\n{output_path}")
+# Count, for every pair, the genes placing both strains in the same group and the genes in which both are present
+# (strains absent from a gene, e.g. soft-core genes, count as 0 for this gene).
+# The counts of the previous run are updated with the genes added, rerun or removed since
+counts = ConspecificityCounts.load(counts_path)
+added, replaced, removed = counts.update(genes, strains, labels)
+counts.save(counts_path)
+print(f" Genes added: {len(added)}, updated: {len(replaced)}, removed: {len(removed)}")
+matrix, shared_genes = counts.matrices(strains)
+
+# Normalize each pair on the number of genes it shares (unchanged for strict core genes)
+matrix = normalize_by_shared_genes(matrix, shared_genes, len(genes))
+
+# Save final matrix (packed store and its CSV export) and the number of genes per pair
+write_conspecificity(store_path, matrix, strains)
+export_csv(read_conspecificity(store_path), output_path)
+pd.DataFrame(shared_genes, index=strains, columns=strains).to_csv(shared_path)
+print(f"\n ASAP conspecificity matrix saved to:\n{store_path}\n{output_path}")
+print(f" Genes shared by each strain pair saved to:\n{shared_path}")
@@ -2,7 +2,7 @@
 """
 Author: Khaoula El Mchachti
 Description: Extract strain groups for each threshold within a detected plateau of the conspecificity threshold scan, for both all strains and the VUB strains.
-Input: ASAP_conspecificity_matrix.csv
+Input: ASAP_conspecificity_matrix.npy
 Output: ASAP_groups_extraction
 Date: 2026-04-18
 """
@@ -10,15 +10,21 @@ Date: 2026-04-18
 import pandas as pd
 import networkx as nx
 import os
+import sys
+
+# Shared CGCD helpers
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../3_species_delimitation_methods"))
+from cgcd.conspecificity import read_conspecificity
 
 
 # Input files
-matrix_csv = "ASAP_conspecificity_matrix/ASAP_conspecificity_matrix.csv"   
-vub_csv    = "VUBstrains.csv"        
+matrix_store = "ASAP_conspecificity_matrix/ASAP_conspecificity_matrix.npy"   
+vub_csv      = "VUBstrains.csv"        
 
 
 # Load data
-df = pd.read_csv(matrix_csv, index_col=0)
+df = read_conspecificity(matrix_store).to_frame()
 strains = df.index.tolist()
 
 vub_df = pd.read_csv(vub_csv)